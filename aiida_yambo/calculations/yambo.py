@@ -14,13 +14,17 @@ from aiida.common.exceptions import UniquenessError, InputValidationError, Valid
 
 from aiida.orm import Code
 from aiida.orm import Dict
-from aiida.orm import RemoteData, BandsData, ArrayData
+from aiida.orm import RemoteData, BandsData, ArrayData, load_node
 
 from aiida.plugins import DataFactory, CalculationFactory
 
 from aiida_yambo.utils.common_helpers import * 
+from aiida_yambo.utils.save_store import save_store_key, save_store_script
+from aiida_yambo.utils.retrieval_policy import RETRIEVAL_POLICIES, retrieval_lists
+from aiida_yambo.utils.dbs_dependencies import copy_dbs_script
 
-from yambopy.io.inputfile import YamboIn
+from aiida_yambo.utils.lazy import lazy_import
+YamboIn = lazy_import('yambopy.io.inputfile', 'YamboIn')
 
 PwCalculation = CalculationFactory('quantumespresso.pw')
 SingleFileData = DataFactory('core.singlefile')
@@ -138,8 +142,24 @@ class YamboCalculation(CalcJob):
                 required=False, help='returns some system information after a p2y')
         spec.output('QP_db', valid_type=SingleFileData,
                 required=False, help='returns the singlefiledata for ndbQP')
+        spec.output('profiling', valid_type=ArrayData,
+                required=False, help='returns the timing, memory and warnings of the run as arrays')
 
 
+    @staticmethod
+    def _save_store_key(parent_calc):
+        """Store key of the SAVE of parent_calc, from its parsed or retrieved ns.db1 (None if not there)."""
+        try:
+            key = parent_calc.outputs.output_parameters.get_dict().get('ns_db1_sha256')
+            if key: return key
+        except Exception:
+            pass
+        try:
+            with parent_calc.outputs.retrieved.base.repository.open('ns.db1', mode='rb') as handle:
+                return save_store_key(handle)
+        except Exception:
+            return None
+
     def prepare_for_submission(self, tempfolder):
 
         _dbs_accepted = {'gw0': 'ndb.QP', 'HF_and_locXC': 'ndb.HF_and_locXC','p2y':'ns.db1','bse':'ndb.BS_diago_Q*'}
@@ -165,11 +185,30 @@ class YamboCalculation(CalcJob):
             if not isinstance(copy_save, bool):
                 raise InputValidationError("COPY_SAVE must be " " a boolean")
 
+        save_store = settings.pop('SAVE_STORE', None)
+        if save_store is not None:
+            if not isinstance(save_store, six.string_types):
+                raise InputValidationError("SAVE_STORE must be " " a string (remote path of the store)")
+
+        retrieval_policy = settings.pop('RETRIEVAL_POLICY', 'default')
+        if isinstance(retrieval_policy, six.string_types):
+            if retrieval_policy not in RETRIEVAL_POLICIES:
+                raise InputValidationError("RETRIEVAL_POLICY must be one of {} "
+                                           "or a dict with 'retrieve', 'temporary' and 'remote' lists".format(list(RETRIEVAL_POLICIES.keys())))
+        elif not isinstance(retrieval_policy, dict) or not set(retrieval_policy.keys()) <= {'retrieve', 'temporary', 'remote'}:
+            raise InputValidationError("RETRIEVAL_POLICY must be one of {} "
+                                       "or a dict with 'retrieve', 'temporary' and 'remote' lists".format(list(RETRIEVAL_POLICIES.keys())))
+
         copy_dbs = settings.pop('COPY_DBS', None)
         if copy_dbs is not None:
-            if not isinstance(copy_dbs, bool):
-                raise InputValidationError("COPY_DBS must be " " a boolean")
+            if not isinstance(copy_dbs, (bool, list)):
+                raise InputValidationError("COPY_DBS must be " " a boolean or a list of databases (e.g. ['ndb.pp'])")
         
+        dbs_from = settings.pop('DBS_FROM', None) #uuid of the RemoteData whose aiida.out has the COPY_DBS list, default the parent
+        if dbs_from is not None:
+            if not isinstance(dbs_from, six.string_types):
+                raise InputValidationError("DBS_FROM must be " " the uuid of a RemoteData")
+
         restart_yambo = settings.pop('RESTART_YAMBO', None)
         if restart_yambo is not None:
             if not isinstance(restart_yambo, bool):
@@ -180,6 +219,11 @@ class YamboCalculation(CalcJob):
             if not isinstance(verbose_timing, bool):
                 raise InputValidationError("T_VERBOSE must be " " a boolean")
         
+        bse_window = settings.pop('BSE_WINDOW', None) #used by the parser
+        if bse_window is not None:
+            if not (bse_window == 'excitons' or (isinstance(bse_window, (list, tuple)) and len(bse_window) == 2)):
+                raise InputValidationError("BSE_WINDOW must be " " [emin, emax] (eV) or 'excitons'")
+
         iteration = settings.pop('ITERATION', None)
 
         parameters = self.inputs.parameters
@@ -263,8 +307,12 @@ class YamboCalculation(CalcJob):
         except:
             parent_calc = parent_calc_folder.get_incoming().get_node_by_label('remote_folder')
 
+        prepend_text = None
         if yambo_parent:
-            if copy_save:
+            save_key = self._save_store_key(take_calc_from_remote(parent_calc_folder)) if copy_save and save_store else None
+            if save_key: #hard links to the store instead of a full copy
+                prepend_text = save_store_script(save_store, save_key, parent_calc_folder.get_remote_path()+"/SAVE/")
+            elif copy_save:
                 try:
                     remote_copy_list.append((parent_calc_folder.computer.uuid,parent_calc_folder.get_remote_path()+"/SAVE/",'./SAVE/'))
                 except:
@@ -275,7 +323,7 @@ class YamboCalculation(CalcJob):
                 except:
                     remote_symlink_list.append((parent_calc_folder.computer.uuid,parent_calc_folder.get_remote_path()+"out/aiida.save/SAVE/",'./SAVE/'))
 
-            if copy_dbs:
+            if copy_dbs is True:
                     remote_copy_list.append((parent_calc_folder.computer.uuid,parent_calc_folder.get_remote_path()+"/aiida.out/",'./aiida.out/'))
             if restart_yambo:
                     remote_symlink_list.append((parent_calc_folder.computer.uuid,parent_calc_folder.get_remote_path()+"/aiida.out/",'./aiida.out/'))
@@ -288,6 +336,12 @@ class YamboCalculation(CalcJob):
                                      "."
                                      )
                                     )
+        # only the listed databases, from the parent or from another calculation (DBS_FROM),
+        # the SAVE is still the one of the parent
+        if copy_dbs and copy_dbs is not True and not initialise and (yambo_parent or dbs_from):
+            dbs_folder = load_node(dbs_from) if dbs_from else parent_calc_folder
+            prepend_text = (prepend_text or '') + copy_dbs_script(dbs_folder.get_remote_path()+"/aiida.out/", copy_dbs)
+
         ############################################
         # set Calcinfo
         ############################################
@@ -299,23 +353,16 @@ class YamboCalculation(CalcJob):
         calcinfo.local_copy_list = local_copy_list
         calcinfo.remote_copy_list = remote_copy_list
         calcinfo.remote_symlink_list = remote_symlink_list
+        if prepend_text: calcinfo.prepend_text = prepend_text
 
-        # Retrieve by default the output file and the xml file
-        calcinfo.retrieve_list = []
-        calcinfo.retrieve_list.append('r*')
-        calcinfo.retrieve_list.append('l*')
-        calcinfo.retrieve_list.append('o*')
-        calcinfo.retrieve_list.append('LOG/l*_CPU_1')
-        #calcinfo.retrieve_list.append('LOG/l*_CPU_2')
-        calcinfo.retrieve_list.append('*stderr*') #standard errors
-        extra_retrieved = []
-
-        if initialise:
-            extra_retrieved.append('SAVE/'+_dbs_accepted['p2y'])
-        else:
+        # What is kept, only parsed or left remote depends on the role of the calculation
+        runlevel_dbs = []
+        if not initialise:
             for dbs in _dbs_accepted.keys():
                 if dbs in params_dict['arguments']:
-                    extra_retrieved.append('aiida.out/'+_dbs_accepted[dbs])
+                    runlevel_dbs.append('aiida.out/'+_dbs_accepted[dbs])
+        calcinfo.retrieve_list, calcinfo.retrieve_temporary_list = retrieval_lists(retrieval_policy, runlevel_dbs, initialise)
+        extra_retrieved = []
 
         additional = settings.pop('ADDITIONAL_RETRIEVE_LIST',[])
         if additional:
@@ -383,8 +430,6 @@ class YamboCalculation(CalcJob):
         else:
             calcinfo.codes_info = [c1, c2, c3]
         
-        #if not parent_save_path: extra_retrieved.append('SAVE/ns.db1')
-        extra_retrieved.append('SAVE/ns.db1') #then always delete it? but how? TODO
 
         calcinfo.codes_run_mode = CodeRunMode.SERIAL
         
@@ -27,7 +27,8 @@ from aiida.common import LinkType
 
 from aiida_yambo.utils.common_helpers import * 
 
-from yambopy.io.inputfile import YamboIn
+from aiida_yambo.utils.lazy import lazy_import
+YamboIn = lazy_import('yambopy.io.inputfile', 'YamboIn')
 
 PwCalculation = CalculationFactory('quantumespresso.pw')
 YamboCalculation = CalculationFactory('yambo.yambo')
@@ -3,9 +3,10 @@ from __future__ import absolute_import
 from __future__ import print_function
 import click
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-from matplotlib import gridspec
+from aiida_yambo.utils.lazy import lazy_import
+plt = lazy_import('matplotlib.pyplot')
+mpl = lazy_import('matplotlib')
+gridspec = lazy_import('matplotlib.gridspec')
 import json
 import sys
 from aiida_yambo.commands.utils import command
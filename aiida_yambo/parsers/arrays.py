@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Whole-array construction of the parser outputs (numpy only).
+
+The YamboFile data are dictionaries of per-k-point blocks; here each quantity is
+obtained with a single concatenation/stack over the blocks, never element by element.
+"""
+from __future__ import absolute_import
+import numpy
+
+QP_TABLE_KEYS = {'Eo':'Eo', 'E-Eo':'E_minus_Eo', 'Sc|Eo':'So', 'Z':'Z'}
+
+
+def array_name(quantity):
+    return quantity.replace('-','_minus_')
+
+def optics_array_name(quantity):
+    return quantity.replace('-','_').replace('`','_prime_').replace('/','_').replace("(","_").replace(")","").replace("[","_").replace("]","")
+
+def concatenate_blocks(data):
+    """{'0':{k:[...]}, '1':{k:[...]}, ...} --> {k: block '0' + block '1' + ...}"""
+    blocks = list(data.values())
+    if not blocks: return {}
+    return {k: numpy.concatenate([numpy.asarray(b[k]).ravel() for b in blocks]) for k in blocks[0].keys()}
+
+def qp_table_arrays(data):
+    """Flatten o-*.qp data in the internal yambo format.
+
+    Returns Eo, E_minus_Eo, So, Z and qp_table=[[ik,ib,isp],...].
+    """
+    kpoints = list(data.keys())
+    bands = [numpy.asarray(data[ky]['Band']).ravel() for ky in kpoints]
+    counts = numpy.array([len(b) for b in bands], dtype=int)
+
+    arrays = {}
+    for key, name in QP_TABLE_KEYS.items():
+        present = [numpy.asarray(data[ky][key]).ravel() for ky in kpoints if key in data[ky]]
+        arrays[name] = numpy.concatenate(present) if present else numpy.array([])
+
+    ik = numpy.repeat(numpy.array([int(ky) for ky in kpoints], dtype=int), counts)
+    ib = numpy.concatenate(bands) if bands else numpy.array([])
+    isp = numpy.concatenate([numpy.asarray(data[ky]['Spin_Pol']).ravel() if 'Spin_Pol' in data[ky]
+                             else numpy.zeros(n, dtype=int) for ky, n in zip(kpoints, counts)]) if bands else numpy.array([])
+    arrays['qp_table'] = numpy.column_stack((ik, ib, isp)) if bands else numpy.array([])
+    return arrays
+
+def bands_arrays(data, kpt_idx, labels):
+    """One (nk, nb) array per label, stacked over the sorted k-points."""
+    return [numpy.stack([numpy.asarray(data[kp][label]) for kp in kpt_idx]) for label in labels]
+
+def ndb_arrays(*dbs):
+    """{name: array} from ndb.QP/ndb.HF_and_locXC data, without copies."""
+    arrays = {}
+    for db in dbs:
+        for quantity in db.keys():
+            arrays[array_name(quantity)] = numpy.asarray(db[quantity])
+    return arrays
+
+def sigma_c(ndbqp, ndbhf):
+    """Sc = 1/Z[ E-Eo] -S_x + Vxc, if So is not in the ndb.QP."""
+    if 'So' in ndbqp:
+        return numpy.asarray(ndbqp['So'])
+    Z = numpy.asarray(ndbqp['Z'])
+    return numpy.asarray(ndbqp['E-Eo']) / Z - numpy.asarray(ndbhf['Sx']) + numpy.asarray(ndbhf['Vxc'])
+
+def has_nan(array):
+    return bool(numpy.isnan(numpy.asarray(array)).any())
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""BSE dielectric function from the excitons of an ndb.BS_diago database (numpy only).
+
+eps(w) = 1 + cofactor * sum_s R_s [ -1/(w-E_s+i*eta) - 1/(-w-E_s-i*eta) ]
+as in YamboExcitonDB.get_chi, but evaluated on an adaptive grid: the window is
+[emin, emax) (or only around the exciton energies, with margin), the grid has
+the fine step only around the bright excitons and a coarse one elsewhere (all
+the points lie on the fine lattice emin + n*fine). The sum runs in chunks of excitons, so memory is bounded by
+chunk*len(w) whatever the number of excitons. The prefactor (volume, q, spin)
+is fitted on a few points computed by yambopy, see fit_cofactor.
+"""
+from __future__ import absolute_import
+import numpy
+
+def adaptive_grid(energies, weights, broad=0.15, emin=0, emax=20, fine=0.01, coarse=0.05,
+                  margin=None, peak_width=3, bright=1e-3):
+    """Frequencies (eV, increasing) for the spectrum of excitons with energies and weights.
+
+    Window: [emin, emax), or the exciton energies +- margin*broad inside it if margin is given.
+    Fine step within peak_width*broad of the excitons with |weight| > bright*max|weight|,
+    coarse step elsewhere.
+    """
+    energies = numpy.asarray(energies, dtype=float)
+    weights = abs(numpy.asarray(weights))
+    if len(energies) == 0:
+        return numpy.arange(emin, emax, coarse)
+    lower = emin if margin is None else max(emin, energies.min()-margin*broad)
+    upper = emax if margin is None else min(emax, energies.max()+margin*broad)
+    first, last = int(numpy.floor((lower-emin)/fine)), int(numpy.ceil((upper-emin)/fine))
+    n = numpy.arange(max(first, 0), min(last+1, int(round((emax-emin)/fine)))) #emax excluded, as numpy.arange
+    w = emin + n*fine
+
+    peaks = numpy.concatenate([[-numpy.inf], numpy.sort(energies[weights > bright*weights.max()]), [numpy.inf]])
+    i = numpy.searchsorted(peaks, w)
+    nearest = numpy.minimum(peaks[i]-w, w-peaks[i-1])
+    keep = (n % max(int(round(coarse/fine)), 1) == 0) | (nearest <= peak_width*broad)
+    return w[keep]
+
+def lorentzian_sum(w, energies, weights, broad=0.15, chunk=256):
+    """sum_s weights_s [ -1/(w-E_s+i*broad) - 1/(-w-E_s-i*broad) ], chunk excitons at a time."""
+    w = numpy.asarray(w, dtype=float)
+    energies = numpy.asarray(energies)
+    weights = numpy.asarray(weights)
+    total = numpy.zeros(len(w), dtype=complex)
+    for start in range(0, len(energies), chunk):
+        e = energies[start:start+chunk, None]
+        g = -1/(w-e+1j*broad) - 1/(-w-e-1j*broad)
+        total += weights[start:start+chunk].dot(g)
+    return total
+
+def fit_cofactor(w, eps, energies, residuals, broad=0.15):
+    """Prefactor c of eps = 1 + c*lorentzian_sum, least squares on a few points of a reference
+    eps (e.g. from YamboExcitonDB.get_chi), and the relative error of the fit."""
+    s = lorentzian_sum(w, energies, residuals, broad=broad)
+    y = numpy.asarray(eps, dtype=complex)-1
+    norm = numpy.vdot(s, s).real
+    if norm == 0: return 0, numpy.inf
+    c = numpy.vdot(s, y)/norm
+    return c, numpy.linalg.norm(y-c*s)/max(numpy.linalg.norm(y), 1e-300)
+
+def bse_spectrum(energies, residuals, cofactor, broad=0.15, emin=0, emax=20, fine=0.01, chunk=256, **grid):
+    """(w, eps) of the excitons with energies (eV) and residuals (l_residual*r_residual)."""
+    w = adaptive_grid(numpy.real(energies), residuals, broad=broad, emin=emin, emax=emax, fine=fine, **grid)
+    return w, 1+cofactor*lorentzian_sum(w, energies, residuals, broad=broad, chunk=chunk)
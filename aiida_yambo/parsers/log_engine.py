@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Single-pass streaming engine for yambo log (l-*) and report (r-*) files.
+
+Each file is read once, line by line. Every line is scanned by one precompiled
+alternation of all the tokens we care about, and each match is dispatched to the
+handler registered for that token. Handlers only look at the current line, so
+memory stays bounded (apart from the timing/memstats lines that we have to store
+in the output parameters anyway).
+"""
+from __future__ import absolute_import
+import os
+import re
+
+_TIME = re.compile(r'<([0-9hms-]+)>')
+_T_VERBOSE = re.compile(r'^\s+?<([0-9a-z-]+)> ([A-Z0-9a-z-]+)[:] (\[TIMING\])')
+_T_VERBOSE_OLD = re.compile(r'^\s+?<([0-9a-z-]+)> (\[TIMING\]) ')
+_MEMORY = re.compile(r'^\s+?<([0-9a-z-]+)> ([A-Z0-9a-z-]+)[:] (\[MEMORY\]) ')
+_MEMORY_OLD = re.compile(r'^\s+?<([0-9a-z-]+)> (\[MEMORY\]) ')
+_FRAGMENT = re.compile(r'ndb.pp_fragment_[0-9]+')
+_PROGRESS = re.compile(r'\[\s*([0-9]+)%\]\s*([0-9hms-]+)\(E\)\s*([0-9hms-]+)\(X\)')
+
+#checks done only on the last line of a log
+_LAST_LINE_MEMORY = re.compile(r'Reading|\[MEMORY\] Alloc|out of memory')
+_LAST_LINE_X_PAR = re.compile(r'\[ERROR\] ?Allocation of X_par%blc_d failed')
+
+
+def yambotiming_to_seconds(yt):
+    t = 0
+    th = 0
+    tm = 0
+    ts = 0
+    if isinstance(yt, str):
+        for i in yt.replace('-',' ').split():
+         if 'h' in i:
+             th = int(i.replace('h',''))*3600
+         if 'm' in i:
+             tm = int(i.replace('m',''))*60
+         if 's' in i:
+              ts = int(i.replace('s',''))
+        t = th+tm+ts
+        return t
+    else:
+        return yt
+
+
+class TokenTable():
+    """Ordered table of (name, pattern, handler), compiled in a single regex.
+
+    The patterns must not contain named groups. Handlers are called as
+    ``handler(state, match, line)``.
+    """
+
+    def __init__(self, tokens=[]):
+        self.tokens = []
+        self.handlers = {}
+        self.regex = None
+        for name, pattern, handler in tokens:
+            self.register(name, pattern, handler, compile=False)
+        self.compile()
+
+    def register(self, name, pattern, handler, compile=True):
+        """Add (or replace) a token; the combined regex is rebuilt."""
+        self.tokens = [t for t in self.tokens if t[0] != name] + [(name, pattern)]
+        self.handlers[name] = handler
+        if compile: self.compile()
+
+    def compile(self):
+        self.regex = re.compile('|'.join('(?P<{}>{})'.format(n, p) for n, p in self.tokens))
+
+    def dispatch(self, line, state):
+        for match in self.regex.finditer(line):
+            self.handlers[match.lastgroup](state, match, line)
+
+
+class ParsingState():
+    """What the handlers share while a file is streamed."""
+
+    def __init__(self, output_params, verbose_timing=False):
+        self.output_params = output_params
+        self.verbose_timing = verbose_timing
+        self.timing = []
+        self.verbose = []
+        self.game_over = False
+        self.last_line = None
+
+
+def _errors(state):
+    return state.output_params.setdefault('errors', [])
+
+def _memory_general(state):
+    state.output_params['memory_error'] = True
+    _errors(state).append('memory_general')
+
+################################## handlers ####################################
+
+def _on_game_over(state, match, line):
+    state.game_over = True
+
+def _on_step(state, match, line):
+    if not state.timing or state.timing[-1] is not line:
+        state.timing.append(line)
+
+def _on_verbose_timing(state, match, line):
+    if state.verbose_timing and (_T_VERBOSE.match(line) or _T_VERBOSE_OLD.match(line)):
+        state.verbose.append(line)
+
+def _on_warning(state, match, line):
+    if match.start() == 0:
+        state.output_params['warnings'].append(line)
+
+def _on_memory(state, match, line):
+    if _MEMORY.match(line) or _MEMORY_OLD.match(line):
+        state.output_params['memstats'].append(line)
+    if line[match.end():].lstrip(' ').startswith('out of memory'):
+        _memory_general(state)
+
+def _on_error(state, match, line):
+    what = match.group('error').replace('[ERROR]', '').strip()
+    if what.startswith('Allocation'):
+        if match.group('error').startswith('[ERROR]Allocation'):
+            _memory_general(state)
+    elif what.startswith('Writing File'):
+        _errors(state).append('corrupted_fragment')
+        state.output_params['corrupted_fragment'] = _FRAGMENT.findall(line)
+    else:
+        state.output_params['para_error'] = True
+
+def _on_progress(state, match, line):
+    #only the last bar: [percent, elapsed (s), expected (s) for the step, step]
+    bar = _PROGRESS.search(line)
+    if bar:
+        step = state.timing[-1].strip() if state.timing else ''
+        state.output_params['progress'] = [int(bar.group(1)), yambotiming_to_seconds(bar.group(2)),
+                                           yambotiming_to_seconds(bar.group(3)), step]
+
+def _on_time_most_prob(state, match, line):
+    _errors(state).append('time_most_prob')
+
+def _on_p2y_completed(state, match, line):
+    state.output_params['p2y_completed'] = True
+
+def _on_fermi(state, match, line):
+    index = 3 if match.group('fermi') == '[X]Fermi Level' else 4
+    try:
+        state.output_params['Fermi(eV)'] = float(line.split()[index])
+    except (IndexError, ValueError):
+        pass
+
+def _on_gpu(state, match, line):
+    state.output_params['has_gpu'] = True
+
+################################## tables ######################################
+
+LOG_TABLE = TokenTable([
+    ('game', r'Game|Clock:', _on_game_over),
+    ('step', r'\[[0-9]+\] (?=[A-Za-z\s])', _on_step), #zero-width after the bracket: the text is left to the other tokens
+    ('timing', r'\[TIMING\]', _on_verbose_timing),
+    ('warning', r'\[WARNING\]', _on_warning),
+    ('memory', r'\[MEMORY\]', _on_memory),
+    ('error', r'\[ERROR\] ?(?:Allocation|Incomplete|Impossible|USER parallel|Writing File)', _on_error),
+    ('xo', r'Alloc Xo%blc_d', _on_time_most_prob),
+    ('progress', r'\[\s*[0-9]+%\]', _on_progress),
+])
+
+REPORT_TABLE = TokenTable([
+    ('fermi', r'\[X\] ?Fermi Level', _on_fermi),
+    ('game', r'Game|Clock:', _on_game_over),
+    ('gpu', r'CUDA', _on_gpu),
+])
+
+P2Y_TABLE = TokenTable([
+    ('p2y', r'P2Y completed', _on_p2y_completed),
+])
+
+REPORT_SETUP_TABLE = TokenTable([
+    ('fermi', r'\[X\] ?Fermi Level', _on_fermi),
+])
+
+################################## engine ######################################
+
+def yambo_output_type(filename):
+    """'log', 'report' or None, from the name of a retrieved file."""
+    name = os.path.basename(filename)
+    if name.startswith('l-') or name.startswith('l_'):
+        return 'log'
+    if name.startswith('r-') or name.startswith('r_'):
+        return 'report'
+    return None
+
+def stream(lines, table, state):
+    for line in lines:
+        table.dispatch(line, state)
+        state.last_line = line
+    return state
+
+def _finalize_log(state):
+    output_params = state.output_params
+    output_params['game_over'] = state.game_over
+    output_params['timing'] += state.timing
+
+    try:
+        output_params['last_time'] = yambotiming_to_seconds(_TIME.findall(state.last_line)[-1])
+    except (IndexError, TypeError):
+        try:
+            output_params['last_time'] = yambotiming_to_seconds(_TIME.findall(output_params['timing'][-1])[-1])
+        except IndexError:
+            output_params['last_time'] = 0
+
+    if state.verbose_timing:
+        output_params['timing'].append('verbose_output:')
+        output_params['timing'] += state.verbose
+
+    last = state.last_line
+    if last is None: return
+    if _LAST_LINE_X_PAR.search(last):
+        output_params['memory_error'] = True
+        _errors(state).append('X_par_allocation')
+    if _LAST_LINE_MEMORY.search(last):
+        _memory_general(state)
+
+def parse_log_stream(filename, lines, output_params, timing=False):
+    """Parse a yambo log from any iterable of lines (e.g. an open file handle)."""
+    if 'p2y' in filename:
+        stream(lines, P2Y_TABLE, ParsingState(output_params))
+    elif 'l_setup' in filename or 'l-setup' in filename:
+        pass
+    else:
+        state = stream(lines, LOG_TABLE, ParsingState(output_params, verbose_timing=timing))
+        _finalize_log(state)
+    return output_params
+
+def parse_report_stream(filename, lines, output_params):
+    """Parse a yambo report from any iterable of lines (e.g. an open file handle)."""
+    if 'setup' in filename:
+        stream(lines, REPORT_SETUP_TABLE, ParsingState(output_params))
+    else:
+        state = stream(lines, REPORT_TABLE, ParsingState(output_params))
+        if state.game_over: output_params['game_over'] = True
+    return output_params
+
+def parse_output_file(filename, handle, output_params, timing=False):
+    """Dispatch a retrieved log/report handle to the right parser; returns the type."""
+    kind = yambo_output_type(filename)
+    if kind == 'log':
+        parse_log_stream(filename, handle, output_params, timing=timing)
+    elif kind == 'report':
+        parse_report_stream(filename, handle, output_params)
+    return kind
@@ -21,15 +21,18 @@ from yamboparser.yambofolder import YamboFolder
 
 from aiida_yambo.utils.common_helpers import *
 from aiida_yambo.parsers.utils import *
+from aiida_yambo.parsers.log_engine import yambo_output_type, parse_output_file
+from aiida_yambo.parsers.arrays import *
+from aiida_yambo.parsers.repository import RetrievedReader, is_yambo_output, YAMBOFOLDER_DBS
+from aiida_yambo.utils.save_store import save_store_key
+from aiida_yambo.parsers.profiling import compact_profile
 
 from aiida_quantumespresso.calculations.pw import PwCalculation
 from aiida_quantumespresso.calculations import _lowercase_dict, _uppercase_dict
 from six.moves import range
 import cmath
-import netCDF4
-
-import pathlib
-import tempfile
+from aiida_yambo.utils.lazy import lazy_import
+netCDF4 = lazy_import('netCDF4')
 
 SingleFileData = DataFactory('core.singlefile')
 
@@ -109,6 +112,7 @@ class YamboParser(Parser):
         self._lifetime_bands_linkname = 'bands_lifetime'
         self._quasiparticle_bands_linkname = 'bands_quasiparticle'
         self._parameter_linkname = 'output_parameters'
+        self._profiling_linkname = 'profiling'
         self._system_info_linkname = 'system_info'
         super(YamboParser, self).__init__(calculation)
 
@@ -134,6 +138,7 @@ class YamboParser(Parser):
 
         initialise = settings_dict.pop('INITIALISE', None)
         verbose_timing = settings_dict.pop('T_VERBOSE', False)
+        bse_window = settings_dict.pop('BSE_WINDOW', [0, 20])
             
         # select the folder object
         try:
@@ -151,7 +156,7 @@ class YamboParser(Parser):
         # retrieve the cell: if parent_calc is a YamboCalculation we must find the original PwCalculation
         # going back through the graph tree.
 
-        parent_calc = find_pw_parent(self._calc)
+        parent_calc = find_pw_parent(self._calc, store_extra = True)
         cell = parent_calc.inputs.structure.cell
         try:
             parent_save_path = take_calc_from_remote(self._calc.inputs.parent_folder).outputs.output_parameters.get_dict().pop('ns_db1_path',None)
@@ -162,7 +167,7 @@ class YamboParser(Parser):
         output_params = {'warnings': [], 'yambo_wrote_dbs': False, 'game_over': False,
         'p2y_completed': False, 'last_time':0,\
         'requested_time':self._calc.attributes['max_wallclock_seconds'], 'last_time_units':'seconds',\
-        'memstats':[], 'para_error':False, 'memory_error':False,'timing':[],'time_error': False, 'has_gpu': False,
+        'memstats':[], 'progress':[], 'para_error':False, 'memory_error':False,'timing':[],'time_error': False, 'has_gpu': False,
         'yambo_version':'5.x', 'Fermi(eV)':0,'ns_db1_path':parent_save_path,'X_par_allocation_error':False,'errors':[],'corrupted_fragment':False}
         ndbqp = {}
         ndbhf = {}
@@ -170,31 +175,32 @@ class YamboParser(Parser):
         chi = {}
         excitonic_states = {}
 
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as dirpath:
-            # Open the output file from the AiiDA storage and copy content to the temporary file
-            for filename in retrieved.base.repository.list_object_names():
-                # Create the file with the desired name
-                temp_file = pathlib.Path(dirpath) / filename
-                with retrieved.open(filename, 'rb') as handle:
-                    temp_file.write_bytes(handle.read())
-                os.system(f"cp {temp_file} /home/aiida/data/work/prova_ypy/{filename}")
+        # Only the files needed by a given step are materialized on disk
+        with RetrievedReader(retrieved, kwargs.get('retrieved_temporary_folder')) as reader:
 
-            if 'ns.db1' in os.listdir(dirpath):
-                output_params['ns_db1_path'] = dirpath
+            if 'ns.db1' in reader.names:
+                output_params['ns_db1_path'] = reader.materialize(['ns.db1'])
+                with reader.open('ns.db1', 'rb') as handle:
+                    output_params['ns_db1_sha256'] = save_store_key(handle)
 
-            for filename in os.listdir(dirpath):
+            for filename in reader.names:
                 
                 if 'stderr' in filename:
-                    with retrieved.open(filename) as stderr:
+                    with reader.open(filename) as stderr:
                         parse_scheduler_stderr(stderr, output_params)
+
+                elif yambo_output_type(filename):
+                    with reader.open(filename) as handle:
+                        parse_output_file(filename, handle, output_params, timing = verbose_timing)
                 
                 elif 'ndb.BS_diago' in filename: #BSE in AiiDA 2.x still not supported
-                    q, chi, excitonic_states = parse_BS(dirpath+'/',
+                    q, chi, excitonic_states = parse_BS(reader.materialize([filename])+'/',
                                                                 filename,
-                                                                output_params['ns_db1_path'])            
+                                                                output_params['ns_db1_path'],
+                                                                window = bse_window)            
             
             try:
+                dirpath = reader.materialize(reader.select(lambda name: is_yambo_output(name) or name in YAMBOFOLDER_DBS))
                 results = YamboFolder(dirpath)
             except Exception as e:
                 success = False
@@ -205,10 +211,8 @@ class YamboParser(Parser):
                     continue
 
                 #This should be automatic in yambopy...
-                if result.type=='log':
-                    parse_log(result, output_params, timing = verbose_timing)
-                if result.type=='report':
-                    parse_report(result, output_params)
+                if result.type in ['log','report']: #already streamed from the repository
+                    continue
                 if 'eel' in result.filename:
                     eels_array = self._aiida_optics_array(result.data)
                     self.out(self._eels_array_linkname, eels_array)
@@ -221,31 +225,30 @@ class YamboParser(Parser):
 
                 
                 if 'ndb.QP' == result.filename:
-                    ndbqp = copy.deepcopy(result.data)
+                    ndbqp = result.data
                     
-                    if len(numpy.where(numpy.isnan(ndbqp['E-Eo'].data))[0])>0:
+                    if has_nan(ndbqp['E-Eo']):
                         return self.exit_codes.NaN_AS_OUTPUT
                         
-                    QP_db = SingleFileData(dirpath+'/'+result.filename)
+                    with reader.open(result.filename, 'rb') as handle:
+                        QP_db = SingleFileData(handle, filename=result.filename)
                     self.out(self._QP_db_linkname,QP_db)
                     
 
                 elif 'ndb.HF_and_locXC' == result.filename:
-                    ndbhf = copy.deepcopy(result.data)
+                    ndbhf = result.data
 
                 elif 'gw0___' in input_params['arguments']:
-                    if self._aiida_bands_data(result.data, cell, result.kpoints):
-                        arr = self._aiida_bands_data(result.data, cell,
-                                                    result.kpoints)
+                    arr = self._aiida_bands_data(result.data, cell, result.kpoints)
+                    if arr is not False:
                         if type(arr) == BandsData:  # ArrayData is not BandsData, but BandsData is ArrayData
                             self.out(self._quasiparticle_bands_linkname,arr)
                         if type(arr) == ArrayData:  #
                             self.out(self._qp_array_linkname,arr)
 
                 elif 'life___' in input_params['arguments']:
-                    if self._aiida_bands_data(result.data, cell, result.kpoints):
-                        arr = self._aiida_bands_data(result.data, cell,
-                                                    result.kpoints)
+                    arr = self._aiida_bands_data(result.data, cell, result.kpoints)
+                    if arr is not False:
                         if type(arr) == BandsData:
                             self.out(self._alpha_array_linkname+'_bands',arr)
                         elif type(arr) == ArrayData:
@@ -266,6 +269,9 @@ class YamboParser(Parser):
             if delta_time > -2 and delta_time < 0.16:
                     output_params['time_error']=True
 
+        # timing/memory/warning lines go in an ArrayData and their summary in the Dict
+        # (the lines stay in the Dict for one release, deprecated)
+        self.out(self._profiling_linkname, self._aiida_array(compact_profile(output_params)))
         params=Dict(output_params)
         self.out(self._parameter_linkname,params)  # output_parameters
 
@@ -325,12 +331,8 @@ class YamboParser(Parser):
     
     def _aiida_optics_array(self, data):
         arraydata = ArrayData()
-        full = data.pop('0')
-        for i in data.keys():
-            for k in full.keys():
-                full[k] += data[i][k]
-        for ky in full.keys():
-            arraydata.set_array(ky.replace('-','_').replace('`','_prime_').replace('/','_').replace("(","_").replace(")","").replace("[","_").replace("]",""), np.array(full[ky]))
+        for ky, array in concatenate_blocks(data).items():
+            arraydata.set_array(optics_array_name(ky), array)
         return arraydata
 
     def _aiida_bands_data(self, data, cell, kpoints_dict):
@@ -348,41 +350,8 @@ class YamboParser(Parser):
             # like   ib= Band index,  ik= kpoint index,  isp= spin polarization index.
             #  Eo_1 =>  at ib_1, ik_1 isp_1.
             pdata = ArrayData()
-            QP_TABLE = []
-            ORD = []
-            Eo = []
-            E_minus_Eo = []
-            So = []
-            Z = []
-            for ky in data.keys():  # kp == kpoint index as a string  1,2,..
-                for ind in range(len(data[ky]['Band'])):
-                    try:
-                        Eo.append(data[ky]['Eo'][ind])
-                    except KeyError:
-                        pass
-                    try:
-                        E_minus_Eo.append(data[ky]['E-Eo'][ind])
-                    except KeyError:
-                        pass
-                    try:
-                        So.append(data[ky]['Sc|Eo'][ind])
-                    except KeyError:
-                        pass
-                    try:
-                        Z.append(data[ky]['Z'][ind])
-                    except KeyError:
-                        pass
-                    ik = int(ky)
-                    ib = data[ky]['Band'][ind]
-                    isp = 0
-                    if 'Spin_Pol' in list(data[ky].keys()):
-                        isp = data[ky]['Spin_Pol'][ind]
-                    QP_TABLE.append([ik, ib, isp])
-            pdata.set_array('Eo', numpy.array(Eo))
-            pdata.set_array('E_minus_Eo', numpy.array(E_minus_Eo))
-            pdata.set_array('So', numpy.array(So))
-            pdata.set_array('Z', numpy.array(Z))
-            pdata.set_array('qp_table', numpy.array(QP_TABLE))
+            for name, array in qp_table_arrays(data).items():
+                pdata.set_array(name, array)
             return pdata
         quasiparticle_bands = BandsData()
         quasiparticle_bands.set_cell(cell)
@@ -393,11 +362,7 @@ class YamboParser(Parser):
         bands_labels = [
             legend for legend in sorted(data[list(data.keys())[0]].keys())
         ]
-        append_list = [[] for i in bands_labels]
-        for kp in kpt_idx:
-            for i in range(len(bands_labels)):
-                append_list[i].append(data[kp][bands_labels[i]])
-        generalised_bands = [numpy.array(it) for it in append_list]
+        generalised_bands = bands_arrays(data, kpt_idx, bands_labels)
         quasiparticle_bands.set_bands(
             bands=generalised_bands, units='eV', labels=bands_labels)
         return quasiparticle_bands
@@ -407,9 +372,8 @@ class YamboParser(Parser):
         Save the data from ndb.QP to the db
         """
         pdata = ArrayData()
-        for quantity in data.keys():
-            name_quantity = quantity.replace('-','_minus_')
-            pdata.set_array(name_quantity, numpy.array(data[quantity]))
+        for name_quantity, array in ndb_arrays(data).items():
+            pdata.set_array(name_quantity, array)
         return pdata
 
     def _aiida_ndb_hf(self, data):
@@ -417,9 +381,8 @@ class YamboParser(Parser):
 
         """
         pdata = ArrayData()
-        for quantity in data.keys():
-            name_quantity = quantity.replace('-','_minus_')
-            pdata.set_array(name_quantity, numpy.array(data[quantity]))
+        for name_quantity, array in ndb_arrays(data).items():
+            pdata.set_array(name_quantity, array)
         return pdata
 
     def _sigma_c(self, ndbqp, ndbhf):
@@ -427,20 +390,8 @@ class YamboParser(Parser):
 
          Sc = 1/Z[ E-Eo] -S_x + Vxc
         """
-        Z = numpy.array(ndbqp['Z'])
-        E_minus_Eo = numpy.array(ndbqp['E-Eo'])
-        Sx = numpy.array(ndbhf['Sx'])
-        Vxc = numpy.array(ndbhf['Vxc'])
-        try:
-            Sc = numpy.array(ndbqp['So'])
-        except:
-            Sc = 1 / Z * E_minus_Eo - Sx + Vxc
         pdata = ArrayData()
-        for quantity in ndbqp.keys():
-            name_quantity = quantity.replace('-','_minus_')
-            pdata.set_array(name_quantity, numpy.array(ndbqp[quantity]))
-        for quantity in ndbhf.keys():
-            name_quantity = quantity.replace('-','_minus_')
-            pdata.set_array(name_quantity, numpy.array(ndbhf[quantity]))
-        pdata.set_array('Sc', Sc)
+        for name_quantity, array in ndb_arrays(ndbqp, ndbhf).items():
+            pdata.set_array(name_quantity, array)
+        pdata.set_array('Sc', sigma_c(ndbqp, ndbhf))
         return pdata
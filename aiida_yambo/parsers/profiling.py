@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Profiling of a yambo run as typed arrays, instead of log lines in output_parameters.
+
+The timing, [TIMING] (verbose) and [MEMORY] lines collected by the log engine
+become columns of an ArrayData ('profiling' output of YamboCalculation):
+
+    step_name, step_start, step_wall                   [05] Dynamic Dielectric Matrix (PPA), s, s
+    section_name, section_cpu, section_calls           verbose [TIMING] lines, s
+    memory_time, memory_object, memory_size, memory_total    [MEMORY] lines, s, Gb (size < 0 if freed)
+    warnings
+
+and a few scalars are added to the Dict (see profile_summary). The lines are still
+in the Dict for one release (deprecated, compact_profile(..., drop_lines=True) removes them).
+"""
+from __future__ import absolute_import
+import re
+import numpy as np
+
+from aiida_yambo.parsers.log_engine import yambotiming_to_seconds
+
+_STAMP = re.compile(r'<([0-9hms-]+)>')
+_STEP = re.compile(r'(\[[0-9]+\].*)')
+_SECTION = re.compile(r'\[TIMING\]\s*(.*?)\s*:\s*([0-9.]+)\s*s(?:.*?\(\s*([0-9]+)\s*calls?)?')
+_MEMORY = re.compile(r'\[MEMORY\]\s*(Alloc|Free)\s*(.*?)\s*\(\s*([0-9.]+)\s*\[?([KMG])b\]?\s*\)'
+                     r'(?:\s*TOTAL:\s*([0-9.]+)\s*\[?([KMG])b)?')
+_UNIT = {'K': 1e-6, 'M': 1e-3, 'G': 1}
+
+PROFILE_KEYS = ['timing', 'memstats', 'warnings']
+
+def _stamp(line):
+    found = _STAMP.search(line)
+    return yambotiming_to_seconds(found.group(1)) if found else np.nan
+
+def profile_arrays(output_params):
+    """{array name: numpy array} from the timing, memstats and warnings lines of output_params."""
+    steps, sections, memory = [], [], []
+    for line in output_params.get('timing', []):
+        section = _SECTION.search(line)
+        step = _STEP.search(line)
+        if section:
+            sections.append((section.group(1), float(section.group(2)), int(section.group(3) or 0)))
+        elif step:
+            steps.append((step.group(1).strip(), _stamp(line)))
+    for line in output_params.get('memstats', []):
+        found = _MEMORY.search(line)
+        if not found: continue
+        size = float(found.group(3))*_UNIT[found.group(4)]*(1 if found.group(1) == 'Alloc' else -1)
+        total = float(found.group(5))*_UNIT[found.group(6)] if found.group(5) else np.nan
+        memory.append((_stamp(line), found.group(2), size, total))
+
+    start = np.array([s[1] for s in steps], dtype=float)
+    end = np.append(start[1:], max(float(output_params.get('last_time', 0) or 0), start[-1] if len(start) else 0))
+    return {
+        'step_name': np.array([s[0] for s in steps], dtype=str),
+        'step_start': start,
+        'step_wall': end-start,
+        'section_name': np.array([s[0] for s in sections], dtype=str),
+        'section_cpu': np.array([s[1] for s in sections], dtype=float),
+        'section_calls': np.array([s[2] for s in sections], dtype=int),
+        'memory_time': np.array([m[0] for m in memory], dtype=float),
+        'memory_object': np.array([m[1] for m in memory], dtype=str),
+        'memory_size': np.array([m[2] for m in memory], dtype=float),
+        'memory_total': np.array([m[3] for m in memory], dtype=float),
+        'warnings': np.array([str(w).strip() for w in output_params.get('warnings', [])], dtype=str),
+    }
+
+def profile_summary(arrays):
+    """Scalars kept in output_parameters: steps, last step, warnings, memory peak and last allocation (Gb)."""
+    allocated = arrays['memory_size'][arrays['memory_size'] > 0]
+    total = arrays['memory_total'][~np.isnan(arrays['memory_total'])]
+    return {
+        'n_steps': len(arrays['step_name']),
+        'last_step': str(arrays['step_name'][-1]) if len(arrays['step_name']) else '',
+        'n_warnings': len(arrays['warnings']),
+        'memory_peak': float(total.max()) if len(total) else None,
+        'memory_last_alloc': float(allocated[-1]) if len(allocated) else None,
+    }
+
+def compact_profile(output_params, drop_lines=False):
+    """Add the summary of the profiling lines to output_params and return the arrays.
+    The lines (PROFILE_KEYS) are deprecated in output_params: dropped if drop_lines."""
+    arrays = profile_arrays(output_params)
+    if drop_lines:
+        for key in PROFILE_KEYS:
+            output_params.pop(key, None)
+    output_params.update(profile_summary(arrays))
+    return arrays
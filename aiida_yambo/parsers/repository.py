@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Read the retrieved folder of a calculation without copying all of it to disk.
+
+Text outputs (logs, reports, stderr) are opened as streams directly from the
+repository. Files that have to be seen as paths (netCDF databases for yambopy,
+o-* files for YamboFolder) are materialized on demand, one by one, in a single
+temporary folder that lives as long as the reader. Files of the
+retrieve_temporary_list (see utils/retrieval_policy.py) are read in place from
+the folder the engine passes to the parser, as if they were retrieved.
+"""
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+
+#files from which YamboFolder extracts data used by the parsers
+YAMBOFOLDER_DBS = ['ndb.QP', 'ndb.HF_and_locXC']
+
+
+def is_yambo_output(filename):
+    """o-* files (qp, eps, eel, alpha, interpolated bands...)."""
+    name = os.path.basename(filename)
+    return name.startswith('o-') or name.startswith('o_')
+
+
+class RetrievedReader():
+    """Repository-aware access to a retrieved FolderData.
+
+    Use it as a context manager, the temporary folder is removed at exit::
+
+        with RetrievedReader(retrieved) as reader:
+            with reader.open('r-aiida') as report: ...
+            path = reader.materialize(['ndb.QP'])
+    """
+
+    def __init__(self, retrieved, temporary_folder=None):
+        self.retrieved = retrieved
+        self.names = retrieved.base.repository.list_object_names()
+        self.temporary = {}
+        if temporary_folder:
+            for root, _, filenames in os.walk(temporary_folder):
+                for filename in filenames:
+                    if filename not in self.names and filename not in self.temporary:
+                        self.temporary[filename] = os.path.join(root, filename)
+            self.names = self.names + sorted(self.temporary)
+        self._tmp = None
+        self._materialized = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
+
+    def select(self, condition):
+        return [name for name in self.names if condition(name)]
+
+    def open(self, filename, mode='r'):
+        """Stream a retrieved file, no copy involved."""
+        if filename in self.temporary:
+            return open(self.temporary[filename], mode)
+        return self.retrieved.base.repository.open(filename, mode)
+
+    @property
+    def folder(self):
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory()
+        return self._tmp.name
+
+    def materialize(self, filenames=[]):
+        """Copy (once) only the requested files on disk; returns the folder path."""
+        folder = self.folder
+        for filename in filenames:
+            if filename in self._materialized or filename not in self.names:
+                continue
+            with self.open(filename, 'rb') as source, open(os.path.join(folder, filename), 'wb') as target:
+                shutil.copyfileobj(source, target)
+            self._materialized.add(filename)
+        return folder
+
+    def path(self, filename):
+        return os.path.join(self.materialize([filename]), filename)
+
+    def cleanup(self):
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+            self._materialized = set()
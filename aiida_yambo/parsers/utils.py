@@ -2,13 +2,17 @@
 
 from six.moves import range
 import cmath
-import netCDF4
+from aiida_yambo.utils.lazy import lazy_import
+netCDF4 = lazy_import('netCDF4')
 import numpy
 import copy
 import glob, os, re
 
-from yambopy.dbs.excitondb import *
-from yambopy.dbs.savedb import * 
+YamboExcitonDB = lazy_import('yambopy.dbs.excitondb', 'YamboExcitonDB')
+YamboLatticeDB = lazy_import('yambopy.dbs.latticedb', 'YamboLatticeDB')
+
+from aiida_yambo.parsers.log_engine import yambotiming_to_seconds, parse_log_stream, parse_report_stream
+from aiida_yambo.parsers.bse_spectrum import bse_spectrum, fit_cofactor
 
 def take_fermi_parser(file):  # calc_node_pk = node_conv_wfl.outputs.last_calculation
 
@@ -22,25 +26,6 @@ def take_fermi_parser(file):  # calc_node_pk = node_conv_wfl.outputs.last_calcul
 
     return ef
 
-def yambotiming_to_seconds(yt):
-    t = 0
-    th = 0
-    tm = 0
-    ts = 0
-    if isinstance(yt, str):
-        for i in yt.replace('-',' ').split():
-         if 'h' in i:
-             th = int(i.replace('h',''))*3600
-         if 'm' in i:
-             tm = int(i.replace('m',''))*60
-         if 's' in i:
-              ts = int(i.replace('s',''))
-        t = th+tm+ts
-        return t
-    else:
-        return yt
-
-
 errors = {'memory_error':['\[ERROR\]Allocation','\[ERROR\] Allocation', '\[ERROR\]out of memory', '\[ERROR\] out of memory', '\[MEMORY\] Alloc','\[MEMORY\]Alloc'],
           'time_most_prob':['Alloc Xo%blc_d',],
           'para_error':['\[ERROR\]Incomplete','\[ERROR\]Impossible','\[ERROR\]USER parallel',
@@ -66,170 +51,11 @@ errors_raw = {'memory_error':[r'[ERROR]Allocation',r'[ERROR] Allocation', r'out
          }
 
 def parse_log(log,output_params,timing):
-    
-    
-    if 'p2y' in log.filename:    #just p2y...
-        p2y_completed = re.compile('P2Y completed')
-        for line in log.lines:
-            if p2y_completed.findall(line):
-                output_params['p2y_completed'] = True
-    
-    elif 'l_setup' in log.filename or 'l-setup' in log.filename:
-        pass
-    
-    else:
-        #Game over...
-        game_over = re.compile('Game')
-        game_over_2 = re.compile('Clock:')
-        for line in log.lines:
-            if game_over.findall(line) or game_over_2.findall(line):
-                output_params['game_over'] = True
-                break
-            else:
-                output_params['game_over'] = False
-        #timing sections...
-        timing_new = re.compile('^\s+?<([0-9a-z-]+)> ([A-Z0-9a-z-]+)[:] \[([0-9]+)\] [A-Za-z\s]+')
-        timing_old = re.compile('^\s+?<([0-9a-z-]+)> \[([0-9]+)\] [A-Za-z\s]+')
-        timing_bugs = re.compile('\[([0-9]+)\] [A-Za-z\s]+')
-        #if output_params['timing'] == []:
-        for line in log.lines:
-            if timing_bugs.findall(line):
-                output_params['timing'].append(line) #to fix for a better parsing
-            elif timing_new.match(line):
-                output_params['timing'].append(timing_new.match(line).string)
-            elif timing_old.match(line):
-                output_params['timing'].append(timing_old.match(line).string)
-            
-        time = re.compile('<([0-9hms-]+)>')
-                
-        try:
-            last_time = time.findall(log.lines[-1])[-1]
-            output_params['last_time'] = yambotiming_to_seconds(last_time)
-        except:
-            try:
-                last_time = time.findall(output_params['timing'][-1])[-1]
-                output_params['last_time'] = yambotiming_to_seconds(last_time)
-            except:
-                last_time = 0
-                output_params['last_time'] = 0
-        
-        if timing:
-            output_params['timing'].append('verbose_output:')
-            t_verbose = re.compile('^\s+?<([0-9a-z-]+)> ([A-Z0-9a-z-]+)[:] (\[TIMING\])')
-            t_verbose_old = re.compile('^\s+?<([0-9a-z-]+)> (\[TIMING\]) ')
-            for line in log.lines:
-                if t_verbose.match(line):
-                    output_params['timing'].append(t_verbose.match(line).string)
-                elif t_verbose_old.match(line):
-                    output_params['timing'].append(t_verbose_old.match(line).string)
-                    
-        #warnings
-        warning = re.compile('\[WARNING\]')      
-        #memstats...
-        memory = re.compile('^\s+?<([0-9a-z-]+)> ([A-Z0-9a-z-]+)[:] (\[MEMORY\]) ')
-        memory_old = re.compile('^\s+?<([0-9a-z-]+)> (\[MEMORY\]) ')
-        alloc1_error = re.compile('\[ERROR\]Allocation')
-        alloc2_error = re.compile('\[MEMORY\] Alloc')
-        alloc3_error = re.compile('\[MEMORY\]out of memory')
-        alloc4_error = re.compile('\[MEMORY\] out of memory')
-        incomplete_para_error = re.compile('\[ERROR\]Incomplete')
-        impossible_para_error = re.compile('\[ERROR\]Impossible')
-        impossible_para_error2 = re.compile('\[ERROR\]USER parallel')
-        incomplete_para_error_ = re.compile('\[ERROR\] Incomplete')
-        impossible_para_error_ = re.compile('\[ERROR\] Impossible')
-        impossible_para_error2_ = re.compile('\[ERROR\] USER parallel')
-        corrupted_fragment = re.compile('\[ERROR\] Writing File')
-        time_probably = re.compile('Alloc Xo%blc_d')
-        X_par_mem = re.compile('\[ERROR\]Allocation of X_par%blc_d failed')
-        X_par_mem_ = re.compile('\[ERROR\] Allocation of X_par%blc_d failed')
-        reading_explosion_of_memory = re.compile('Reading')
-        for line in log.lines:
-            if warning.match(line):
-                output_params['warnings'].append(warning.match(line).string)
-            if memory.match(line):
-                output_params['memstats'].append(memory.match(line).string)
-            if memory_old.match(line):
-                    output_params['memstats'].append(memory_old.match(line).string)
-            if  alloc1_error.findall(line):
-                output_params['memory_error'] = True
-                output_params['errors'].append('memory_general')
-            if  alloc3_error.findall(line):
-                output_params['memory_error'] = True
-                output_params['errors'].append('memory_general')
-            if  alloc4_error.findall(line):
-                output_params['memory_error'] = True
-                output_params['errors'].append('memory_general')
-            if  incomplete_para_error.findall(line) or impossible_para_error.findall(line) or impossible_para_error2.findall(line):
-                output_params['para_error'] = True
-            if  incomplete_para_error_.findall(line) or impossible_para_error_.findall(line) or impossible_para_error2_.findall(line):
-                output_params['para_error'] = True
-            if time_probably.findall(line):
-                output_params['errors'].append('time_most_prob')
-            if corrupted_fragment.findall(line):
-                output_params['errors'].append('corrupted_fragment')
-                output_params['corrupted_fragment'] = re.findall("ndb.pp_fragment_[0-9]+",line)
-        try:
-            if  reading_explosion_of_memory.findall(log.lines[-1]):
-                output_params['memory_error'] = True
-                output_params['errors'].append('memory_general')
-        except:
-            pass
-        
-        try:
-            if  alloc2_error.findall(log.lines[-1]):
-                output_params['memory_error'] = True
-                output_params['errors'].append('memory_general')
-        except:
-            pass
-
-        try:
-            if  alloc3_error.findall(log.lines[-1]):
-                output_params['memory_error'] = True
-                output_params['errors'].append('memory_general')
-        except:
-            pass
-
-        try:
-            if  alloc4_error.findall(log.lines[-1]):
-                output_params['memory_error'] = True
-                output_params['errors'].append('memory_general')
-        except:
-            pass
-        
-        try:
-            if  X_par_mem.findall(log.lines[-1]) or X_par_mem_.findall(log.lines[-1]):
-                output_params['memory_error'] = True
-                output_params['errors'].append('X_par_allocation')
-        except:
-            pass
-
-        if 'out of memory' in log.lines[-1]:
-            output_params['memory_error'] = True
-            output_params['errors'].append('memory_general')
-            
-    return output_params
+    #log.lines can also be an open file: it is consumed only once.
+    return parse_log_stream(log.filename, log.lines, output_params, timing)
 
 def parse_report(report, output_params):
-    
-    try:
-        output_params['Fermi(eV)'] = take_fermi_parser(report.lines)
-    except:
-        pass
-
-    if 'setup' in report.filename:
-        pass
-
-    else:
-        #Game over...
-        game_over = re.compile('Game')
-        game_over_2 = re.compile('Clock:')
-        gpu_support = re.compile('CUDA')
-        for line in report.lines:
-            if game_over.findall(line) or game_over_2.findall(line):
-                output_params['game_over'] = True
-        
-            if gpu_support.findall(line):
-                output_params['has_gpu'] = True
+    parse_report_stream(report.filename, report.lines, output_params)
 
 def parse_scheduler_stderr(stderr, output_params):
 
@@ -258,11 +84,21 @@ def yambo_wrote_dbs(output_params):
 def get_yambo_version(report, output_params):
     pass
 
-def parse_BS(folder,filename, save_dir):
+def parse_BS(folder,filename, save_dir, window=[0,20]):
+    #window: [emin, emax] of the spectrum in eV, or 'excitons' (only around the exciton energies, inside 0-20 eV)
     q = filename[13:]
+    emin, emax, margin = (0, 20, 20) if window == 'excitons' else (window[0], window[1], None)
     lat  = YamboLatticeDB.from_db_file(filename=save_dir+'/ns.db1')
     ydb  = YamboExcitonDB.from_db_file(filename=filename,folder=folder,lattice=lat)
-    chi = ydb.get_chi(emin=0, emax=20, estep=0.01, broad=0.15,)
+    energies, residuals = ydb.eigenvalues, ydb.l_residual*ydb.r_residual
+    #prefactor of eps from yambopy itself, on a few points around the brightest exciton
+    e0 = float(energies.real[abs(residuals).argmax()])
+    reference = ydb.get_chi(emin=e0-0.02, emax=e0+0.03, estep=0.01, broad=0.15,)
+    cofactor, error = fit_cofactor(reference[0], reference[1], energies, residuals, broad=0.15)
+    if error < 1e-3:
+        chi = bse_spectrum(energies, residuals, cofactor, broad=0.15, emin=emin, emax=emax, fine=0.01, margin=margin)
+    else: #not the same expression of yambopy: fixed grid
+        chi = ydb.get_chi(emin=emin, emax=emax, estep=0.01, broad=0.15,)
     chi_ = {'eV':chi[0],'eps_2':chi[1].imag,'eps_1':chi[1].real}
     
     excitons = {'energies':ydb.eigenvalues.real,
@@ -22,15 +22,15 @@ from yamboparser.yambofolder import *
 from aiida_yambo.calculations.yambo import YamboCalculation
 from aiida_yambo.utils.common_helpers import *
 from aiida_yambo.parsers.utils import *
+from aiida_yambo.parsers.log_engine import yambo_output_type, parse_output_file
+from aiida_yambo.parsers.repository import RetrievedReader, is_yambo_output
 
 from aiida_quantumespresso.calculations.pw import PwCalculation
 from aiida_quantumespresso.calculations import _lowercase_dict, _uppercase_dict
 from six.moves import range
 import cmath
-import netCDF4
-
-import pathlib
-import tempfile
+from aiida_yambo.utils.lazy import lazy_import
+netCDF4 = lazy_import('netCDF4')
 
 __copyright__ = u"Copyright (c), 2014-2015, École Polytechnique Fédérale de Lausanne (EPFL), Switzerland, Laboratory of Theory and Simulation of Materials (THEOS). All rights reserved."
 __license__ = "Non-Commercial, End-User Software License Agreement, see LICENSE.txt file"
@@ -151,36 +151,35 @@ class YppParser(Parser):
         ndbqp = {}
         ndbhf = {}
 
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as dirpath:
-            # Open the output file from the AiiDA storage and copy content to the temporary file
-            for filename in retrieved.base.repository.list_object_names():
-                # Create the file with the desired name
-                temp_file = pathlib.Path(dirpath) / filename
-                with retrieved.open(filename, 'rb') as handle:
-                    temp_file.write_bytes(handle.read())
+        # Only the files needed by a given step are materialized on disk
+        with RetrievedReader(retrieved) as reader:
 
             count_merged = 0
-            for filename in os.listdir(dirpath):
+            for filename in reader.names:
                 if 'ndb.QP_merged' in filename:
                     count_merged +=1
-            for filename in os.listdir(dirpath):
+            for filename in reader.names:
                 if 'stderr' in filename:
-                    with open(dirpath+"/"+filename,'r') as stderr:
+                    with reader.open(filename) as stderr:
                         parse_scheduler_stderr(stderr, output_params)
+                elif yambo_output_type(filename):
+                    with reader.open(filename) as handle:
+                        parse_output_file(filename, handle, output_params, timing = verbose_timing)
                 if 'unsorted' in filename:
-                    unsorted_eig = SingleFileData(dirpath+"/"+filename)
+                    with reader.open(filename, 'rb') as handle:
+                        unsorted_eig = SingleFileData(handle, filename=filename)
                     self.out(self._unsorted_eig_wannier,unsorted_eig)
                     #self.report('stored the unsorted.eig file as SingleFileData')
                 if 'ndb.QP_merged' in filename:
                     if count_merged>1:
                         return self.exit_codes.MERGE_NOT_COMPLETE
                     else:
-                        QP_db = SingleFileData(dirpath+"/"+filename)
+                        with reader.open(filename, 'rb') as handle:
+                            QP_db = SingleFileData(handle, filename=filename)
                         self.out(self._QP_merged_linkname,QP_db)  
 
             try:
-                results = YamboFolder(dirpath)
+                results = YamboFolder(reader.materialize(reader.select(is_yambo_output)))
             except Exception as e:
                 success = False
                 return self.exit_codes.PARSER_ANOMALY
@@ -191,10 +190,8 @@ class YppParser(Parser):
                     continue
     
                 #This should be automatic in yambopy...
-                if result.type=='log':
-                    parse_log(result, output_params, timing = verbose_timing)
-                if result.type=='report':
-                    parse_report(result, output_params)
+                if result.type in ['log','report']: #already streamed from the repository
+                    continue
     
                 if 'electrons' in input_params['arguments'] and 'interpolated' in result.filename:
                     if self._aiida_bands_data(result.data, cell, result.kpoints):
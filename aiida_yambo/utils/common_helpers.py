@@ -2,14 +2,20 @@
 """helpers for many purposes"""
 from __future__ import absolute_import
 import numpy as np
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
 import os
+import json
+import hashlib
+from functools import lru_cache
 
 try:
     from aiida.orm import Dict, Str, List, load_node, KpointsData, RemoteData, Group
+    from aiida.orm import QueryBuilder, Node, CalcJobNode, WorkflowNode
     from aiida.plugins import CalculationFactory, DataFactory
     from aiida.engine import calcfunction 
 except:
@@ -27,7 +33,9 @@ def find_parent(calc):
         raise Exception('No creator found for parent_folder {}'.format(parent_calc))
     return parent_calc
 
-def find_pw_parent(parent_calc, calc_type = ['scf', 'nscf']):
+PW_PROCESS_TYPE = 'aiida.calculations:quantumespresso.pw'
+
+def walk_pw_parent(parent_calc, calc_type = ['scf', 'nscf']):
 
     has_found_pw = False
     tentatives=0
@@ -39,7 +47,7 @@ def find_pw_parent(parent_calc, calc_type = ['scf', 'nscf']):
             has_found_pw = False
             parent_calc = find_parent(parent_calc)
 
-        if parent_calc.process_type=='aiida.calculations:quantumespresso.pw' and \
+        if parent_calc.process_type==PW_PROCESS_TYPE and \
             find_pw_type(parent_calc) in calc_type:
             has_found_pw = True
             break
@@ -50,6 +58,70 @@ def find_pw_parent(parent_calc, calc_type = ['scf', 'nscf']):
             break
 
     return parent_calc
+
+def query_pw_parent(calc, calc_type = ['scf', 'nscf']):
+    """Closest PwCalculation of the given type along the parent_folder chain of calc.
+
+    One query: the closure over the ancestors of the parent_folder of calc gives every
+    calculation that can be on the chain, each with its process type, the type of
+    PW calculation (CONTROL.calculation) and the creator of its own parent_folder.
+    The chain is then followed in memory, only through parent_folder links as in
+    walk_pw_parent. None if it ends without a matching PwCalculation.
+    """
+    if 'workflows' in calc.process_type: #workflows are not in the data provenance
+        calc = find_parent(calc)
+    if calc.process_type==PW_PROCESS_TYPE and find_pw_type(calc) in calc_type:
+        return calc
+
+    qb = QueryBuilder()
+    qb.append(CalcJobNode, filters={'id': calc.pk}, tag='calc')
+    qb.append(RemoteData, with_outgoing='calc', edge_filters={'label': 'parent_folder'}, tag='remote')
+    qb.append(CalcJobNode, with_outgoing='remote', project=['id'])
+    qb.append(CalcJobNode, with_descendants='remote', tag='ancestor', project=['id', 'process_type'])
+    qb.append(Dict, with_outgoing='ancestor', edge_filters={'label': 'parameters'},
+              project=['attributes.CONTROL.calculation'], outerjoin=True)
+    qb.append(RemoteData, with_outgoing='ancestor', edge_filters={'label': 'parent_folder'},
+              tag='ancestor_remote', outerjoin=True)
+    qb.append(CalcJobNode, with_outgoing='ancestor_remote', project=['id'], outerjoin=True)
+
+    chain, pk = {}, None
+    for first, ancestor, process_type, pw_type, parent in qb.iterall():
+        pk = first
+        chain[ancestor] = (process_type, pw_type, parent)
+    while pk in chain:
+        process_type, pw_type, parent = chain.pop(pk)
+        if process_type==PW_PROCESS_TYPE and pw_type in calc_type:
+            return load_node(pk)
+        pk = parent
+    return None
+
+@lru_cache(maxsize=1024)
+def _pw_parent_pk(pk, calc_type):
+    calc = load_node(pk)
+    extra = 'pw_parent_'+'_'.join(calc_type)
+    uuid = calc.base.extras.get(extra, None)
+    if uuid:
+        return load_node(uuid).pk
+    parent = query_pw_parent(calc, calc_type)
+    if parent is None:
+        parent = walk_pw_parent(calc, calc_type)
+    return parent.pk
+
+def find_pw_parent(parent_calc, calc_type = ['scf', 'nscf'], store_extra = False):
+    """Resolve the PwCalculation parent (scf/nscf) of a yambo calculation/workflow.
+
+    Results are cached per process by (pk, calc_type). With store_extra=True the
+    resolved parent is also persisted as extra 'pw_parent_<types>' on parent_calc,
+    so that it is found without queries also in other processes.
+    """
+    if not parent_calc.is_stored:
+        return walk_pw_parent(parent_calc, calc_type)
+    calc_type = tuple(calc_type)
+    pw_parent = load_node(_pw_parent_pk(parent_calc.pk, calc_type))
+    extra = 'pw_parent_'+'_'.join(calc_type)
+    if store_extra and parent_calc.base.extras.get(extra, None) != pw_parent.uuid:
+        parent_calc.base.extras.set(extra, pw_parent.uuid)
+    return pw_parent
     
 def old_find_parent(calc):
 
@@ -92,30 +164,17 @@ def old_find_pw_parent(parent_calc, calc_type = ['scf', 'nscf']):
 
 def get_distance_from_kmesh(calc):
     mesh = calc.inputs.kpoints.get_kpoints_mesh()[0]
-    print(mesh)
     k = KpointsData()
     k.set_cell_from_structure(calc.inputs.structure) #these take trace of PBC...if set in the inputs.!!
-    for i in range(4,400):
-         k.set_kpoints_mesh_from_density(1/(i*0.25))
-         print(k.get_kpoints_mesh()[0])
-         if k.get_kpoints_mesh()[0]==mesh:
-             print('ok, {} is the density'.format(i*0.25))
-             print(k.get_kpoints_mesh()[0],mesh)
-             return i*0.25
-         else: #try the same algorithm but using force_parity=True.
-            k.set_kpoints_mesh_from_density(1/(i*0.25),force_parity=True)
-            print(k.get_kpoints_mesh()[0])
-            if k.get_kpoints_mesh()[0]==mesh:
-                print('ok, {} is the density'.format(i*0.25))
-                print(k.get_kpoints_mesh()[0],mesh)
-                return i*0.25 
+    return density_from_kmesh(mesh, np.linalg.norm(k.reciprocal_cell, axis=1), k.pbc)
 
 def find_pw_type(calc):
     type = calc.inputs.parameters.get_dict()['CONTROL']['calculation']
     return type
 
 def find_table_ind(kpoint,band,_array_ndb):
-    kk = _array_ndb.get_array('qp_table')
+    #_array_ndb: the ArrayData or its arrays as a dict (see utils/ndb_cache.py)
+    kk = _array_ndb['qp_table'] if isinstance(_array_ndb, dict) else _array_ndb.get_array('qp_table')
     #in the qp table:
     index_b = -1
     index_k = 0
@@ -659,6 +718,105 @@ def check_same_pw(node, k_mesh_to_calc, already_done, bands = None):
     
     return parent_nscf, parent_scf   
 
+FINGERPRINT_EXTRA = 'yambo_fingerprint'
+CONTEXT_EXTRA = 'yambo_context'
+UNINDEXED = 'unavailable' #context of the nodes whose fingerprint cannot be computed, not tried again
+YAMBOWF_PROCESS_TYPE = 'aiida.workflows:yambo.yambo.yambowf'
+YAMBOCONV_PROCESS_TYPE = 'aiida.workflows:yambo.yambo.yamboconvergence'
+
+def _normalize(value, digits=8):
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v, digits) for v in value]
+    if isinstance(value, float):
+        return float('{:.{}g}'.format(value, digits))
+    return value
+
+def _hash(canonical):
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+def _canonical_mesh(k_mesh):
+    return [list(k_mesh[0]), _normalize([round(float(o), 6) for o in k_mesh[1]])]
+
+def yambo_context(k_mesh, code=None, structure=None):
+    """Hash of what has to be the same to reuse a YamboWorkflow, whatever the variables:
+    the k-mesh and offset rounded, the yambo code uuid and the hash of the PW structure."""
+    return _hash({'k_mesh': _canonical_mesh(k_mesh), 'code': code, 'structure': structure})
+
+def yambo_fingerprint(variables, k_mesh, code=None, structure=None):
+    """Canonical hash of a YamboWorkflow: the context (see yambo_context) plus all the yambo
+    variables with their units, the energies in Ry (parallelism and QPkrange excluded).
+
+    Two workflows with the same fingerprint are the same calculation (it identifies the
+    speculative runs in flight); search_in_group is less strict, see same_variables.
+    """
+    canonical = {'variables': {k: _normalize(list(normalized(v)))
+                               for k, v in variables.items()
+                               if not ('CPU' in k or 'ROLEs' in k or 'PAR_' in k or 'QPkrange' in k)},
+                 'k_mesh': _canonical_mesh(k_mesh),
+                 'code': code,
+                 'structure': structure}
+    return _hash(canonical)
+
+def _yambowf_inputs(inputs):
+    #works both for node.inputs and for the inputs of a not yet submitted YamboWorkflow
+    try:
+        return inputs.nscf.kpoints, inputs.yres.yambo.parameters, inputs.yres.yambo.code, inputs.scf.pw.structure
+    except AttributeError:
+        return inputs.nscf__kpoints, inputs.yres__yambo__parameters, inputs.yres__yambo__code, inputs.scf__pw__structure
+
+def fingerprint_from_inputs(inputs):
+    kpoints, parameters, code, structure = _yambowf_inputs(inputs)
+    return yambo_fingerprint(parameters.get_dict()['variables'], kpoints.get_kpoints_mesh(),
+                             code=code.uuid, structure=structure.base.caching.get_hash())
+
+def context_from_inputs(inputs):
+    kpoints, parameters, code, structure = _yambowf_inputs(inputs)
+    return yambo_context(kpoints.get_kpoints_mesh(), code=code.uuid, structure=structure.base.caching.get_hash())
+
+def set_fingerprint(node):
+    """Store the fingerprint and the context of a YamboWorkflow as extras; None if they cannot be computed."""
+    try:
+        fingerprint = fingerprint_from_inputs(node.inputs)
+        context = context_from_inputs(node.inputs)
+    except Exception:
+        return None
+    node.base.extras.set_many({FINGERPRINT_EXTRA: fingerprint, CONTEXT_EXTRA: context})
+    return fingerprint
+
+def _group_yambowf_query(group, filters, project='id', inputs={}):
+    #YamboWorkflows in the group, directly or called by a YamboConvergence of the group.
+    #inputs: {link label: [projections]} of input nodes joined in the same query, the rows are then lists.
+    found = []
+    for through_convergence in [False, True]:
+        qb = QueryBuilder()
+        qb.append(Group, filters={'id': group.pk}, tag='group')
+        if through_convergence:
+            qb.append(WorkflowNode, with_group='group', filters={'process_type': YAMBOCONV_PROCESS_TYPE}, tag='conv')
+            qb.append(WorkflowNode, with_incoming='conv', filters=dict(filters, process_type=YAMBOWF_PROCESS_TYPE), project=[project], tag='wf')
+        else:
+            qb.append(WorkflowNode, with_group='group', filters=dict(filters, process_type=YAMBOWF_PROCESS_TYPE), project=[project], tag='wf')
+        for label, projections in inputs.items():
+            qb.append(Node, with_outgoing='wf', edge_filters={'label': label}, project=list(projections))
+        found += qb.all(flat=not inputs)
+    return found
+
+def index_group(group):
+    """Set the extras of the YamboWorkflows of the group created before they were introduced (once)."""
+    for pk in _group_yambowf_query(group, {'extras': {'!has_key': CONTEXT_EXTRA}}):
+        node = load_node(pk)
+        if set_fingerprint(node) is None:
+            node.base.extras.set(CONTEXT_EXTRA, UNINDEXED)
+
+def same_variables(old_variables, params_to_calc, what):
+    """The comparison of check_same_yambo: the values of the variables in what are the same
+    (the old calculation can have more variables); parallelism and QPkrange are not compared here."""
+    for p in what:
+        if 'CPU' in p or 'ROLEs' in p or 'PAR_' in p or 'QPkrange' in p:
+            continue
+        if p not in old_variables or params_to_calc[p][0] != old_variables[p][0]:
+            return False
+    return True
+
 def search_in_group(YamboWorkflow_inputs, 
                                 YamboWorkflow_group,
                                 what=['BndsRnXp','GbndRnge','NGsBlkXp'],
@@ -701,26 +859,73 @@ def search_in_group(YamboWorkflow_inputs,
                     what.remove(p) 
         print(what)
     
-    for old in YamboWorkflow_group.nodes:
-        if old.process_type == 'aiida.workflows:yambo.yambo.yamboconvergence':
-            for i in old.called:
-                already_done = check_same_yambo(i, params_to_calc,k_mesh_to_calc,what,up_to_p2y=up_to_p2y,full=full, bands=bands)
+    #one query for the finished YamboWorkflows with the same k-mesh, code and structure, with their variables;
+    #up to p2y only the k-mesh matters, whatever the variables (as in check_same_yambo)
+    try:
+        if up_to_p2y:
+            same_k = [list(k_mesh_to_calc[0]), list(k_mesh_to_calc[1])]
+            rows = [(pk, None) for pk, mesh, offset in _group_yambowf_query(YamboWorkflow_group, {'attributes.exit_status': 0},
+                                inputs={'nscf__kpoints': ['attributes.mesh', 'attributes.offset']})
+                    if [list(mesh or []), list(offset or [])] == same_k]
+        else:
+            index_group(YamboWorkflow_group)
+            rows = _group_yambowf_query(YamboWorkflow_group, {'attributes.exit_status': 0,
+                                                              'extras.{}'.format(CONTEXT_EXTRA): context_from_inputs(YamboWorkflow_inputs)},
+                                        inputs={'yres__yambo__parameters': ['attributes.variables']})
+    except Exception:
+        rows = None
+    
+    if rows is not None:
+        #the variables in what are compared on the projected parameters, only the matching nodes
+        #are loaded to check the bands, additional parsing and p2y conditions
+        for pk, old_variables in sorted(rows, key=lambda row: row[0]):
+            if up_to_p2y or same_variables(old_variables or {}, params_to_calc, what):
+                already_done = check_same_yambo(load_node(pk), params_to_calc,k_mesh_to_calc,what,up_to_p2y=up_to_p2y,full=full,additional = additional, bands=bands)
                 if already_done: break
-
-        elif old.process_type == 'aiida.workflows:yambo.yambo.yambowf':
-            already_done = check_same_yambo(old, params_to_calc,k_mesh_to_calc,what,up_to_p2y=up_to_p2y,full=full,additional = additional, bands=bands)        
-        if already_done: break
+    else:
+        for old in YamboWorkflow_group.nodes:
+            if old.process_type == 'aiida.workflows:yambo.yambo.yamboconvergence':
+                for i in old.called:
+                    already_done = check_same_yambo(i, params_to_calc,k_mesh_to_calc,what,up_to_p2y=up_to_p2y,full=full, bands=bands)
+                    if already_done: break
+
+            elif old.process_type == 'aiida.workflows:yambo.yambo.yambowf':
+                already_done = check_same_yambo(old, params_to_calc,k_mesh_to_calc,what,up_to_p2y=up_to_p2y,full=full,additional = additional, bands=bands)        
+            if already_done: break
+    
+    if already_done:
+        return already_done, parent_nscf, parent_scf
+    
+    #PW parents: k-mesh and bands of every YamboWorkflow of the group from the same query, only the
+    #candidates are loaded; those with the same k-mesh first, they can give also the nscf
+    try:
+        rows = _group_yambowf_query(YamboWorkflow_group, {}, inputs={'nscf__kpoints': ['attributes.mesh', 'attributes.offset'],
+                                                                     'nscf__pw__parameters': ['attributes.SYSTEM.nbnd']})
+    except Exception:
+        rows = None
+
+    if rows is not None:
+        same_k = [list(k_mesh_to_calc[0]), list(k_mesh_to_calc[1])]
+        candidates = sorted((not [list(mesh or []), list(offset or [])] == same_k, pk)
+                            for pk, mesh, offset, nbnd in rows if not bands or (nbnd or 0) >= bands)
+        for other_k, pk in candidates:
+            nscf, scf = check_same_pw(load_node(pk), k_mesh_to_calc, already_done, bands=bands)
+            parent_scf = scf or parent_scf
+            if nscf:
+                parent_nscf = nscf
+                break
+            if other_k and parent_scf: break
+    else:
+        for old in YamboWorkflow_group.nodes:
+            if old.process_type == 'aiida.workflows:yambo.yambo.yamboconvergence':
+                for i in old.called:
+                    parent_nscf, parent_scf = check_same_pw(i, k_mesh_to_calc, already_done, bands=bands)
+                    if parent_nscf: break
             
-    for old in YamboWorkflow_group.nodes:
-        if old.process_type == 'aiida.workflows:yambo.yambo.yamboconvergence':
-            for i in old.called:
-                parent_nscf, parent_scf = check_same_pw(i, k_mesh_to_calc, already_done, bands=bands)
-                if parent_nscf: break
-        
-        elif old.process_type == 'aiida.workflows:yambo.yambo.yambowf':
-            parent_nscf, parent_scf = check_same_pw(old, k_mesh_to_calc, already_done, bands=bands)
-        
-        if parent_nscf: break
+            elif old.process_type == 'aiida.workflows:yambo.yambo.yambowf':
+                parent_nscf, parent_scf = check_same_pw(old, k_mesh_to_calc, already_done, bands=bands)
+            
+            if parent_nscf: break
 
     return already_done, parent_nscf, parent_scf  
 
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Which yambo databases are still valid when the input parameters change.
+
+Each database depends only on some input variables: changing the self-energy
+bands (GbndRnge) or the k-points of the corrections (QPkrange) does not change
+the screening (ndb.pp, ndb.em1d, ndb.em1s) nor the dipoles, so a calculation
+can start from the databases of a previous one (COPY_DBS) and skip the most
+expensive step. Yambo itself checks the headers of the databases it reads, the
+analysis here only decides when copying them is worth it. Unknown variables,
+and arguments that are not runlevels (e.g. rim_cut), invalidate everything.
+
+Parameters are the yambo parameters dicts ({'arguments': [...], 'variables': {...}})
+or directly the variables dicts; the values are compared with their units, the
+energies after the conversion to Ry ([4, 'Ry'] and [4000, 'mRy'] are the same).
+"""
+from __future__ import absolute_import
+import shlex
+from aiida_yambo.utils.units import normalized
+
+GLOBAL = ['FFTGvecs', 'RandQpts', 'RandGvec', 'CUTGeo', 'CUTBox', 'CUTRadius', 'CUTCylLen',
+          'CUTwsGvec', 'ElecTemp', 'BoseTemp', 'Nelectro']
+
+DIPOLES = ['DipBands', 'DipApproach', 'DipComputed', 'DipoleEtimeS', 'ShiftedPaths',
+           'BndsRnXp', 'BndsRnXd', 'BndsRnXs', 'BSEBands']
+
+SCREENING = ['Chimod', 'XTermKind', 'XTermEn', 'QpntsRXp', 'QpntsRXd', 'QpntsRXs',
+             'XfnQPdb', 'XfnQP_E', 'XfnQP_Z', 'XfnQP_Wv', 'XfnQP_Wc', 'XfnQP_Wv_E', 'XfnQP_Wc_E']
+
+DB_DEPENDENCIES = {
+    'ndb.dipoles': GLOBAL+DIPOLES,
+    'ndb.pp': GLOBAL+DIPOLES+SCREENING+['BndsRnXp', 'NGsBlkXp', 'LongDrXp', 'EhEngyXp', 'PPAPntXp', 'GrFnTpXp', 'DrudeWXp', 'CGrdSpXp'],
+    'ndb.em1d': GLOBAL+DIPOLES+SCREENING+['BndsRnXd', 'NGsBlkXd', 'LongDrXd', 'EhEngyXd', 'ETStpsXd', 'EnRngeXd', 'DmRngeXd',
+                                          'GrFnTpXd', 'DrudeWXd', 'CGrdSpXd'],
+    'ndb.em1s': GLOBAL+DIPOLES+SCREENING+['BndsRnXs', 'NGsBlkXs', 'LongDrXs', 'EhEngyXs', 'GrFnTpXs', 'DrudeWXs', 'CGrdSpXs'],
+    'ndb.HF_and_locXC': GLOBAL+['EXXRLvcs', 'VXCRLvcs', 'QPkrange', 'QPerange', 'UseNLCC'],
+}
+SCREENING_DBS = ['ndb.pp', 'ndb.em1d', 'ndb.em1s']
+
+#databases written by each runlevel (the dipoles are computed whenever there is a screening)
+RUNLEVEL_DBS = {
+    'dipoles': ['ndb.dipoles'],
+    'ppa': ['ndb.pp', 'ndb.dipoles'],
+    'em1d': ['ndb.em1d', 'ndb.dipoles'],
+    'em1s': ['ndb.em1s', 'ndb.dipoles'],
+    'HF_and_locXC': ['ndb.HF_and_locXC'],
+}
+RUNLEVELS = list(RUNLEVEL_DBS.keys())+['gw0', 'dyson', 'life', 'bse', 'bss', 'optics', 'tddft']
+
+#variables entering only in what is recomputed anyway (self-energy, QP and BSE solvers, output)
+RECOMPUTED = ['GbndRnge', 'GTermKind', 'GTermEn', 'DysSolver', 'GDamping', 'dScStep', 'GDmRnge', 'GWoIter', 'GWIter',
+              'NewtDchk', 'ExtendOut', 'OnMassShell', 'QPExpand', 'NLogCPUs',
+              'BSEmod', 'BSKmod', 'BSSmod', 'BSENGexx', 'BSENGBlk', 'BEnRange', 'BDmRange', 'BEnSteps', 'BLongDir',
+              'BSEQptR', 'BSHayTrs', 'BSSNEig', 'BSSEnTarget', 'BSSSlepcMaxIt', 'BSEprop', 'BSEdips', 'Lkind', 'WRbsWF']
+
+def is_parallel(variable):
+    """Parallelism and I/O variables, they do not change any result."""
+    return 'CPU' in variable or 'ROLEs' in variable or 'PAR_' in variable or 'Threads' in variable
+
+def _value(value):
+    return None if value is None else normalized(value)
+
+def _split(parameters):
+    if 'variables' in parameters or 'arguments' in parameters:
+        return list(parameters.get('arguments', [])), parameters.get('variables', {})
+    return [], parameters
+
+def changed_variables(old, new):
+    """Variables (parallelism excluded) whose value differs between old and new parameters."""
+    old_variables, new_variables = _split(old)[1], _split(new)[1]
+    return sorted(v for v in set(old_variables) | set(new_variables)
+                  if not is_parallel(v) and _value(old_variables.get(v)) != _value(new_variables.get(v)))
+
+def invalidated_dbs(old, new):
+    """Databases written with the old parameters that are not valid for the new ones."""
+    (old_arguments, _), (new_arguments, _) = _split(old), _split(new)
+    changed = changed_variables(old, new)
+    known = set(RECOMPUTED).union(*DB_DEPENDENCIES.values())
+    if set(old_arguments) - set(RUNLEVELS) != set(new_arguments) - set(RUNLEVELS) \
+            or any(variable not in known for variable in changed):
+        return sorted(DB_DEPENDENCIES)
+    return sorted(db for db, dependencies in DB_DEPENDENCIES.items() if set(changed) & set(dependencies))
+
+def written_dbs(parameters):
+    arguments = _split(parameters)[0]
+    return sorted(set(db for runlevel in arguments for db in RUNLEVEL_DBS.get(runlevel, [])))
+
+def reusable_dbs(old, new):
+    """Databases written by a calculation with the old parameters that one with the new
+    parameters needs and can read instead of computing them again."""
+    invalid = invalidated_dbs(old, new)
+    return [db for db in written_dbs(old) if db in written_dbs(new) and db not in invalid]
+
+def copy_dbs_script(source, dbs, target='aiida.out'):
+    """Job script lines copying only the databases dbs (and their fragments) from the source folder
+    (the aiida.out of the parent), used by COPY_DBS when it is a list of databases."""
+    source, target = shlex.quote(source.rstrip('/')), shlex.quote(target)
+    files = ' '.join('{s}/{db} {s}/{db}_fragment_*'.format(s=source, db=shlex.quote(db)) for db in dbs)
+    return '\n'.join([
+        '# databases {} from {}'.format(' '.join(dbs), source),
+        'mkdir -p {}'.format(target),
+        'for f in {}; do'.format(files),
+        '    if [ -e "$f" ]; then cp "$f" {}/ ; fi'.format(target),
+        'done',
+        '',
+    ])
@@ -2,12 +2,15 @@
 """helpers for k_path"""
 from __future__ import absolute_import
 import numpy as np
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
 import os
 from itertools import permutations
+from functools import lru_cache
 
 try:
     from aiida.orm import Dict, Str, List, load_node, KpointsData, RemoteData, Group
@@ -16,6 +19,100 @@ try:
 except:
     pass
 
+#the 27 cells around (and including) a cell of the KPointIndex hash map
+_NEIGHBOURS = np.array([[i,j,k] for i in (-1,0,1) for j in (-1,0,1) for k in (-1,0,1)])
+
+class KPointIndex():
+    """Index of the k-points of a grid, to find the ones equivalent to a given point.
+
+    Two k-points are equivalent if a permutation of the absolute values of the
+    coordinates of one is within tol (squared distance) of the other's, as in the
+    loops over permutations used before. The key of a k-point is then its sorted
+    absolute coordinates; keys are stored in a hash map of cells of side sqrt(tol),
+    so a lookup checks only the neighbouring cells instead of the whole grid.
+    With periodic=True the (crystal) coordinates are first brought to [-0.5,0.5),
+    i.e. k-points differing by a reciprocal lattice vector are equivalent too.
+    """
+
+    def __init__(self, grid, tol=1e-4, periodic=False):
+        self.tol = tol
+        self.periodic = periodic
+        self.side = np.sqrt(tol)
+        self.keys = self.canonical(grid)
+        self.cells = {}
+        for i, cell in enumerate(map(tuple, np.floor(self.keys/self.side).astype(np.int64))):
+            self.cells.setdefault(cell, []).append(i)
+
+    def canonical(self, kpoints):
+        k = np.atleast_2d(np.asarray(kpoints, dtype=float))
+        if self.periodic: k = k - np.floor(k+0.5)
+        return np.sort(abs(k), axis=1)
+
+    def find(self, point):
+        """Indices (0-based, increasing) of the k-points of the grid equivalent to point."""
+        key = self.canonical(point)[0]
+        cell = np.floor(key/self.side).astype(np.int64)
+        candidates = np.array([i for shift in _NEIGHBOURS for i in self.cells.get(tuple(cell+shift), [])], dtype=int)
+        if len(candidates) == 0: return []
+        d = self.keys[candidates]-key
+        return sorted(candidates[np.einsum('ij,ij->i', d, d) < self.tol].tolist())
+
+@lru_cache(maxsize=8)
+def _kpoint_index(data, shape, tol, periodic):
+    return KPointIndex(np.frombuffer(data).reshape(shape), tol, periodic)
+
+def kpoint_index(grid, tol=1e-4, periodic=False):
+    """KPointIndex of grid, reused for the same grid (e.g. the nscf k-points in gap_mapping_from_nscf)."""
+    grid = np.ascontiguousarray(grid, dtype=float)
+    return _kpoint_index(grid.tobytes(), grid.shape, tol, periodic)
+
+################################ k-mesh <-> density ##############################
+# densities are the inverse of the distances of KpointsData.set_kpoints_mesh_from_density,
+# which builds the mesh as max(ceil(round(|b_i|/distance, 5)), 1) along the periodic directions.
+
+DENSITY_GRID = np.arange(4, 400)*0.25
+
+def mesh_from_density(reciprocal_norms, pbc, density, force_parity=False):
+    """k-mesh of set_kpoints_mesh_from_density(1/density); density can be an array (one mesh per row)."""
+    norms = np.asarray(reciprocal_norms, dtype=float)
+    distance = 1/np.asarray(density, dtype=float)[..., None]
+    mesh = np.maximum(np.ceil(np.round(norms/distance, 5)), 1).astype(int)
+    if force_parity: mesh = mesh + mesh % 2
+    return np.where(np.asarray(pbc, dtype=bool), mesh, 1)
+
+def density_interval(mesh, reciprocal_norms, pbc, force_parity=False):
+    """(lower, upper) densities giving mesh, None if no density gives it. The bounds include the
+    rounding to 5 decimals of set_kpoints_mesh_from_density; a density on them has to be checked."""
+    mesh = np.asarray(mesh, dtype=int)
+    norms = np.asarray(reciprocal_norms, dtype=float)
+    pbc = np.asarray(pbc, dtype=bool)
+    if (mesh[~pbc] != 1).any() or (mesh < 1).any(): return None
+    if force_parity and (mesh[pbc] % 2).any(): return None
+    below = mesh[pbc] - (2 if force_parity else 1) #largest mesh that must not be reached
+    lower = max(np.max((below+5e-6)/norms[pbc], initial=0), 0)
+    upper = np.min((mesh[pbc]+5e-6)/norms[pbc], initial=np.inf)
+    return (lower, upper) if lower < upper else None
+
+def density_from_kmesh(mesh, reciprocal_norms, pbc, densities=DENSITY_GRID):
+    """Smallest of densities (increasing) giving mesh, with or without force_parity; None if none."""
+    densities = np.asarray(densities, dtype=float)
+    mesh = np.asarray(mesh, dtype=int)
+    found, exact = [], True
+    for parity in (False, True):
+        interval = density_interval(mesh, reciprocal_norms, pbc, parity)
+        if interval is None: continue
+        i = np.searchsorted(densities, interval[0]) #the lower edge itself may round up
+        if i == len(densities) or densities[i] > interval[1]: continue
+        if (mesh_from_density(reciprocal_norms, pbc, densities[i], parity) == mesh).all():
+            found.append(densities[i])
+        else:
+            exact = False
+    if exact: return float(min(found)) if found else None
+    #a density exactly at the edge of the rounding: check all of them
+    match = (mesh_from_density(reciprocal_norms, pbc, densities) == mesh).all(-1) | \
+            (mesh_from_density(reciprocal_norms, pbc, densities, True) == mesh).all(-1)
+    return float(densities[match][0]) if match.any() else None
+
 class k_path_dealer():
     
     def __init__(self):
@@ -53,25 +150,16 @@ class k_path_dealer():
     
     def check_kpoints_in_bare_mesh(self,mesh,kcell,structure,k_list={}):
         grid = self.get_mesh(mesh, kcell)
+        index = kpoint_index(grid)
         cell = structure.get_cell()
         k = cell.bandpath()
         high_symmetry = k.special_points
         missing = [] 
         maps = {}
         for point in high_symmetry.keys():
-            ind = 1 
-            found = False
-            for g in qe_grid:
-                if np.allclose(abs(high_symmetry[point]),abs(g),1e-4,1e-4):    #1e-4,1e-4):
-                    found = True
-                    maps[point] = ind
-                    break
-                elif abs(high_symmetry[point][0])-abs(g[1])<1e-4 and abs(high_symmetry[point][1])-abs(g[0])<1e-4 \
-                        and abs(high_symmetry[point][2])-abs(g[2])<1e-4 :    #1e-4,1e-4):
-                    found = True
-                    maps[point] = ind
-                    break
-                ind += 1
+            found = index.find(high_symmetry[point])
+            if found:
+                maps[point] = found[0]+1
             #if not found:
             #    if point not in missing: missing.append(point)
         
@@ -83,23 +171,13 @@ class k_path_dealer():
         k = cell.bandpath()
         high_symmetry = k.special_points
         high_symmetry.update(k_list)
+        index = kpoint_index(qe_grid)
         missing = []
         maps = {}
         for point in high_symmetry.keys():
-            ind = 1 
-            found = False
-            for g in qe_grid:
-                for k in permutations(g):
-                    test = abs(abs(np.array(k))-abs(high_symmetry[point]))
-                    if test.dot(test) < 1e-4:
-                        print(point,ind)
-                        found = True
-                        maps[point] = ind
-                        break
-                else:
-                    found = False
-
-                ind += 1
+            for ind in index.find(high_symmetry[point]):
+                print(point,ind+1)
+                maps[point] = ind+1 #the last one found
             #if not found:
             #    if point not in missing: missing.append(point)
                     
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Lazy imports of the heavy libraries (matplotlib, scipy, pandas, xarray, yambopy...).
+
+The plugin modules are imported by every `verdi` command and daemon worker that
+loads the entry points, so these libraries are bound at module level as proxies
+and really imported only the first time they are used:
+
+    plt = lazy_import('matplotlib.pyplot')
+    curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+"""
+from __future__ import absolute_import
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Module imported at the first attribute access."""
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+
+    def _load(self):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__) #next accesses do not pass through __getattr__
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+class LazyAttribute():
+    """Attribute (function, class, constant) of a module imported at the first use."""
+
+    def __init__(self, module, attribute):
+        self.__dict__['_lazy'] = (module, attribute)
+
+    def _load(self):
+        if '_target' not in self.__dict__:
+            module, attribute = self.__dict__['_lazy']
+            self.__dict__['_target'] = getattr(importlib.import_module(module), attribute)
+        return self.__dict__['_target']
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        return '<lazy {}.{}>'.format(*self.__dict__['_lazy'])
+
+
+def lazy_import(module, attribute=None):
+    """Proxy of module (or of module.attribute) that imports it when it is first used."""
+    if attribute is None:
+        return LazyModule(module)
+    return LazyAttribute(module, attribute)
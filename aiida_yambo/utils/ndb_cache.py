@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Process-level cache of the decoded QP databases used in the post-processing.
+
+The helpers of the workflows (sanity_check_QP, QP_analyzer, parse_qp_level,
+parse_qp_gap, FD_and_scissored_db...) read the same ndb.QP, or the same
+array_ndb, several times in a single pass. Here each database is decoded once
+and kept in a LRU bounded in bytes. Stored nodes are immutable, so they are keyed
+by uuid and file name without reading them; files on disk and bytes are keyed by
+the hash of their content, and unstored nodes are not cached.
+
+    db = qp_dataset(calc.outputs.QP_db)          # xarray.Dataset, loaded in memory
+    qp = qp_variables(calc.outputs.QP_db)        # {name: numpy array}, netCDF4 only
+    arrays = ndb_arrays(calc.outputs.array_ndb)  # {name: numpy array}
+"""
+from __future__ import absolute_import
+import hashlib
+from collections import OrderedDict
+
+from aiida_yambo.utils.lazy import lazy_import
+xarray = lazy_import('xarray')
+netCDF4 = lazy_import('netCDF4')
+
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(getattr(v, 'nbytes', 0) for v in value.values())
+    return int(getattr(value, 'nbytes', 0))
+
+
+class LRUCache():
+    """Least recently used values, at most max_bytes in total (values larger than that are not kept)."""
+
+    def __init__(self, max_bytes=256*2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """Value for key, computed with load() only if it is not in the cache (never cached if key is None)."""
+        if key is None:
+            return load()
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0]
+        self.misses += 1
+        value = load()
+        size = _nbytes(value)
+        if size <= self.max_bytes:
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, removed) = self.entries.popitem(last=False)
+                self.bytes -= removed
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+NDB_CACHE = LRUCache()
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+def node_key(node):
+    """(uuid, file name) of a stored node, whose content cannot change; None if it is not stored."""
+    if not getattr(node, 'is_stored', True):
+        return None
+    return node.uuid, getattr(node, 'filename', None)
+
+def _decode_qp(data):
+    with netCDF4.Dataset('ndb.QP', mode='r', memory=bytes(data)) as nc:
+        return xarray.open_dataset(xarray.backends.NetCDF4DataStore(nc)).load()
+
+def _decode_qp_variables(data):
+    with netCDF4.Dataset('ndb.QP', mode='r', memory=bytes(data)) as nc:
+        nc.set_auto_mask(False)
+        return {name: variable[:] for name, variable in nc.variables.items()}
+
+def _read_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'base'): #SinglefileData
+        with source.base.repository.open(source.filename, 'rb') as handle:
+            return handle.read()
+    with open(str(source), 'rb') as handle:
+        return handle.read()
+
+def _source_key(prefix, source):
+    """Cache key and bytes loader of a source (SinglefileData, path or bytes)."""
+    if hasattr(source, 'base'):
+        key = node_key(source)
+        return key and (prefix,)+key, lambda: _read_source(source)
+    data = _read_source(source)
+    return (prefix, content_key(data)), lambda: data
+
+def qp_dataset(source, copy=True, cache=NDB_CACHE):
+    """ndb.QP (SinglefileData, path or bytes) as an xarray.Dataset, decoded once per content.
+
+    With copy=False the cached Dataset itself is returned: it must not be modified.
+    """
+    key, data = _source_key('ndb', source)
+    dataset = cache.get(key, lambda: _decode_qp(data()))
+    return dataset.copy(deep=True) if copy else dataset
+
+def qp_variables(source, cache=NDB_CACHE):
+    """Variables of an ndb.QP (SinglefileData, path or bytes) as {name: numpy array}, decoded
+    once per content with netCDF4 only. The arrays are shared: do not modify them in place."""
+    key, data = _source_key('ndb_variables', source)
+    return cache.get(key, lambda: _decode_qp_variables(data()))
+
+def ndb_arrays(node, cache=NDB_CACHE):
+    """All the arrays of an ArrayData (e.g. array_ndb) as {name: numpy array}, read once.
+    The arrays are shared: do not modify them in place."""
+    key = node_key(node)
+    return cache.get(key and ('arrays',)+key, lambda: {name: node.get_array(name) for name in node.get_arraynames()})
@@ -2,9 +2,11 @@
 """helpers for many purposes"""
 from __future__ import absolute_import
 import numpy as np
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
 import os
 
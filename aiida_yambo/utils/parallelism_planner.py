@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Parallelism planner trained on the timings and memory of previous yambo runs.
+
+A sample is a dict with the size of the run ('bands', 'kpoints' and 'G', the
+number of G-vectors of the response block, see units.gvectors), its
+parallelism (X_and_IO_CPU/ROLEs or X_CPU/ROLEs, SE_CPU/ROLEs), the number of
+MPI tasks ('mpi'), the parsed wall time in seconds ('time') and the peak
+memory per task in Gb ('memory', optional).
+The model is log-linear: log(time) and log(memory) are linear in the log of
+bands, G-vectors, k-points and of the number of tasks of each role; it is
+fitted as a ridge regression towards ideal scaling, so it can be used also
+with few samples. Samples can be harvested from a Group of calculations or
+stored/loaded as a json fixture to train the planner offline.
+"""
+from __future__ import absolute_import
+import json
+import re
+import numpy as np
+from aiida_yambo.utils.units import gvectors
+
+X_ROLES = ['q', 'k', 'g', 'c', 'v']
+SE_ROLES = ['q', 'qp', 'b', 'g']
+SIZES = ['bands', 'G', 'kpoints']
+FEATURES = ['1'] + SIZES + ['X_'+r for r in X_ROLES] + ['SE_'+r for r in SE_ROLES]
+
+#scaling before any sample: time ~ bands^2 G k / tasks, memory of X ~ bands G^2 / (c v g) (per task).
+#The tasks of each role are weighted by its efficiency, otherwise all the decompositions of
+#the same number of tasks have the same time: q, k and qp are independent, the bands (c, v, b)
+#share the response/self-energy sums, g needs the most communication.
+ROLE_EFFICIENCY = {'q': 1.0, 'k': 1.0, 'qp': 1.0, 'c': 0.9, 'v': 0.9, 'b': 0.9, 'g': 0.8}
+TIME_PRIOR = dict(zip(FEATURES, [0, 2, 1, 1] + [-ROLE_EFFICIENCY[r] for r in X_ROLES] + [-ROLE_EFFICIENCY[r] for r in SE_ROLES]))
+MEMORY_PRIOR = dict(zip(FEATURES, [0, 1, 2, 0] + [0, 0, -1, -1, -1] + [0, 0, -1, -1]))
+
+_MEMSTAT_TOTAL = re.compile(r'TOTAL:\s*([0-9.]+)\s*\[([MGK])b\]')
+
+def memstats_peak(memstats):
+    """Peak of the TOTAL memory (Gb) in the [MEMORY] lines parsed from the log."""
+    unit = {'K': 1e-6, 'M': 1e-3, 'G': 1}
+    values = [float(v)*unit[u] for line in memstats for v, u in _MEMSTAT_TOTAL.findall(line)]
+    return max(values) if values else None
+
+def roles_from_parallelism(parallelism, runlevel):
+    """{role: tasks} from the CPU/ROLEs strings of a runlevel ('X' or 'SE')."""
+    names = [runlevel+'_and_IO', runlevel] if runlevel == 'X' else [runlevel]
+    for name in names:
+        if name+'_CPU' in parallelism and parallelism.get(name+'_ROLEs'):
+            cpu = [int(c) for c in str(parallelism[name+'_CPU']).split()]
+            return dict(zip(str(parallelism[name+'_ROLEs']).split(), cpu))
+    return {}
+
+def features(sample):
+    X = roles_from_parallelism(sample, 'X')
+    SE = roles_from_parallelism(sample, 'SE')
+    row = [1.0] + [np.log(max(float(sample.get(s, 1) or 1), 1)) for s in SIZES]
+    row += [np.log(max(X.get(r, 1), 1)) for r in X_ROLES]
+    row += [np.log(max(SE.get(r, 1), 1)) for r in SE_ROLES]
+    return row
+
+def _value(variable):
+    return variable[0] if isinstance(variable, (list, tuple)) else variable
+
+def response_gvectors(variables, volume=None):
+    """Number of G-vectors of the response block (NGsBlkXp/NGsBlkXs) for a cell of volume (angstrom^3), None if unknown."""
+    G = [gvectors(variables[v], volume) for v in ['NGsBlkXp', 'NGsBlkXs'] if v in variables]
+    G = [g for g in G if g]
+    return max(G) if G else None
+
+def sample_from_run(variables, resources, time, memstats=[], kpoints=1, memory=None, volume=None):
+    """Sample from the input variables, resources and parsed outputs of a yambo calculation.
+    volume is the cell volume (angstrom^3), needed for G with the cutoffs given as energies."""
+    bands = max([_value(variables[v])[-1] for v in ['BndsRnXp', 'BndsRnXs', 'GbndRnge'] if v in variables] or [1])
+    G = response_gvectors(variables, volume)
+    sample = {'bands': bands, 'G': G, 'kpoints': kpoints, 'time': time, 'memory': memory or memstats_peak(memstats),
+              'mpi': resources.get('num_machines', 1)*resources.get('num_mpiprocs_per_machine', 1)}
+    for v in variables:
+        if v.endswith('_CPU') or v.endswith('_ROLEs'):
+            sample[v] = _value(variables[v])
+    return sample
+
+def load_samples(path):
+    with open(path) as f:
+        return json.load(f)
+
+def save_samples(samples, path):
+    with open(path, 'w') as f:
+        json.dump(samples, f, indent=1)
+
+def _factorizations(n, bounds):
+    """All the ordered tuples of len(bounds) integers with product n, each <= its bound."""
+    if len(bounds) == 1:
+        return [(n,)] if n <= bounds[0] else []
+    out = []
+    for d in range(1, min(n, bounds[0])+1):
+        if n % d == 0:
+            out += [(d,)+rest for rest in _factorizations(n//d, bounds[1:])]
+    return out
+
+def _cpu_string(counts):
+    return ' '.join(str(int(c)) for c in counts)
+
+
+class ParallelismPlanner():
+    """Fit log(time), log(memory) on previous runs and plan the CPU/ROLEs of a new one."""
+
+    def __init__(self, samples=[], regularization=1.0):
+        self.samples = list(samples)
+        self.regularization = regularization
+        self.fit()
+
+    def _ridge(self, rows, y, prior):
+        theta0 = np.array([prior[f] for f in FEATURES], dtype=float)
+        if len(rows) == 0:
+            return theta0, False
+        A = np.array(rows)
+        penalty = self.regularization*np.eye(len(FEATURES))
+        penalty[0, 0] = 0 #the intercept is free
+        theta = np.linalg.solve(A.T.dot(A)+penalty, A.T.dot(np.log(y))+penalty.dot(theta0))
+        return theta, True
+
+    def fit(self):
+        timed = [s for s in self.samples if s.get('time')]
+        measured = [s for s in self.samples if s.get('memory')]
+        self.time_theta, self.has_time = self._ridge([features(s) for s in timed], [s['time'] for s in timed], TIME_PRIOR)
+        self.memory_theta, self.has_memory = self._ridge([features(s) for s in measured], [s['memory'] for s in measured], MEMORY_PRIOR)
+        return self
+
+    def predict(self, sample):
+        """(time in s, memory per task in Gb); memory is None without memory samples."""
+        f = np.array(features(sample))
+        memory = float(np.exp(f.dot(self.memory_theta))) if self.has_memory else None
+        return float(np.exp(f.dot(self.time_theta))), memory
+
+    def plan(self, mpi, bands, G, kpoints, occupied, qp=1, memory_limit=None):
+        """Best (predicted time) X and SE decompositions of mpi tasks, with the predicted
+        memory per task below memory_limit (Gb) if possible. G is the number of G-vectors
+        of the response block (see response_gvectors), not the cutoff; if None, the
+        g role is not bounded.
+        Returns the parallelism dict (X_and_IO, DIP, SE), predicted time and memory."""
+        v, c = max(1, int(occupied)), max(1, int(bands)-int(occupied))
+        g = max(1, int(G)) if G else int(mpi)
+        X = np.array(_factorizations(int(mpi), [1, max(1, int(kpoints)), g, c, v]))
+        SE = np.array(_factorizations(int(mpi), [1, max(1, int(qp)), max(1, int(bands)), g]))
+        if len(X) == 0 or len(SE) == 0:
+            return False, None, None
+
+        size = np.log([max(float(bands), 1), max(float(G or 1), 1), max(float(kpoints), 1)])
+        F_X, F_SE = np.log(X), np.log(SE)
+        n_X = 4 + len(X_ROLES)
+        def score(theta):
+            base = theta[0] + size.dot(theta[1:4])
+            return base + F_X.dot(theta[4:n_X])[:, None] + F_SE.dot(theta[n_X:])[None, :]
+
+        time = score(self.time_theta)
+        if self.has_memory and memory_limit:
+            memory = score(self.memory_theta)
+            feasible = memory <= np.log(memory_limit)
+            if feasible.any():
+                time = np.where(feasible, time, np.inf)
+        i, j = np.unravel_index(np.argmin(time), time.shape)
+
+        q, k, g, cc, vv = X[i]
+        parallelism = {'X_and_IO_CPU': _cpu_string(X[i]), 'X_and_IO_ROLEs': ' '.join(X_ROLES),
+                       'DIP_CPU': _cpu_string([k, q*g*cc, vv]), 'DIP_ROLEs': 'k c v',
+                       'SE_CPU': _cpu_string(SE[j]), 'SE_ROLEs': ' '.join(SE_ROLES)}
+        predicted_memory = float(np.exp(score(self.memory_theta)[i, j])) if self.has_memory else None
+        return parallelism, float(np.exp(time[i, j])), predicted_memory
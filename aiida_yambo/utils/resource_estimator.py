@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Resources for the restart of a yambo run that failed for memory or walltime.
+
+Instead of fixed factors, the memory per task and the time still needed are
+extrapolated from what the failed run printed in its log, as stored in the
+output parameters: the peak and last allocation of the [MEMORY] lines
+('memory_peak', 'memory_last_alloc', or the 'memstats' lines of older runs) and the
+last progress bar of the running step ('progress': [percent, elapsed, expected, step]).
+"""
+from __future__ import absolute_import
+import re
+import numpy as np
+
+from aiida_yambo.utils.parallelism_planner import memstats_peak
+
+_ALLOC = re.compile(r'Alloc\s+\S+?\s*\(\s*([0-9.]+)\s*\[([MGK])b\]\)')
+_UNIT = {'K': 1e-6, 'M': 1e-3, 'G': 1}
+
+def last_allocation(memstats):
+    """Size (Gb) of the last allocation in the [MEMORY] lines, the one the run died on."""
+    for line in reversed(memstats):
+        found = _ALLOC.search(line)
+        if found:
+            return float(found.group(1))*_UNIT[found.group(2)]
+    return None
+
+def memory_factor(memstats, safety=1.2):
+    """Factor (>= 1) by which the memory per task has to shrink, None if memstats are missing.
+
+    The run was killed around the peak TOTAL it reached, while it needed at least
+    the peak plus the last allocation (the step was allocating objects of that size).
+    """
+    return memory_factor_from_summary(memstats_peak(memstats), last_allocation(memstats), safety)
+
+def memory_factor_from_summary(peak, last_alloc, safety=1.2):
+    """memory_factor from the scalars of output_parameters ('memory_peak', 'memory_last_alloc')."""
+    if not peak:
+        return None
+    return max(1.0, safety*(peak+(last_alloc or 0))/peak)
+
+def _divisors(n):
+    return [d for d in range(1, n+1) if n % d == 0]
+
+def memory_resources(resources, factor, max_nodes, has_gpu=False):
+    """Resources with the memory needed per node reduced by factor, and the reduction reached.
+
+    First more nodes (up to max_nodes: the X and SE matrices are distributed over
+    the tasks), then the rest with fewer MPI tasks per node and more threads each,
+    so that the same cores per node are used. On GPUs only the nodes change.
+    """
+    new = dict(resources)
+    nodes = int(resources['num_machines'])
+    tasks = int(resources['num_mpiprocs_per_machine'])
+    threads = int(resources.get('num_cores_per_mpiproc', 1))
+
+    new['num_machines'] = min(max(int(max_nodes), nodes), int(np.ceil(nodes*factor)))
+    reached = new['num_machines']/nodes
+    if reached < factor and not has_gpu:
+        new_tasks = max([d for d in _divisors(tasks) if d <= tasks*reached/factor] or [1])
+        new['num_mpiprocs_per_machine'] = new_tasks
+        new['num_cores_per_mpiproc'] = threads*tasks//new_tasks
+        reached *= tasks/new_tasks
+    return new, reached
+
+def required_walltime(output_params, safety=1.25):
+    """Walltime (s) to complete the step that was running, None if there is no progress bar.
+
+    The bar gives the elapsed and expected time of the step: the run would have
+    needed its last time plus what was left of the step.
+    """
+    progress = output_params.get('progress')
+    if not progress:
+        return None
+    percent, elapsed, expected = progress[:3]
+    if not expected:
+        return None
+    return safety*(output_params.get('last_time', 0) + max(expected-elapsed, 0))
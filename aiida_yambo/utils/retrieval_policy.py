@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""What a YamboCalculation brings back from the remote, depending on its role.
+
+Each policy lists the files kept in the repository ('retrieve'), the ones
+retrieved only for the parser and then discarded ('temporary', i.e. the
+retrieve_temporary_list) and the ones never retrieved ('remote'); everything
+else stays in the remote folder as usual. 'dbs' stands for the databases of
+the runlevels of the calculation (ndb.QP, ndb.HF_and_locXC, ndb.BS_diago_Q*).
+
+    default:     everything, as before the policies existed
+    gw:          final GW, everything (QP_bands reads ndb.QP from the retrieved folder)
+    convergence: probes of a convergence, only the reports and o-* files are kept:
+                 the results are in the output nodes (QP_db already stores ndb.QP)
+    bse:         the excitonic databases and the logs are only parsed
+    restart:     runs whose databases are reused remotely (COPY_DBS, RESTART_YAMBO),
+                 only the reports and logs are kept, to understand failures
+"""
+from __future__ import absolute_import
+
+REPORTS = ['r*', '*stderr*']
+LOGS = ['l*', 'LOG/l*_CPU_1']
+OUTPUTS = ['o*']
+SAVE_DB = ['SAVE/ns.db1']
+DBS = 'dbs'
+
+RETRIEVAL_POLICIES = {
+    'default':     {'retrieve': REPORTS+LOGS+OUTPUTS+[DBS]+SAVE_DB, 'temporary': [], 'remote': []},
+    'gw':          {'retrieve': REPORTS+LOGS+OUTPUTS+[DBS]+SAVE_DB, 'temporary': [], 'remote': []},
+    'convergence': {'retrieve': REPORTS+OUTPUTS, 'temporary': LOGS+[DBS]+SAVE_DB, 'remote': []},
+    'bse':         {'retrieve': REPORTS+OUTPUTS, 'temporary': LOGS+[DBS]+SAVE_DB, 'remote': []},
+    'restart':     {'retrieve': REPORTS+LOGS, 'temporary': OUTPUTS+[DBS]+SAVE_DB, 'remote': []},
+}
+
+def _expand(patterns, dbs, remote):
+    expanded = []
+    for pattern in patterns:
+        for name in (dbs if pattern == DBS else [pattern]):
+            if name not in remote and name not in expanded:
+                expanded.append(name)
+    return expanded
+
+def retrieval_lists(policy, dbs=[], initialise=False):
+    """(retrieve_list, retrieve_temporary_list) of a policy (name or dict like the ones above).
+
+    dbs are the paths of the runlevel databases (e.g. 'aiida.out/ndb.QP'). An
+    initialisation always keeps ns.db1, that is what the next calculations need.
+    """
+    if not isinstance(policy, dict):
+        policy = RETRIEVAL_POLICIES[policy]
+    remote = list(policy.get('remote', []))
+    retrieve = _expand(policy.get('retrieve', []), dbs, remote)
+    temporary = [name for name in _expand(policy.get('temporary', []), dbs, remote) if name not in retrieve]
+    if initialise:
+        retrieve += [name for name in SAVE_DB if name not in retrieve]
+        temporary = [name for name in temporary if name not in SAVE_DB]
+    return retrieve, temporary
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed store of SAVE directories on the remote computer.
+
+A SAVE is identified by the hash of the ns.db1 written by p2y: calculations on
+the same nscf share one read-only copy in <store>/<hash>/SAVE. Instead of copying
+the whole SAVE (COPY_SAVE), the job script hard-links (or reflinks, if hard links
+are not possible) the p2y databases (ns.*) from the store and copies only the
+databases that yambo writes in the SAVE (ndb.*, e.g. ndb.gops and ndb.kindx).
+The store is filled once, from the first SAVE with that hash, by the first job.
+"""
+from __future__ import absolute_import
+import hashlib
+import shlex
+
+READ_ONLY = 'ns.*'
+
+def save_store_key(handle, chunk=2**20):
+    """sha256 of the ns.db1 content read from handle (binary file object)."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: handle.read(chunk), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+def save_store_script(store, key, source, target='SAVE'):
+    """Job script lines creating target from the store entry key, filled from source if missing."""
+    entry = shlex.quote(store.rstrip('/')+'/'+key)
+    source, target = shlex.quote(source.rstrip('/')), shlex.quote(target)
+    return '\n'.join([
+        '# SAVE from the store {}'.format(entry),
+        'if [ ! -d {}/SAVE ]; then'.format(entry),
+        '    mkdir -p {e}.tmp.$$ && cp -r {s} {e}.tmp.$$/SAVE && chmod -R a-w {e}.tmp.$$/SAVE'.format(e=entry, s=source),
+        '    mv -T {e}.tmp.$$ {e} 2>/dev/null || (chmod -R u+w {e}.tmp.$$ && rm -rf {e}.tmp.$$)'.format(e=entry),
+        'fi',
+        'mkdir -p {}'.format(target),
+        'for f in {}/SAVE/*; do'.format(entry),
+        '    case "$(basename "$f")" in',
+        '        {}) cp -rl "$f" {t}/ 2>/dev/null || cp -r --reflink=auto "$f" {t}/ ;;'.format(READ_ONLY, t=target),
+        '        *) cp -r "$f" {t}/ && chmod -R u+w {t}/"$(basename "$f")" ;;'.format(t=target),
+        '    esac',
+        'done',
+        '',
+    ])
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Units of the yambo variables, given as [value, unit] in the parameters dicts."""
+from __future__ import absolute_import
+import math
+
+HARTREE_EV = 27.211386245988
+#energy units of yambo, in Ry
+ENERGY_UNITS = {'Ry': 1.0, 'mRy': 1e-3, 'Ha': 2.0, 'mHa': 2e-3, 'eV': 2.0/HARTREE_EV, 'meV': 2e-3/HARTREE_EV}
+
+def split_unit(variable):
+    """(value, unit) of a yambo variable; unit is '' if the variable has none."""
+    if isinstance(variable, (list, tuple)) and len(variable) == 2 and isinstance(variable[1], str):
+        return variable[0], variable[1]
+    return variable, ''
+
+def to_Ry(value, unit):
+    """Energy value in Ry, or None if unit is not an energy unit (e.g. 'RL')."""
+    if unit not in ENERGY_UNITS:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [to_Ry(v, unit) for v in value]
+    return float(value)*ENERGY_UNITS[unit]
+
+def _round(value, digits):
+    return [_round(v, digits) for v in value] if isinstance(value, list) else round(value, digits)
+
+def normalized(variable, digits=9):
+    """(value, unit) with the energies converted to Ry (and rounded), to compare variables given in different units."""
+    value, unit = split_unit(variable)
+    energy = to_Ry(value, unit)
+    if energy is None:
+        return value, unit
+    return _round(energy, digits), 'Ry'
+
+BOHR_ANGSTROM = 0.529177210903
+
+def gvectors(cutoff, volume=None):
+    """Number of G-vectors within the energy cutoff ([value, unit]) for a cell of volume
+    (angstrom^3): V E^(3/2) / (6 pi^2) in atomic units, with E in Ry. A cutoff in 'RL' is
+    already a number of G-vectors. None if it cannot be computed (no volume, unknown unit)."""
+    value, unit = split_unit(cutoff)
+    if unit == 'RL':
+        return float(value)
+    energy = to_Ry(value, unit)
+    if energy is None or not volume:
+        return None
+    return volume/BOHR_ANGSTROM**3*energy**1.5/(6*math.pi**2)
@@ -5,14 +5,16 @@ from __future__ import print_function
 import sys
 import os
 import shutil
-import matplotlib
-from mpl_toolkits.mplot3d import Axes3D
+from aiida_yambo.utils.lazy import lazy_import
+matplotlib = lazy_import('matplotlib')
+Axes3D = lazy_import('mpl_toolkits.mplot3d', 'Axes3D')
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
+plt = lazy_import('matplotlib.pyplot')
+pd = lazy_import('pandas')
 from aiida.orm import load_node
 from aiida_yambo.utils.common_helpers import *
 from aiida_yambo.parsers.utils import *
+from aiida_yambo.workflows.utils.harvest import *
 from aiida.orm.nodes.process.workflow.workchain import WorkChainNode
 
 def take_fermi(calc_node_pk):  # calc_node_pk = node_conv_wfl.outputs.last_calculation
@@ -49,15 +51,19 @@ def collect_all_params(story, param_list=['BndsRnXp','GbndRnge','NGsBlkXp']):
         raise TypeError('You have to provide: node, node_pk, output_dict or dataframe')  
     
     list_for_df=[]
+    parameters = harvest_calc_parameters(df['calc_pk'])
+    kmesh = harvest_kmesh(df['calc_pk'])
     for calc in df['calc_pk']:
-        node = load_node(int(calc))
-        node_pw = find_pw_parent(node, calc_type=['nscf','scf'])
-        mesh = node_pw.inputs.kpoints.get_kpoints_mesh()[0]
-        distance_mesh = get_distance_from_kmesh(node_pw)
-        list_for_df.append([node.inputs.parameters.get_dict()[j] for j in param_list]+\
+        if int(calc) in kmesh:
+            mesh, distance_mesh = kmesh[int(calc)]
+        else: #no mesh found for the PW parent
+            node_pw = find_pw_parent(load_node(int(calc)), calc_type=['nscf','scf'])
+            mesh = node_pw.inputs.kpoints.get_kpoints_mesh()[0]
+            distance_mesh = get_distance_from_kmesh(node_pw)
+        list_for_df.append([parameters[int(calc)][j] for j in param_list]+\
               [mesh]+[distance_mesh]+df[df['calc_pk']==calc]['result_eV'].values.tolist()\
                            +[df[df['calc_pk']==calc]['useful'].values])
-        df_c=pd.DataFrame(list_for_df,columns=param_list+['mesh','distance_mesh']+['result_eV','useful'])
+    df_c=pd.DataFrame(list_for_df,columns=param_list+['mesh','distance_mesh']+['result_eV','useful'])
     
     return df_c
 
@@ -211,27 +217,21 @@ def get_timings(story):
 
     df = pd.DataFrame(y[1:],columns=y[0])
 
-    timings = []
-    for calc_pk in df.calc_pk:
-        ywfl = load_node(int(calc_pk)).caller.caller
-        
-        condition = df.calc_pk == calc_pk
-        time_gw=0
-        time_pw=0
-        for called in ywfl.called_descendants:
-
-            pt=called.process_type
-            
-            if 'aiida.calculations' in pt and 'yambo' in pt:
-
-                time_gw += load_node(int(called.pk)).outputs.output_parameters.get_dict()['last_time']
-    
-            elif 'aiida.calculations' in pt and 'pw' in pt:
-            
-                if df['var'][condition].values[0] == 'kpoints' or df['global_step'][condition].values[0] == 1:
-                    str_t = load_node(int(called.pk)).outputs.output_parameters.get_dict()['wall_time'].replace('h','h-').replace('m','m-').replace('s','l')
-                    time_pw += yambotiming_to_seconds(str_t)
-            
-        timings.append([df.global_step[condition].values[0],df['var'][condition].values[0],time_gw,time_pw])
-    df_t = pd.DataFrame(timings, columns =['step','var','time_gw','time_pw'])
+    ywfls = harvest_yambowf_of_calcs(df.calc_pk)
+    called = harvest_timings(set(ywfls.values()))
+
+    #seconds per workflow, summed over the yambo and pw calculations it called
+    process_type = called.process_type.astype(str)
+    is_gw = process_type.str.contains('aiida.calculations') & process_type.str.contains('yambo')
+    is_pw = process_type.str.contains('aiida.calculations') & process_type.str.contains('pw') & ~is_gw
+    steps = harvest_profiles(called.calc[is_gw].tolist(), prefix='step')
+    time_gw = profile_seconds(called[is_gw], steps).groupby(called.ywfl[is_gw]).sum()
+    pw_seconds = called.wall_time[is_pw].map(lambda t: yambotiming_to_seconds(str(t).replace('h','h-').replace('m','m-').replace('s','l')))
+    time_pw = pw_seconds.groupby(called.ywfl[is_pw]).sum()
+
+    ywfl = df.calc_pk.map(lambda pk: ywfls[int(pk)])
+    pw_counted = (df['var'] == 'kpoints') | (df['global_step'] == 1)
+    df_t = pd.DataFrame({'step': df.global_step.values, 'var': df['var'].values,
+                         'time_gw': ywfl.map(time_gw).fillna(0).values,
+                         'time_pw': ywfl.map(time_pw).fillna(0).where(pw_counted, 0).values})
     return df_t
\ No newline at end of file
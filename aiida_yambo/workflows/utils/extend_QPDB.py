@@ -1,9 +1,12 @@
-import xarray
+from aiida_yambo.utils.lazy import lazy_import
+xarray = lazy_import('xarray')
 import numpy as np
-import matplotlib.pyplot as plt
+plt = lazy_import('matplotlib.pyplot')
 import netCDF4
 from aiida_yambo.utils.common_helpers import *
-from ase import units
+from aiida_yambo.workflows.utils.qp_states import full_qp_table, match_states
+from aiida_yambo.utils.ndb_cache import qp_dataset
+units = lazy_import('ase.units')
 
 def build_ndbQP(db_path,DFT_pk,Nb=[1,1],Nk=1,verbose=False):
     
@@ -13,7 +16,7 @@ def build_ndbQP(db_path,DFT_pk,Nb=[1,1],Nk=1,verbose=False):
     the right dimensions. 
     '''
     
-    db = xarray.open_dataset(db_path,engine='netcdf4')
+    db = qp_dataset(db_path)
     
     
     data = {}
@@ -26,11 +29,7 @@ def build_ndbQP(db_path,DFT_pk,Nb=[1,1],Nk=1,verbose=False):
     for d in [Nk,len(Nb)]:
         dimensions['D_'+str(d).zfill(10)] = range(d)
     
-    d=[[i]*len(Nb) for i in range(1,Nk+1)]
-    ff=[]
-    for dd in d:
-        ff+=dd
-    qp_table = np.array([Nb*Nk,Nb*Nk,ff])
+    qp_table = full_qp_table(Nb,Nk)
     
     pw = find_pw_parent(load_node(DFT_pk))
     bands = pw.outputs.output_band.get_bands()
@@ -53,15 +52,11 @@ def build_ndbQP(db_path,DFT_pk,Nb=[1,1],Nk=1,verbose=False):
     fit_v = np.polyfit(db.QP_Eo[v_cond[0]],db.QP_E[v_cond[0],0],deg=1)
     fit_c = np.polyfit(db.QP_Eo[c_cond[0]],db.QP_E[c_cond[0],0],deg=1)
     
+    KS = (bands[qp_table[2]-1,qp_table[0]-1]-fermi)/units.Ha
     QP = np.zeros((Nk*len(Nb),2))
+    QP[:,0] = KS
     Z = np.zeros((Nk*len(Nb),2))
-    KS = np.zeros((Nk*len(Nb),))
-
-    for i in range(len(qp_table[0])):
-        QP[i,0] = (bands[qp_table[2,i]-1,qp_table[0,i]-1]-fermi)/units.Ha
-        QP[i,1] = 0
-        KS[i] = (bands[qp_table[2,i]-1,qp_table[0,i]-1]-fermi)/units.Ha
-        Z[i] = [1,0]
+    Z[:,0] = 1
         
 
     data['QP_E'] = (('D_'+str(len(QP)).zfill(10),'D_'+str(2).zfill(10)),QP)
@@ -93,10 +88,11 @@ def FD_even(x,mu,e_ref=0,T=1e-6):
         if T==0: T=1e-4
         return 1/(np.exp((abs(x-e_ref)-mu)/T)+1)
     
-def Apply_FD_scissored_correction(start,corrections,scissor,mu,e_ref=0,T=1e-6,unit=units.Ha):
+def Apply_FD_scissored_correction(start,corrections,scissor,mu,e_ref=0,T=1e-6,unit=None):
     '''corrections should be a zeroes with shape of start, 
     filled only for the corrections that we computed explicitely.
     provide the scissors in Hartree units...'''
+    if unit is None: unit = units.Ha
     mu = mu/unit
     e_ref = e_ref/unit
     return FD_even(start,mu,e_ref,T)*(corrections+start)+(1-FD_even(start,mu,e_ref,T))*(start*scissor[0]+scissor[1])
@@ -112,31 +108,16 @@ def update_FD_and_scissor(db_dft,db_gw,conduction,mu,scissors=[[1,0],[1,0]],e_re
     dss = db_dft
     
     #update the qp where possible, so we introduce the QP that we have in db:
-    for i in range(len(db_gw.QP_table[0,:])):
-        b=int(db_gw.QP_table.data[0,i])
-        k=int(db_gw.QP_table.data[2,i])
-
-        _b24 = np.where((db_dft.QP_table[0].isin([b]))  & (db_dft.QP_table[2].isin([k]))) 
-        b24 = np.where((db_gw.QP_table[0].isin([b])) & (db_gw.QP_table[2].isin([k])))
+    index, found = match_states(db_gw.QP_table.data, dss.QP_table.data)
+    dss.QP_E.data[index[found]] = db_gw.QP_E.data[found]
+    dss.QP_Eo.data[index[found]] = db_gw.QP_Eo.data[found]
         
-        dss.QP_E.data[_b24] = db_gw.QP_E.data[b24]
-        dss.QP_Eo.data[_b24] = db_gw.QP_Eo.data[b24]
-        
-    for i in range(len(db_dft.QP_table[0,:])):
-        b=int(db_dft.QP_table.data[0,i])
-        k=int(db_dft.QP_table.data[2,i])
-
-        b24 = np.where((db_dft.QP_table[0].isin([b]))  & (db_dft.QP_table[2].isin([k]))) 
-
-        corr = dss.QP_E.data[b24,0]- dss.QP_Eo.data[b24]
-        
-
-        if b<conduction:
-            corr[0] = Apply_FD_scissored_correction(dss.QP_Eo.data[b24],corr,scissors[0],mu,e_ref,T)
-        else:
-            corr[0] = Apply_FD_scissored_correction(dss.QP_Eo.data[b24],corr,scissors[1],mu,e_ref,T)
+    corr = dss.QP_E.data[:,0] - dss.QP_Eo.data
+    valence = dss.QP_table.data[0] < conduction
 
-        dss.QP_E.data[b24,0] = corr[0]
+    dss.QP_E.data[:,0] = np.where(valence,
+                                  Apply_FD_scissored_correction(dss.QP_Eo.data,corr,scissors[0],mu,e_ref,T),
+                                  Apply_FD_scissored_correction(dss.QP_Eo.data,corr,scissors[1],mu,e_ref,T))
     #align to zero wrt to the maximum of valence... fixes the error in Fermi re-evaluation
     #in the BSE RD/ndb.QP. for now.
     v_cond = np.where(dss.QP_table[0] == conduction-1)
@@ -148,7 +129,7 @@ def FD_and_scissored_db(out_db_path,pw,Nb,Nk,v_max,c_min,fit_v,fit_c,conduction,
     
     db_dft = build_ndbQP(db_path=out_db_path,DFT_pk=pw.pk,Nb=Nb,Nk=Nk)
     
-    out_db = xarray.open_dataset(out_db_path,engine='netcdf4')
+    out_db = qp_dataset(out_db_path)
     #find the min and the max of c and v to have exact GW corrections
     #in this way we can choose e_ref and mu
     v_ref = np.where((out_db.QP_table[0].isin([v_max])))
@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.optimize import curve_fit
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
 
 '''
 author: Andrea Ferretti
@@ -1,12 +1,14 @@
 from __future__ import absolute_import
 
 import numpy as np
-from scipy import optimize
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+optimize = lazy_import('scipy.optimize')
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
-from ase import Atoms
+Atoms = lazy_import('ase', 'Atoms')
 from aiida_yambo.utils.common_helpers import *
 
 
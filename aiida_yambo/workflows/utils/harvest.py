@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Batched harvesting of convergence results.
+
+Instead of a load_node (and several link traversals) per workflow, each function
+here projects what is needed for all the nodes in a single QueryBuilder join and
+returns a pandas DataFrame.
+"""
+from __future__ import absolute_import
+import numpy as np
+from aiida_yambo.utils.lazy import lazy_import
+pd = lazy_import('pandas')
+
+from aiida_yambo.workflows.utils.qp_partition import expand_states
+from aiida_yambo.utils.parallelism_planner import sample_from_run
+from aiida_yambo.utils.k_path_utils import density_from_kmesh
+
+try:
+    from aiida.orm import QueryBuilder, Dict, ArrayData, KpointsData, StructureData, WorkflowNode, CalcJobNode, Group, load_node
+    from aiida_yambo.utils.common_helpers import find_pw_parent
+except:
+    pass
+
+
+def _as_filter(ids):
+    ids = list(ids)
+    if ids and isinstance(ids[0], str):
+        return {'uuid': {'in': ids}}
+    return {'id': {'in': [int(i) for i in ids]}}
+
+def harvest_yambowf(ids):
+    """One row per YamboWorkflow (pks or uuids): pk, uuid, finished_ok, variables,
+    k-mesh and output_ywfl_parameters (None if missing)."""
+    columns = ['pk', 'uuid', 'finished_ok', 'variables', 'mesh', 'results']
+    if not len(ids):
+        return pd.DataFrame([], columns=columns)
+
+    qb = QueryBuilder()
+    qb.append(WorkflowNode, filters=_as_filter(ids), tag='wfl',
+              project=['id', 'uuid', 'attributes.process_state', 'attributes.exit_status'])
+    qb.append(Dict, with_outgoing='wfl', edge_filters={'label': 'yres__yambo__parameters'},
+              project=['attributes.variables'], outerjoin=True)
+    qb.append(KpointsData, with_outgoing='wfl', edge_filters={'label': 'nscf__kpoints'},
+              project=['attributes.mesh'], outerjoin=True)
+    qb.append(Dict, with_incoming='wfl', edge_filters={'label': 'output_ywfl_parameters'},
+              project=['attributes'], outerjoin=True)
+
+    rows = []
+    for pk, uuid, state, exit_status, variables, mesh, results in qb.iterall():
+        rows.append([pk, uuid, state == 'finished' and exit_status == 0, variables, mesh, results])
+    return pd.DataFrame(rows, columns=columns).drop_duplicates('pk')
+
+def harvest_calc_parameters(calc_pks):
+    """{pk: input parameters dict} of YamboCalculations, in one query."""
+    qb = QueryBuilder()
+    qb.append(CalcJobNode, filters=_as_filter(calc_pks), tag='calc', project=['id'])
+    qb.append(Dict, with_outgoing='calc', edge_filters={'label': 'parameters'}, project=['attributes'])
+    return dict(qb.all())
+
+def harvest_yambowf_of_calcs(calc_pks):
+    """{calc pk: pk of the YamboWorkflow} (i.e. calc.caller.caller), in one query."""
+    qb = QueryBuilder()
+    qb.append(CalcJobNode, filters=_as_filter(calc_pks), tag='calc', project=['id'])
+    qb.append(WorkflowNode, with_outgoing='calc', tag='restart')
+    qb.append(WorkflowNode, with_outgoing='restart', project=['id'])
+    return dict(qb.all())
+
+def distance_from_mesh(mesh, cell, pbc):
+    """k-point density of mesh for the cell, as get_distance_from_kmesh of the PW calculation."""
+    reciprocal_norms = np.linalg.norm(2*np.pi*np.linalg.inv(np.array(cell, dtype=float)).T, axis=1)
+    return density_from_kmesh(mesh, reciprocal_norms, pbc)
+
+PW_PARENT_EXTRA = 'pw_parent_nscf_scf' #set by find_pw_parent(..., calc_type=['nscf','scf'], store_extra=True)
+
+def harvest_kmesh(calc_pks):
+    """{calc pk: (mesh, distance_mesh)} of the PW parents (nscf or scf) of yambo calculations.
+
+    The parents are resolved by find_pw_parent only the first time, then they are
+    read from the extra of the calculations; the k-meshes and structures of all
+    the parents come from one query."""
+    if not len(calc_pks):
+        return {}
+    qb = QueryBuilder()
+    qb.append(CalcJobNode, filters=_as_filter(calc_pks), project=['id', 'extras.'+PW_PARENT_EXTRA])
+    parents = {}
+    for pk, uuid in qb.all():
+        if not uuid:
+            try:
+                uuid = find_pw_parent(load_node(pk), calc_type=['nscf','scf'], store_extra=True).uuid
+            except Exception:
+                continue
+        parents[pk] = uuid
+    if not parents:
+        return {}
+
+    qb = QueryBuilder()
+    qb.append(CalcJobNode, filters={'uuid': {'in': list(set(parents.values()))}}, tag='pw', project=['uuid'])
+    qb.append(KpointsData, with_outgoing='pw', edge_filters={'label': 'kpoints'}, project=['attributes.mesh'])
+    qb.append(StructureData, with_outgoing='pw', edge_filters={'label': 'structure'},
+              project=['attributes.cell', 'attributes.pbc1', 'attributes.pbc2', 'attributes.pbc3'])
+    pw = {}
+    for uuid, mesh, cell, pbc1, pbc2, pbc3 in qb.iterall():
+        if mesh is None or cell is None: continue
+        pw[uuid] = (list(mesh), distance_from_mesh(mesh, cell, [pbc1, pbc2, pbc3]))
+    return {pk: pw[uuid] for pk, uuid in parents.items() if uuid in pw}
+
+def harvest_timings(ywfl_pks):
+    """Timings of the calculations called by the YamboWorkflows (through
+    YamboRestart/PwBaseWorkChain): columns ywfl, calc, process_type, last_time, wall_time."""
+    columns = ['ywfl', 'calc', 'process_type', 'last_time', 'wall_time']
+    if not len(ywfl_pks):
+        return pd.DataFrame([], columns=columns)
+    qb = QueryBuilder()
+    qb.append(WorkflowNode, filters=_as_filter(ywfl_pks), tag='ywfl', project=['id'])
+    qb.append(WorkflowNode, with_incoming='ywfl', tag='sub')
+    qb.append(CalcJobNode, with_incoming='sub', tag='calc', project=['id', 'process_type'])
+    qb.append(Dict, with_incoming='calc', edge_filters={'label': 'output_parameters'},
+              project=['attributes.last_time', 'attributes.wall_time'])
+    return pd.DataFrame(qb.all(), columns=columns)
+
+def profiles_frame(profiles, prefix='step'):
+    """One DataFrame, with a calc_pk column, from (pk, profiling ArrayData) pairs:
+    prefix 'step' (name, start, wall), 'section' (name, cpu, calls) or 'memory'."""
+    columns = {'step': ['name', 'start', 'wall'], 'section': ['name', 'cpu', 'calls'],
+               'memory': ['time', 'object', 'size', 'total']}[prefix]
+    frames = [pd.DataFrame([], columns=['calc_pk']+[prefix+'_'+c for c in columns])]
+    for pk, profile in profiles:
+        frame = pd.DataFrame({prefix+'_'+c: profile.get_array(prefix+'_'+c) for c in columns})
+        frame.insert(0, 'calc_pk', pk)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def harvest_profiles(calc_pks, prefix='step'):
+    """Profiling arrays of the yambo calculations (pks) in one DataFrame, see profiles_frame."""
+    if not len(calc_pks):
+        return profiles_frame([], prefix)
+    qb = QueryBuilder()
+    qb.append(CalcJobNode, filters=_as_filter(calc_pks), tag='calc', project=['id'])
+    qb.append(ArrayData, with_incoming='calc', edge_filters={'label': 'profiling'}, project=['*'])
+    return profiles_frame(qb.iterall(), prefix)
+
+def profile_seconds(calcs, steps):
+    """Seconds of each calculation (calcs: calc and last_time columns) as the end of its
+    last step in the profiling (steps, from harvest_profiles); last_time if it has no profiling."""
+    end = (steps.step_start.astype(float)+steps.step_wall.astype(float)).groupby(steps.calc_pk).max()
+    return calcs.calc.map(end).fillna(calcs.last_time).fillna(0)
+
+def harvest_QP_runs(ywfl_pks):
+    """(QP states, last_time in seconds) of the successful yambo calculations called
+    by the YamboWorkflows, to fit the cost of the QP states."""
+    if not len(ywfl_pks):
+        return []
+    qb = QueryBuilder()
+    qb.append(WorkflowNode, filters=_as_filter(ywfl_pks), tag='ywfl')
+    qb.append(WorkflowNode, with_incoming='ywfl', tag='sub')
+    qb.append(CalcJobNode, with_incoming='sub', tag='calc', filters={'attributes.exit_status': 0})
+    qb.append(Dict, with_outgoing='calc', edge_filters={'label': 'parameters'},
+              project=['attributes.variables.QPkrange'])
+    qb.append(Dict, with_incoming='calc', edge_filters={'label': 'output_parameters'},
+              project=['attributes.last_time'])
+    runs = []
+    for qpkrange, seconds in qb.iterall():
+        if not qpkrange or not seconds: continue
+        ranges = qpkrange[0]
+        if isinstance(ranges[0], int): ranges = [ranges]
+        runs.append((expand_states(ranges), seconds))
+    return runs
+
+def _append_yambo_io(qb, tag):
+    qb.add_filter(tag, {'process_type': 'aiida.calculations:yambo.yambo', 'attributes.exit_status': 0})
+    qb.add_projection(tag, ['id', 'attributes.resources'])
+    qb.append(Dict, with_outgoing=tag, edge_filters={'label': 'parameters'}, project=['attributes.variables'])
+    qb.append(Dict, with_incoming=tag, edge_filters={'label': 'output_parameters'},
+              project=['attributes.last_time', 'attributes.memstats', 'attributes.memory_peak'])
+    return qb
+
+def harvest_parallelism_samples(group):
+    """ParallelismPlanner samples of the successful yambo calculations of a Group (label):
+    calculations in the group and the ones called by the workflows in it. k-points are
+    estimated from the nscf mesh of the workflow (mesh/2, as in set_parallelism), the
+    G-vectors from the cutoff and the volume of its structure. The calculations whose
+    G-vectors cannot be counted (no workflow and cutoff not in RL) are skipped."""
+    direct = QueryBuilder()
+    direct.append(Group, filters={'label': group}, tag='group')
+    direct.append(CalcJobNode, with_group='group', tag='calc')
+    rows = [[None, None]+list(row) for row in _append_yambo_io(direct, 'calc').iterall()]
+
+    called = QueryBuilder()
+    called.append(Group, filters={'label': group}, tag='group')
+    called.append(WorkflowNode, with_group='group', tag='wfl')
+    called.append(KpointsData, with_outgoing='wfl', edge_filters={'label': 'nscf__kpoints'},
+                  project=['attributes.mesh'], outerjoin=True)
+    called.append(StructureData, with_outgoing='wfl', edge_filters={'label': 'scf__pw__structure'},
+                  project=['attributes.cell'], outerjoin=True)
+    called.append(CalcJobNode, with_ancestors='wfl', tag='calc')
+    rows += list(_append_yambo_io(called, 'calc').iterall())
+
+    samples, seen = [], set()
+    for mesh, cell, pk, resources, variables, last_time, memstats, memory_peak in rows:
+        if pk in seen or not last_time: continue
+        seen.add(pk)
+        kpoints = mesh[0]*mesh[1]*mesh[2]/2 if mesh else 1
+        volume = abs(np.linalg.det(cell)) if cell else None
+        sample = sample_from_run(variables, resources or {}, last_time, memstats or [], kpoints,
+                                 memory=memory_peak, volume=volume)
+        if sample['G'] is None: continue #cutoff as an energy and no structure (not called by a workflow)
+        samples.append(sample)
+    return samples
@@ -2,9 +2,11 @@
 """Classes for calcs e wfls analysis. hybrid AiiDA and not_AiiDA...hopefully"""
 from __future__ import absolute_import
 import numpy as np
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
 
 try:
@@ -13,6 +15,8 @@ try:
 except:
     pass
 
+from aiida_yambo.utils.k_path_utils import mesh_from_density
+
 ################################################################################
 ################################################################################
 
@@ -39,7 +43,8 @@ class calc_manager_aiida_qe: #the interface class to AiiDA... could be separated
 
             inp_to_update.scf.kpoints = KpointsData()
             inp_to_update.scf.kpoints.set_cell(inp_to_update.scf.pw.structure.cell)
-            inp_to_update.scf.kpoints.set_kpoints_mesh_from_density(1/k_distance, force_parity=True)
+            k = inp_to_update.scf.kpoints
+            k.set_kpoints_mesh(mesh_from_density(np.linalg.norm(k.reciprocal_cell, axis=1), k.pbc, k_distance, force_parity=True).tolist())
             inp_to_update.nscf.kpoints = inp_to_update.scf.kpoints
 
             try:
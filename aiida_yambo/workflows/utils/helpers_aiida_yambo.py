@@ -2,19 +2,25 @@
 """Classes for calcs e wfls analysis."""
 from __future__ import absolute_import
 import numpy as np
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
 
 try:
     from aiida.orm import Dict, Str, load_node, KpointsData, RemoteData
     from aiida.plugins import CalculationFactory, DataFactory
     from aiida_yambo.utils.common_helpers import *
+    from aiida_yambo.utils.common_helpers import _yambowf_inputs, _group_yambowf_query, index_group, context_from_inputs, CONTEXT_EXTRA
 except:
     pass
 from aiida_yambo.utils.parallelism_finder import *
+from aiida_yambo.utils.parallelism_planner import ParallelismPlanner, load_samples, response_gvectors
 from aiida_yambo.utils.defaults.create_defaults import *
+from aiida_yambo.utils.dbs_dependencies import reusable_dbs, SCREENING_DBS
+from aiida_yambo.workflows.utils.harvest import *
 #we try to use netcdf
 try:
     from netCDF4 import Dataset
@@ -144,7 +150,23 @@ def set_parallelism(instructions_, inputs, k_quantity):
         #new_resources = instructions['manual']['resources']
     
     elif instructions['function']:
-        pass
+        #learned planner, trained on the runs of a Group and/or on a json file of samples (see ParallelismPlanner)
+        samples = []
+        if 'samples' in instructions['function'].keys(): samples += load_samples(instructions['function']['samples'])
+        if 'group' in instructions['function'].keys(): samples += harvest_parallelism_samples(instructions['function']['group'])
+        
+        for p in inputs.yres.yambo.parameters.get_dict()['variables'].keys():
+            for k in ['CPU','ROLEs']:
+                if k in p and not 'LinAlg' in p:
+                    pop_list.append(p)
+        
+        new_resources = instructions['function'].get('resources',resources)
+        mpi = new_resources['num_machines']*new_resources['num_mpiprocs_per_machine']
+        G = response_gvectors(inputs.yres.yambo.parameters.get_dict()['variables'], structure.get_volume())
+        new_parallelism, predicted_time, predicted_memory = ParallelismPlanner(samples).plan(mpi, bands, G, kpoints, occupied, qp,
+                                                                                   memory_limit=instructions['function'].get('memory_per_task',None))
+        if not new_parallelism: new_resources, pop_list = False, []
+        pop_list = [p for p in pop_list if not new_parallelism or p not in new_parallelism.keys()]
 
     else:
         return False, False, False
@@ -196,6 +218,7 @@ def updater(calc_dict, inp_to_update, parameters, workflow_dict,internal_iterati
     already_done = False
     values_dict = {}
     parallelism_instructions = workflow_dict['parallelism_instructions']
+    restore_dbs_parent(inp_to_update, workflow_dict)
     k_quantity = 0 
 
     if not isinstance(calc_dict['var'],list):
@@ -216,7 +239,8 @@ def updater(calc_dict, inp_to_update, parameters, workflow_dict,internal_iterati
             if isinstance(k_quantity,tuple) or isinstance(k_quantity,list):
                 inp_to_update.nscf.kpoints.set_kpoints_mesh(k_quantity,k_quantity_shift) 
             else:
-                inp_to_update.nscf.kpoints.set_kpoints_mesh_from_density(1/k_quantity, force_parity=True)
+                k = inp_to_update.nscf.kpoints
+                k.set_kpoints_mesh(mesh_from_density(np.linalg.norm(k.reciprocal_cell, axis=1), k.pbc, k_quantity, force_parity=True).tolist())
                 calc_dict['kdensity'] = calc_dict.pop('kdensity',[])
                 calc_dict['kdensity'].append(k_quantity)
 
@@ -267,8 +291,116 @@ def updater(calc_dict, inp_to_update, parameters, workflow_dict,internal_iterati
         except:
             pass
 
+    if not already_done:
+        set_dbs_parent(inp_to_update, workflow_dict)
+
     return inp_to_update, values_dict, already_done, parent_nscf
 
+def find_dbs_parent(inputs, group):
+    """(remote_folder, databases) of the finished YamboWorkflow of the group (same k-mesh, code,
+    structure and PW cutoff) with most screening databases still valid for inputs; (None, []) if none.
+    The candidates and their parameters come from one query, only the chosen one is loaded."""
+    new = _yambowf_inputs(inputs)[1].get_dict()
+    ecutwfc = inputs.scf.pw.parameters.get_dict()['SYSTEM']['ecutwfc']
+    index_group(group)
+    rows = _group_yambowf_query(group, {'attributes.exit_status': 0, 'extras.{}'.format(CONTEXT_EXTRA): context_from_inputs(inputs)},
+                                inputs={'yres__yambo__parameters': ['attributes'], 'scf__pw__parameters': ['attributes.SYSTEM.ecutwfc']})
+    best, best_dbs = None, []
+    for pk, old, old_ecutwfc in sorted(rows, key=lambda row: row[0]):
+        if old_ecutwfc != ecutwfc: continue #other wavefunctions
+        dbs = reusable_dbs(old, new)
+        if len(set(dbs) & set(SCREENING_DBS)) >= max(len(set(best_dbs) & set(SCREENING_DBS)), 1):
+            best, best_dbs = pk, dbs #the most recent, among the equivalent ones
+    if best is None:
+        return None, []
+    try:
+        remote = load_node(best).outputs.remote_folder
+        if remote.is_empty:
+            return None, []
+    except Exception:
+        return None, []
+    return remote, best_dbs
+
+def set_dbs_parent(inputs, workflow_dict):
+    """Start from the still valid databases of a previous calculation of the group: only those
+    are copied (COPY_DBS as list of databases, DBS_FROM its remote folder), the parent_folder
+    (SAVE, nscf) is not changed. Returns the message to be reported, None if nothing is reused."""
+    try:
+        remote, dbs = find_dbs_parent(inputs, workflow_dict['group'])
+    except Exception:
+        return None
+    if remote is None:
+        return None
+    message = 'reusing {} from {}'.format(', '.join(dbs), remote.uuid)
+    settings = inputs.yres.yambo.settings.get_dict()
+    workflow_dict['dbs_parent'] = {'uuid': remote.uuid,
+                                   'COPY_DBS': settings.get('COPY_DBS', None),
+                                   'message': message}
+    inputs.yres.yambo.settings = update_dict(inputs.yres.yambo.settings, ['COPY_DBS', 'DBS_FROM'], [dbs, remote.uuid])
+    return message
+
+def restore_dbs_parent(inputs, workflow_dict):
+    """Undo set_dbs_parent before the next update, if the settings were not changed meanwhile."""
+    reused = workflow_dict.pop('dbs_parent', None)
+    if not reused or inputs.yres.yambo.settings.get_dict().get('DBS_FROM', None) != reused['uuid']:
+        return
+    if reused['COPY_DBS'] is None:
+        inputs.yres.yambo.settings = update_dict(inputs.yres.yambo.settings, [], [], pop_list=['COPY_DBS', 'DBS_FROM'])
+    else:
+        inputs.yres.yambo.settings = update_dict(inputs.yres.yambo.settings, ['COPY_DBS'], [reused['COPY_DBS']], pop_list=['DBS_FROM'])
+
+def copy_inputs(inputs):
+    #copy of the (nested) inputs namespaces, the nodes are not copied.
+    if isinstance(inputs, dict):
+        new = copy.copy(inputs)
+        for k, v in inputs.items():
+            new[k] = copy_inputs(v)
+        return new
+    elif isinstance(inputs, list):
+        return [copy_inputs(v) for v in inputs]
+    return inputs
+
+def speculative_inputs(calc_dict, inputs, parameters, workflow_dict, depth, skip_in_flight=True):
+    """Inputs of the next `depth` points of the parameter space, without consuming it.
+
+    Returns a list of (fingerprint, inputs, values); points already done and,
+    if skip_in_flight, points already in flight are skipped.
+    """
+    calc_dict = copy.deepcopy(calc_dict)
+    parameters = copy.deepcopy(parameters)
+    inputs = copy_inputs(inputs)
+    in_flight = workflow_dict.get('in_flight', {}) if skip_in_flight else {}
+    variables = calc_dict['var'] if isinstance(calc_dict['var'], list) else [calc_dict['var']]
+    speculative = []
+    dbs_parent = workflow_dict.get('dbs_parent') #refers to the real inputs, not to these copies
+    for i in range(depth):
+        if not all(len(parameters.get(var, [])) for var in variables):
+            break
+        inputs, values, already_done, parent_nscf = updater(calc_dict, inputs, parameters, workflow_dict, calc_dict['steps']+i)
+        try:
+            fingerprint = fingerprint_from_inputs(inputs)
+        except Exception:
+            continue
+        if already_done or fingerprint in in_flight:
+            continue
+        speculative.append((fingerprint, copy_inputs(inputs), values))
+    workflow_dict.pop('dbs_parent', None)
+    if dbs_parent: workflow_dict['dbs_parent'] = dbs_parent
+    return speculative
+
+def take_in_flight(in_flight, inputs):
+    """pk of the speculative YamboWorkflow equivalent to inputs (also if still running),
+    removed from in_flight; False if there is none."""
+    try:
+        return in_flight.pop(fingerprint_from_inputs(inputs), False)
+    except Exception:
+        return False
+
+def stale_in_flight(in_flight, upcoming):
+    """{fingerprint: pk} of the speculative calculations that are not among the upcoming
+    fingerprints anymore (space changed, variable converged...), removed from in_flight."""
+    return {fingerprint: in_flight.pop(fingerprint) for fingerprint in list(in_flight) if fingerprint not in upcoming}
+
 ################################## parsers #####################################
 def take_quantities(calc_dict, workflow_dict, steps = 1, what = ['gap_eV'], backtrace=1):
 
@@ -277,27 +409,32 @@ def take_quantities(calc_dict, workflow_dict, steps = 1, what = ['gap_eV'], back
     backtrace = calc_dict['steps'] - calc_dict['skipped']
     what = workflow_dict['what']
 
+    wfl_pks = [workflow_dict['wfl_pk'][backtrace-i] for i in range(1,backtrace+1)]
+    harvested = harvest_yambowf(wfl_pks).set_index('pk')
+
     l_iter = []
-    for i in range(1,backtrace+1):
+    for wfl_pk in wfl_pks:
         l_calc = []
-        ywf_node = load_node(workflow_dict['wfl_pk'][backtrace-i])
+        row = harvested.loc[wfl_pk] if wfl_pk in harvested.index else None #None: not found by the query
         for n in parameter_names:
             try:
+                if row is None:
+                    raise KeyError(wfl_pk)
                 if 'mesh' in n:
-                    value = ywf_node.inputs.nscf__kpoints.get_kpoints_mesh()[0]
+                    value = row['mesh']
                 elif 'density' in n:
                     #pw = find_pw_parent(ywf_node)
                     #value = get_distance_from_kmesh(pw)
                     if 'kdensity' in calc_dict.keys():
                         value = calc_dict['kdensity'].pop(0)
                     else: #you starts from another parameter...
-                        pw = find_pw_parent(ywf_node)
+                        pw = find_pw_parent(load_node(wfl_pk))
                         value = get_distance_from_kmesh(pw)
                     if not value: #the search for kdistance failed.
-                        pw = find_pw_parent(ywf_node)
+                        pw = find_pw_parent(load_node(wfl_pk))
                         value = get_distance_from_kmesh(pw)
                 else:
-                    value = ywf_node.inputs.yres__yambo__parameters.get_dict()['variables'][n][0]
+                    value = row['variables'][n][0]
                     if n in ['BndsRnXp','GbndRnge']:
                         value = value[1] 
             except:
@@ -305,14 +442,14 @@ def take_quantities(calc_dict, workflow_dict, steps = 1, what = ['gap_eV'], back
             l_calc.append(value)
             
         for j in range(len(what)):        
-            if ywf_node.is_finished_ok:
-                quantity = ywf_node.outputs.output_ywfl_parameters.get_dict()[what[j]]
+            if row is not None and row['finished_ok']:
+                quantity = row['results'][what[j]]
                 l_calc.append(quantity)
             else:
                 quantity = False
                 l_calc.append(quantity)           
             
-        l_calc.append(ywf_node.uuid)
+        l_calc.append(row['uuid'] if row is not None else None)
         l_iter.append(l_calc)
     
     quantities = pd.DataFrame(l_iter, columns = parameter_names + what + ['uuid'])
@@ -4,17 +4,21 @@ from __future__ import absolute_import
 from aiida_yambo.workflows.utils.predictor_1D import create_grid_1D
 from aiida_yambo.workflows.utils.predictor_2D import The_Predictor_2D
 import numpy as np
-from scipy.optimize import curve_fit, minimize
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+minimize = lazy_import('scipy.optimize', 'minimize')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
-from ase import Atoms
+Atoms = lazy_import('ase', 'Atoms')
 from aiida_yambo.workflows.utils.helpers_aiida_yambo import *
 from aiida_yambo.workflows.utils.helpers_aiida_yambo import calc_manager_aiida_yambo as calc_manager
 from aiida_yambo.utils.common_helpers import *
 from aiida_yambo.workflows.utils.optimization_module import * 
 from aiida_yambo.workflows.utils.predictor_2D import * 
 from aiida_yambo.workflows.utils.predictor_1D import * 
+from aiida_yambo.workflows.utils.story import WorkflowStory
 ############################# AiiDA - independent ################################
 
 #class convergence_workflow_manager:
@@ -25,19 +29,13 @@ def conversion_wrapper(func):
             workflow_dict['array_conv'] = np.array(workflow_dict['array_conv']) 
         except: 
             pass
-        try: 
-            workflow_dict['workflow_story'] = pd.DataFrame.from_dict(workflow_dict['workflow_story']) 
-        except: 
-            pass
+        if 'workflow_story' in workflow_dict and not isinstance(workflow_dict['workflow_story'], WorkflowStory):
+            workflow_dict['workflow_story'] = WorkflowStory.from_dict(workflow_dict['workflow_story']) #old format
         output = func(*args, workflow_dict = workflow_dict,success=success)
         try: 
             workflow_dict['array_conv'] = workflow_dict['array_conv'].tolist()
         except: 
             pass
-        try: 
-            workflow_dict['workflow_story'] = workflow_dict['workflow_story'].to_dict() 
-        except: 
-            pass
         
         return output
 
@@ -531,8 +529,8 @@ def build_story_global(calc_manager, quantities, workflow_dict = {},success=Fals
 
     if calc_manager['iter'] == 1:
         try:
-            workflow_dict['array_conv']=np.array(workflow_dict['workflow_story']\
-                [workflow_dict['workflow_story']['useful'] == True].iloc[-1,])
+            story = workflow_dict['workflow_story'].to_frame()
+            workflow_dict['array_conv']=np.array(story[story['useful'] == True].iloc[-1,])
             workflow_dict['array_conv'] = np.column_stack((workflow_dict['array_conv'],quantities[:,:,1]))
         except:
             workflow_dict['array_conv']=np.array(quantities[:,:,1])
@@ -545,8 +543,9 @@ def update_story_global(calc_manager, quantities, inputs, workflow_dict,success=
     errors = False  
     final_result = {}
     if workflow_dict['global_step'] == 0 :
-        workflow_dict['workflow_story'] = pd.DataFrame(columns = ['global_step']+list(quantities.columns)+['parameters_studied']+\
+        workflow_dict['workflow_story'] = WorkflowStory(['global_step']+list(quantities.columns)+['parameters_studied']+\
                         ['useful','failed'])
+    story = workflow_dict['workflow_story']
 
     for i in range(calc_manager['steps']-calc_manager['skipped']):
             workflow_dict['global_step'] += 1
@@ -556,33 +555,28 @@ def update_story_global(calc_manager, quantities, inputs, workflow_dict,success=
             else:
                 var_names = calc_manager['var']
 
+            row = dict(zip(quantities.columns, quantities.values[i].tolist()))
+            row.update({'global_step': workflow_dict['global_step'], 'parameters_studied': var_names})
             if  False in quantities.values[i].tolist():
-                workflow_story_list = [workflow_dict['global_step']]+quantities.values[i].tolist()+[var_names]+\
-                        [False, True]
+                row.update({'useful': False, 'failed': True})
                 errors = True
             else:
-                workflow_story_list = [workflow_dict['global_step']]+quantities.values[i].tolist()+[var_names]+\
-                        [True, False]
-
-            workflow_df = pd.DataFrame([workflow_story_list], columns = ['global_step']+list(quantities.columns)+['parameters_studied']+\
-                    ['useful','failed'])
+                row.update({'useful': True, 'failed': False})
 
-            #workflow_dict['workflow_story'] = workflow_dict['workflow_story'].append(workflow_df, ignore_index=True)
-            workflow_dict['workflow_story'] = pd.concat([workflow_dict['workflow_story'],workflow_df], ignore_index=True)
+            story.append(row)
    
-    for i in range(1,len(workflow_dict['workflow_story'])+1):
+    uuids = story.column('uuid')
+    for i in range(1,len(story)+1):
         try:                
-            last_ok_uuid = workflow_dict['workflow_story'].iloc[-i]['uuid']
+            last_ok_uuid = uuids[-i]
             #last_ok_wfl = get_caller(last_ok_uuid, depth = 1)
             start_from_converged(inputs, last_ok_uuid)
             if calc_manager['var'] == 'kpoint_mesh' or calc_manager['var'] == 'kpoint_density':
                 set_parent(inputs, load_node(last_ok_uuid))
             break
         except:
-            last_ok_uuid = workflow_dict['workflow_story'].iloc[-1]['uuid']
+            last_ok_uuid = uuids[-1]
             #last_ok_wfl = get_caller(last_ok_uuid, depth = 1)
-    
-    workflow_dict['workflow_story'] = workflow_dict['workflow_story'].replace({np.nan:None})
 
     final_result={'uuid': last_ok_uuid,'errors':errors}
         
@@ -593,35 +587,36 @@ def post_analysis_update(inputs, calc_manager, oversteps, none_encountered, work
     
     final_result = {}
     
+    story = workflow_dict['workflow_story']
+
     if 'new_algorithm' in calc_manager['convergence_algorithm']:
-        workflow_dict['workflow_story'].loc[:,'useful']=False
+        story.set_values('useful', slice(None), False)
         print(oversteps)
         if success == 'new_grid': 
             return {}
         elif success:
-            workflow_dict['workflow_story'].loc[oversteps[0],'useful']=True
+            story.set_values('useful', oversteps[0], True)
     else:
         for i in oversteps: 
-            gs = workflow_dict['workflow_story']['global_step'][workflow_dict['workflow_story']['uuid']==i].index
-            workflow_dict['workflow_story'].loc[gs,'useful']=False
+            story.set_values('useful', story.column('uuid')==i, False)
     
     if len(oversteps)>0 and calc_manager['convergence_algorithm']=='dummy':
         for i in range(calc_manager['iter']*(calc_manager['steps']-calc_manager['skipped'])-len(oversteps)):
             for j in calc_manager['var']:
                 workflow_dict['parameter_space'][j].pop(0)
     for i in none_encountered: 
-            gs = workflow_dict['workflow_story']['global_step'][workflow_dict['uuid']==i].index
-            workflow_dict['workflow_story'].loc[gs,'failed']=True
-            workflow_dict['workflow_story'].loc[gs,'useful']=False
+            story.set_values('failed', story.column('uuid')==i, True)
+            story.set_values('useful', story.column('uuid')==i, False)
 
     #try:
-    if len(workflow_dict['workflow_story'][(workflow_dict['workflow_story']['useful'] == True) & (workflow_dict['workflow_story']['failed'] == False)]) > 0:
-        last_ok_uuid = workflow_dict['workflow_story'][(workflow_dict['workflow_story']['useful'] == True) & (workflow_dict['workflow_story']['failed'] == False)].iloc[-1]['uuid']
+    ok = story.mask(useful=True, failed=False)
+    if ok.any():
+        last_ok_uuid = story.column('uuid')[ok][-1]
         #last_ok_wfl = get_caller(last_ok_uuid, depth = 1)
         mesh = 'kpoint_mesh' in calc_manager['var'] or 'kpoint_density' in calc_manager['var']
         start_from_converged(inputs, last_ok_uuid,mesh=mesh)
         if 'kpoint_density' in calc_manager['var']:
-            calc_manager['kdensity'] = workflow_dict['workflow_story'][(workflow_dict['workflow_story']['useful'] == True) & (workflow_dict['workflow_story']['failed'] == False)].iloc[-1]['kpoint_density']
+            calc_manager['kdensity'] = story.column('kpoint_density')[ok][-1]
 
         if 'kpoint_mesh' in calc_manager['var'] or 'kpoint_density' in calc_manager['var']:
             set_parent(inputs, load_node(last_ok_uuid)) 
@@ -630,8 +625,6 @@ def post_analysis_update(inputs, calc_manager, oversteps, none_encountered, work
     #except:
     #    last_ok_uuid = workflow_dict['workflow_story'].iloc[-1]['uuid']
     #    last_ok_wfl = get_caller(last_ok_uuid, depth = 1)
-
-    workflow_dict['workflow_story'] = workflow_dict['workflow_story'].replace({np.nan:None})
     
     try:
         final_result={'uuid': last_ok_uuid,}
@@ -699,7 +692,7 @@ def analysis_and_decision(calc_dict, workflow_manager,parameter_space=[],hints={
     
     if parameter_space == []:
         parameter_space = workflow_manager['parameter_space']
-    workflow_story = pd.DataFrame(workflow_manager['workflow_story']) 
+    workflow_story = workflow_manager['workflow_story'].to_frame() 
     if 1:
         var = []
         for v in calc_dict['var']:
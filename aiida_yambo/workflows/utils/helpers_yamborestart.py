@@ -2,9 +2,11 @@
 """Classes for calcs e wfls analysis. hybrid AiiDA and not_AiiDA...hopefully"""
 from __future__ import absolute_import
 import numpy as np
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
 import cmath
 
@@ -13,6 +15,7 @@ try:
     from aiida.plugins import CalculationFactory, DataFactory
     from aiida_yambo.utils.common_helpers import *
     from aiida_yambo.utils.parallelism_finder import *
+    from aiida_yambo.utils.resource_estimator import *
 except:
     pass
 
@@ -75,10 +78,17 @@ def fix_memory(resources, failed_calc, exit_status, max_nodes, iteration):
         else:
             resources['num_machines'] = int(max_nodes)'''
         
-    if resources['num_mpiprocs_per_machine']>1:
+    output_params = failed_calc.outputs.output_parameters.get_dict()
+    if 'memory_peak' in output_params:
+        factor = memory_factor_from_summary(output_params['memory_peak'], output_params['memory_last_alloc'])
+    else:
+        factor = memory_factor(output_params.get('memstats', []))
+    if factor: # extrapolated from the memstats of the failed run
+        resources = memory_resources(resources, factor, max_nodes, has_gpu=output_params['has_gpu'])[0]
+    elif resources['num_mpiprocs_per_machine']>1:
         if increase_nodes: resources['num_machines'] = min(max_nodes,int(resources['num_machines']*1.5))
 
-        if not failed_calc.outputs.output_parameters.get_dict()['has_gpu']:
+        if not output_params['has_gpu']:
             resources['num_cores_per_mpiproc'] = int(resources['num_cores_per_mpiproc']*2)
             resources['num_mpiprocs_per_machine'] = int(resources['num_mpiprocs_per_machine']/2)
 
@@ -101,8 +111,13 @@ def fix_memory(resources, failed_calc, exit_status, max_nodes, iteration):
 
     return new_parallelism, new_resources, pop_list
 
-def fix_time(options, restart, max_walltime):
-    options['max_wallclock_seconds'] = \
+def fix_time(options, restart, max_walltime, output_params={}):
+    required = required_walltime(output_params)
+    if required: # what was left of the running step, from its progress bar
+        options['max_wallclock_seconds'] = \
+                            int(max(required, options['max_wallclock_seconds']*1.5))
+    else:
+        options['max_wallclock_seconds'] = \
                             int(options['max_wallclock_seconds']*1.5*restart)
 
     if options['max_wallclock_seconds'] > max_walltime:
@@ -2,14 +2,16 @@
 """Classes for calcs e wfls analysis. hybrid AiiDA and not_AiiDA...hopefully"""
 from __future__ import absolute_import
 import numpy as np
-from matplotlib import pyplot as plt, style
+from aiida_yambo.utils.lazy import lazy_import
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
 import copy
-import xarray
-from ase.units import Ha
+xarray = lazy_import('xarray')
+units = lazy_import('ase.units')
 
-from yambopy.dbs.qpdb import *
-from yambopy.dbs.savedb import * 
-from qepy.lattice import Path
+YamboQPDB = lazy_import('yambopy.dbs.qpdb', 'YamboQPDB')
+YamboSaveDB = lazy_import('yambopy.dbs.savedb', 'YamboSaveDB')
+Path = lazy_import('qepy.lattice', 'Path')
 from aiida.tools.data.array.kpoints import get_kpoints_path, get_explicit_kpoints_path
 
 try:
@@ -21,26 +23,16 @@ except:
     pass
 
 from aiida_yambo.utils.defaults.create_defaults import *
+from aiida_yambo.utils.ndb_cache import qp_dataset, ndb_arrays
 
 import pathlib
 import tempfile
 
 def check_kpoints_in_qe_grid(qe_grid,point):
         maps = []
-        ind = 1 
-        found = False
-        for g in qe_grid:
-            for k in permutations(g):
-                test = abs(abs(np.array(k))-abs(np.array(point)))
-                if test.dot(test) < 1e-4:
-                    print(point,ind)
-                    found = True
-                    maps.append([point,ind])
-                    break
-                else:
-                    found = False
-
-            ind += 1
+        for ind in kpoint_index(qe_grid).find(point):
+            print(point,ind+1)
+            maps.append([point,ind+1])
                     
         return maps
 
@@ -369,9 +361,10 @@ def add_corrections(workchain_inputs, additional_parsing_List): #pre proc
 
 def parse_qp_level(calc, level_map):
 
-    _vb=find_table_ind(level_map[2], level_map[1], calc.outputs.array_ndb)
-    level_dft = calc.outputs.array_ndb.get_array('Eo')[_vb].real
-    level_corr = calc.outputs.array_ndb.get_array('E_minus_Eo')[_vb].real
+    array_ndb = ndb_arrays(calc.outputs.array_ndb)
+    _vb=find_table_ind(level_map[2], level_map[1], array_ndb)
+    level_dft = array_ndb['Eo'][_vb].real
+    level_corr = array_ndb['E_minus_Eo'][_vb].real
 
     level_gw = (level_dft + level_corr)*27.2114
 
@@ -379,12 +372,13 @@ def parse_qp_level(calc, level_map):
 
 def parse_qp_gap(calc, gap_map): #post proc 
 
-    _vb=find_table_ind(gap_map[0], gap_map[2], calc.outputs.array_ndb)
-    _cb=find_table_ind(gap_map[1][0], gap_map[1][2], calc.outputs.array_ndb)
-    _vb_level_dft = calc.outputs.array_ndb.get_array('Eo')[_vb].real
-    _vb_level_corr = calc.outputs.array_ndb.get_array('E_minus_Eo')[_vb].real
-    _cb_level_dft = calc.outputs.array_ndb.get_array('Eo')[_cb].real
-    _cb_level_corr = calc.outputs.array_ndb.get_array('E_minus_Eo')[_cb].real
+    array_ndb = ndb_arrays(calc.outputs.array_ndb)
+    _vb=find_table_ind(gap_map[0], gap_map[2], array_ndb)
+    _cb=find_table_ind(gap_map[1][0], gap_map[1][2], array_ndb)
+    _vb_level_dft = array_ndb['Eo'][_vb].real
+    _vb_level_corr = array_ndb['E_minus_Eo'][_vb].real
+    _cb_level_dft = array_ndb['Eo'][_cb].real
+    _cb_level_corr = array_ndb['E_minus_Eo'][_cb].real
 
     _vb_level_gw = (_vb_level_dft + _vb_level_corr)*27.2114
     _cb_level_gw = (_cb_level_dft + _cb_level_corr)*27.2114
@@ -525,91 +519,77 @@ def organize_output(output, node=None): #prepare to be stored
 
 def QP_analyzer(pk,QP_db,mapping):
     ywfl = load_node(pk)
-    # Create temporary directory
-    with tempfile.TemporaryDirectory() as dirpath:
-        # Open the output file from the AiiDA storage and copy content to the temporary file    
-        try:
-            filename='ndb.QP_fixed'
-            temp_file = pathlib.Path(dirpath) / filename
-            with QP_db.base.repository.open(filename, 'rb') as handle:
-                temp_file.write_bytes(handle.read())
-        except:
-            filename='ndb.QP'
-            temp_file = pathlib.Path(dirpath) / filename
-            with QP_db.base.repository.open(filename, 'rb') as handle:
-                temp_file.write_bytes(handle.read())
-
-        db = xarray.open_dataset(dirpath+'/'+filename,engine='netcdf4')
-        k_mesh = find_pw_parent(ywfl).outputs.output_band.get_kpoints()
-        v = mapping['valence']
-        c = mapping['conduction']
-        soc = mapping['soc']
-        where_v = np.where(db.QP_table[0,:] <= v)
-        where_c = np.where(db.QP_table[0,:] >= c)
-        
-        v_min = db.QP_table[0,:].min()
-        c_max = db.QP_table[0,:].max()
-        
-        print('vmin,cmax , ',v_min.values,c_max.values)
-        
-        where_v_max_dft = np.where(db.QP_Eo[:] == db.QP_Eo[where_v[0]].max())[0]
-        where_c_min_dft = np.where(db.QP_Eo[:] == db.QP_Eo[where_c[0]].min())[0]
-        
-        where_v_max = np.where(db.QP_E[:,0] == db.QP_E[where_v[0],0].max())[0]
-        where_c_min = np.where(db.QP_E[:,0] == db.QP_E[where_c[0],0].min())[0]
-        
-        dft_gap = db.QP_Eo[where_c_min_dft][0]*Ha-db.QP_Eo[where_v_max_dft][0]*Ha
-        gw_gap = db.QP_E[where_c_min,0][0]*Ha-db.QP_E[where_v_max,0][0]*Ha
-        print('DFT gap = {} eV'.format(dft_gap.values))
-        print('GW gap = {} eV'.format(gw_gap.values))
+    db = qp_dataset(QP_db, copy=False) #ndb.QP_fixed (or ndb.QP), decoded once per content
+    k_mesh = find_pw_parent(ywfl).outputs.output_band.get_kpoints()
+    v = mapping['valence']
+    c = mapping['conduction']
+    soc = mapping['soc']
+    where_v = np.where(db.QP_table[0,:] <= v)
+    where_c = np.where(db.QP_table[0,:] >= c)
+    
+    v_min = db.QP_table[0,:].min()
+    c_max = db.QP_table[0,:].max()
+    
+    print('vmin,cmax , ',v_min.values,c_max.values)
+    
+    where_v_max_dft = np.where(db.QP_Eo[:] == db.QP_Eo[where_v[0]].max())[0]
+    where_c_min_dft = np.where(db.QP_Eo[:] == db.QP_Eo[where_c[0]].min())[0]
+    
+    where_v_max = np.where(db.QP_E[:,0] == db.QP_E[where_v[0],0].max())[0]
+    where_c_min = np.where(db.QP_E[:,0] == db.QP_E[where_c[0],0].min())[0]
+    
+    dft_gap = db.QP_Eo[where_c_min_dft][0]*units.Ha-db.QP_Eo[where_v_max_dft][0]*units.Ha
+    gw_gap = db.QP_E[where_c_min,0][0]*units.Ha-db.QP_E[where_v_max,0][0]*units.Ha
+    print('DFT gap = {} eV'.format(dft_gap.values))
+    print('GW gap = {} eV'.format(gw_gap.values))
+    
+    k_v_dft = db.QP_table[2,where_v_max_dft]
+    k_c_dft = db.QP_table[2,where_c_min_dft]
+    k_v = db.QP_table[2,where_v_max]
+    k_c = db.QP_table[2,where_c_min]
+
+    """
+    I do the following two lined because we may have this:
+    k_v=
+        <xarray.DataArray 'QP_table' (D_0000000003: 1)>
+        array([[1.]], dtype=float32)
+        Dimensions without coordinates: D_0000000003, D_0000000003
         
-        k_v_dft = db.QP_table[2,where_v_max_dft]
-        k_c_dft = db.QP_table[2,where_c_min_dft]
-        k_v = db.QP_table[2,where_v_max]
-        k_c = db.QP_table[2,where_c_min]
-
-        """
-        I do the following two lined because we may have this:
-        k_v=
-            <xarray.DataArray 'QP_table' (D_0000000003: 1)>
-            array([[1.]], dtype=float32)
-            Dimensions without coordinates: D_0000000003, D_0000000003
-            
-        so it is needed.
-        """
-        if len(k_v) > 1: k_v=k_v.values[0]
-        if len(k_c) > 1: k_c=k_c.values[0]
+    so it is needed.
+    """
+    if len(k_v) > 1: k_v=k_v.values[0]
+    if len(k_c) > 1: k_c=k_c.values[0]
 
-        k_coord_v = k_mesh[int(k_v)-1]
-        k_coord_c = k_mesh[int(k_c)-1]
-        
-        print(k_v.values,k_c.values)
-        print(k_coord_v,k_coord_c)
-        
-        delta_k = abs(abs(k_coord_c)-abs(k_coord_v))
-        print(delta_k)
-        
-        l = check_kpoints_in_qe_grid(k_mesh,delta_k)
-        
-        print(l)
-        plt.plot(db.QP_table[2,where_v[0]],db.QP_E[where_v[0],0]*Ha,'o')
-        plt.plot(db.QP_table[2,where_c[0]],db.QP_E[where_c[0],0]*Ha,'o')
+    k_coord_v = k_mesh[int(k_v)-1]
+    k_coord_c = k_mesh[int(k_c)-1]
+    
+    print(k_v.values,k_c.values)
+    print(k_coord_v,k_coord_c)
+    
+    delta_k = abs(abs(k_coord_c)-abs(k_coord_v))
+    print(delta_k)
+    
+    l = check_kpoints_in_qe_grid(k_mesh,delta_k)
+    
+    print(l)
+    plt.plot(db.QP_table[2,where_v[0]],db.QP_E[where_v[0],0]*units.Ha,'o')
+    plt.plot(db.QP_table[2,where_c[0]],db.QP_E[where_c[0],0]*units.Ha,'o')
 
-        #plt.ylim(-0.2,-0.1)
-        
-        BSE_mapper = {
-            'nscf_pk':find_pw_parent(ywfl).pk,
-            'v_min':int(v_min.values), # lowest valence band in BSE
-            'c_max':int(c_max.values), # highest conduction band in BSE
-            'q_ind':l[0][1],
-            'GW_k_v_ind':int(k_v),
-            'GW_k_c_ind':int(k_c),
-            'candidate_for_BSE':bool(gw_gap.values>=0),
-            'gap_GW':np.round(gw_gap.values,4),
-            #'gap_DFT':np.round(dft_gap.values,4),
-            'QP_pk':QP_db.pk,
-            'SOC':soc,
-        
-        }
-        
-        return BSE_mapper
+    #plt.ylim(-0.2,-0.1)
+    
+    BSE_mapper = {
+        'nscf_pk':find_pw_parent(ywfl).pk,
+        'v_min':int(v_min.values), # lowest valence band in BSE
+        'c_max':int(c_max.values), # highest conduction band in BSE
+        'q_ind':l[0][1],
+        'GW_k_v_ind':int(k_v),
+        'GW_k_c_ind':int(k_c),
+        'candidate_for_BSE':bool(gw_gap.values>=0),
+        'gap_GW':np.round(gw_gap.values,4),
+        #'gap_DFT':np.round(dft_gap.values,4),
+        'QP_pk':QP_db.pk,
+        'SOC':soc,
+    
+    }
+    
+    return BSE_mapper
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""In-process merge of split ndb.QP databases (same output of `yambopy mergeqp`)."""
+from __future__ import absolute_import
+import numpy as np
+import netCDF4
+
+#per-QP variables and the axis running over the QP states.
+QP_VARIABLES = {'QP_table':1, 'QP_E':0, 'QP_Eo':0, 'QP_Z':0, 'QP_E_Eo_Z':1}
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray)):
+        return netCDF4.Dataset('ndb.QP', mode='r', memory=bytes(source))
+    return netCDF4.Dataset(str(source), mode='r')
+
+def _dimensions(array):
+    return tuple('D_%010d' % d for d in array.shape)
+
+def merge_ndb_QP(sources, output):
+    """Merge the ndb.QP files in sources (paths or file contents as bytes) into output.
+
+    The per-QP variables are concatenated, states repeated in more files
+    (same band/band/k row of QP_table) are kept only once, QP_kpts is filled by
+    k index. Everything else is copied from the first file, variable by variable.
+    """
+    datasets = [_open(s) for s in sources]
+    try:
+        present = [v for v in QP_VARIABLES if v in datasets[0].variables]
+        merged = {v: np.concatenate([np.asarray(d[v][:]) for d in datasets], axis=QP_VARIABLES[v]) for v in present}
+
+        table = merged['QP_table'].T.astype(int)
+        _, first = np.unique(table, axis=0, return_index=True)
+        keep = np.sort(first)
+        for v in present:
+            merged[v] = np.take(merged[v], keep, axis=QP_VARIABLES[v])
+        table = table[keep]
+
+        nkpoints = int(table[:,2].max())
+        kpts = np.zeros((3, nkpoints))
+        for d in datasets:
+            k = np.unique(np.asarray(d['QP_table'][2,:], dtype=int)) - 1
+            kpts[:,k] = np.asarray(d['QP_kpts'][:])[:,k]
+        merged['QP_kpts'] = kpts
+
+        fin = datasets[0]
+        with netCDF4.Dataset(output, mode='w', format=fin.data_model) as fout:
+            for name, dim in fin.dimensions.items():
+                fout.createDimension(name, None if dim.isunlimited() else len(dim))
+            for array in merged.values():
+                for name, size in zip(_dimensions(array), array.shape):
+                    if name not in fout.dimensions: fout.createDimension(name, size)
+
+            for name, var in fin.variables.items():
+                if name in merged:
+                    out = fout.createVariable(name, var.datatype, _dimensions(merged[name]))
+                    out[:] = merged[name]
+                else:
+                    out = fout.createVariable(name, var.datatype, var.dimensions)
+                    out[:] = var[:]
+
+            pars = np.asarray(fin['PARS'][:]).copy()
+            pars[1:3] = nkpoints, len(table)
+            fout['PARS'][:] = pars
+
+            nstrings = int(pars[4]) if len(pars) > 4 else 0
+            desc = 'DESC_strings_%05d' % nstrings
+            if nstrings and desc in fout.variables:
+                description = " QP @ K %03d - %03d : b %03d - %03d" % (table[:,2].min(), table[:,2].max(),
+                                                                       table[:,1].min(), table[:,1].max())
+                length = fout[desc].shape[-1]
+                fout[desc][0] = np.array(list(description.ljust(length)[:length]), dtype='S1')
+    finally:
+        for d in datasets:
+            d.close()
+
+    return output
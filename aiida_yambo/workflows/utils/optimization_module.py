@@ -1,10 +1,12 @@
 from __future__ import absolute_import
 import numpy as np
-from scipy import optimize
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+optimize = lazy_import('scipy.optimize')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
-from ase import Atoms
+Atoms = lazy_import('ase', 'Atoms')
 from aiida_yambo.utils.common_helpers import *
 
 class Convergence_evaluator(): 
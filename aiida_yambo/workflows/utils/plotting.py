@@ -5,11 +5,12 @@ from __future__ import print_function
 import sys
 import os
 import shutil
-import matplotlib
-from mpl_toolkits.mplot3d import Axes3D
+from aiida_yambo.utils.lazy import lazy_import
+matplotlib = lazy_import('matplotlib')
+Axes3D = lazy_import('mpl_toolkits.mplot3d', 'Axes3D')
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
+plt = lazy_import('matplotlib.pyplot')
+pd = lazy_import('pandas')
 from aiida.orm import load_node
 from aiida_yambo.utils.common_helpers import*
 from aiida.orm.nodes.process.workflow.workchain import WorkChainNode
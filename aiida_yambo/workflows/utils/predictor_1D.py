@@ -1,13 +1,16 @@
 from __future__ import absolute_import
 
 import numpy as np
-from scipy import optimize
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+optimize = lazy_import('scipy.optimize')
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
-from ase import Atoms
+Atoms = lazy_import('ase', 'Atoms')
 from aiida_yambo.utils.common_helpers import *
+from aiida_yambo.workflows.utils.thresholds import first_converged_1D
 
 
 def create_grid_1D(edges=[],delta=[],alpha=1/3,add = [],var=['BndsRnXp',],shift=0):
@@ -216,8 +219,6 @@ class The_Predictor_1D():
 
             self.X_fit = l[0][:l_min]*l[1][:l_min]*l[2][:l_min]
         
-        self.Zx_fit = fx(self.X_fit,popt[0])
-        
         self.extra = popt[1]
 
         ###########Estimation of the plateaux corner###############
@@ -235,10 +236,10 @@ class The_Predictor_1D():
             
         if self.var_[0] == 'kpoint_mesh': thr = thr/2
         
-        self.condition_conv_calc = np.where(abs(self.Zx_fit)<thr_fx)
+        conv_x = first_converged_1D(popt,alpha,self.X_fit,thr_fx)
         
-        if len(self.X_fit[self.condition_conv_calc]) == 0 : return False
-        if not b: b = max(max(xdata),self.X_fit[self.condition_conv_calc][0])
+        if conv_x is None : return False
+        if not b: b = max(max(xdata),conv_x)
             
         #print('b: {}\ng: {}'.format(b,g))
         
@@ -257,10 +258,10 @@ class The_Predictor_1D():
         if verbose: print('relative err extra - highest point from fit = {}%'.format(round(100*abs((popt[1]-p_H)/(p_H)),3)))
         
         if self.var_[0] == 'kpoint_mesh':
-            self.kx_fit = self.kx_fit[self.X_fit <= max(max(xdata),self.X_fit[self.condition_conv_calc][0]*1.5)]
-            self.ky_fit = self.ky_fit[self.X_fit <= max(max(xdata),self.X_fit[self.condition_conv_calc][0]*1.5)]
-            self.kz_fit = self.kz_fit[self.X_fit <= max(max(xdata),self.X_fit[self.condition_conv_calc][0]*1.5)]
-            self.X_fit = self.X_fit[self.X_fit <= max(max(xdata),self.X_fit[self.condition_conv_calc][0]*1.5)]
+            self.kx_fit = self.kx_fit[self.X_fit <= max(max(xdata),conv_x*1.5)]
+            self.ky_fit = self.ky_fit[self.X_fit <= max(max(xdata),conv_x*1.5)]
+            self.kz_fit = self.kz_fit[self.X_fit <= max(max(xdata),conv_x*1.5)]
+            self.X_fit = self.X_fit[self.X_fit <= max(max(xdata),conv_x*1.5)]
         else:
             self.X_fit = np.arange(min(xdata),b+1,self.delta_)
         
@@ -1,13 +1,17 @@
 from __future__ import absolute_import
 
 import numpy as np
-from scipy import optimize
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt, style
-import pandas as pd
+from aiida_yambo.utils.lazy import lazy_import
+optimize = lazy_import('scipy.optimize')
+curve_fit = lazy_import('scipy.optimize', 'curve_fit')
+plt = lazy_import('matplotlib.pyplot')
+style = lazy_import('matplotlib.style')
+pd = lazy_import('pandas')
 import copy
-from ase import Atoms
+Atoms = lazy_import('ase', 'Atoms')
 from aiida_yambo.utils.common_helpers import *
+from aiida_yambo.workflows.utils.thresholds import first_converged_2D, derivatives_2D
+from aiida_yambo.workflows.utils.separable_fit import fit_separable_2D
 
 
 def create_grid(edges=[],delta=[],alpha=0.25,add = [[],[]],var=['BndsRnXp','NGsBlkXp'],shift=[0,0]):
@@ -146,22 +150,18 @@ class The_Predictor_2D():
             
 ################################################################
 
-    def fit_space_2D(self,fit=False,alpha=1,beta=1,reference = None,verbose=True,plot=False,dim=100,colormap='gist_rainbow_r',b=None,g=None,save=False,thr_fx=5e-5,thr_fy=5e-5,thr_fxy=1e-8):
+    def fit_space_2D(self,fit=False,alpha=1,beta=1,reference = None,verbose=True,plot=False,dim=100,colormap='gist_rainbow_r',b=None,g=None,save=False,thr_fx=5e-5,thr_fy=5e-5,thr_fxy=1e-8,popt=None):
         
         f = lambda x,a,b,c,d: (a/x[0]**alpha + b)*( c/x[1]**beta + d)
-        fx = lambda x,a,c,d: -alpha*a/(x[0]**(alpha+1))*( c/x[1] + d)
-        fy = lambda x,a,b,c: (a/x[0] + b)*( -beta*c/x[1]**(beta+1) )
-        
-        fxy = lambda x,a,c: -alpha*a/(x[0]**(alpha+1))*( -beta*c/x[1]**(beta+1))
          
         xdata,ydata = np.array((self.parameters[0,:],self.parameters[1,:])),self.r[:]
         print('fitting all simulations.')
         
         print(np.shape(1/(xdata[0]*xdata[1])))
-            
-        popt,pcov = curve_fit(f,xdata=xdata,
-                      ydata=ydata,sigma=1/(xdata[0]*xdata[1]),
-                      bounds=([-np.inf,-np.inf,-np.inf,-np.inf],[np.inf,np.inf,np.inf,np.inf]))
+        
+        if popt is None:
+            pairs, popts, MAEs = fit_separable_2D(xdata[0], xdata[1], ydata, alphas=[alpha], betas=[beta])
+            popt = popts[0]
         
         MAE_int = np.average((abs(f(xdata,popt[0],popt[1],popt[2],popt[3],)-ydata)),weights=xdata[0]*xdata[1])
         #print('MAE fit = {} eV'.format(MAE_int))
@@ -178,14 +178,8 @@ class The_Predictor_2D():
             #print('conv_thr, ',self.conv_thr)
         ############Preliminary fit#################################
         
-        self.X_fit = np.arange(min(xdata[0]),max(xdata[0])*10,self.delta_[0])
-        self.Y_fit = np.arange(min(xdata[1]),max(xdata[1])*10,self.delta_[1])
-                
-        self.Zx_fit = fx(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[2],popt[3])
-        self.Zy_fit = fy(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[1],popt[2])
-        self.Zxy_fit = fxy(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[2])
-        
-        self.X_fit,self.Y_fit = np.meshgrid(self.X_fit,self.Y_fit)
+        X_fit = np.arange(min(xdata[0]),max(xdata[0])*10,self.delta_[0])
+        Y_fit = np.arange(min(xdata[1]),max(xdata[1])*10,self.delta_[1])
         
         self.extra = popt[1]*popt[3]
 
@@ -194,27 +188,20 @@ class The_Predictor_2D():
         if reference == 'extra':
             reference = self.extra
         else:
-            self.Z_fit = f(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[1],popt[2],popt[3])  
-            reference = self.Z_fit[-1,-1]
+            reference = f(np.array((X_fit[-1],Y_fit[-1])),popt[0],popt[1],popt[2],popt[3])
             
         if self.conv_thr_units=='%':
             thr = self.conv_thr*abs(reference)/100
         else:
             thr = self.conv_thr
         
-        self.condition_conv_calc = np.where((abs(self.Zx_fit)<thr_fx) & \
-                            (abs(self.Zy_fit)<thr_fy) & \
-                            (abs(self.Zxy_fit)<thr_fxy))
-        
-        self.old_X_fit =self.X_fit
-        self.old_Y_fit =self.Y_fit
-        self.old_Z_fit =self.Z_fit
+        #closed form on the grid axes, first_converged_2D_grid is the meshgrid scan.
+        conv_point = first_converged_2D(popt,alpha,beta,X_fit,Y_fit,thr_fx=thr_fx,thr_fy=thr_fy,thr_fxy=thr_fxy)
         
-        print(self.Zx_fit)
-        print(self.X_fit[self.condition_conv_calc])
-        if len(self.X_fit[self.condition_conv_calc]) == 0 : return False
-        if not b: b = max(max(xdata[0]),self.X_fit[self.condition_conv_calc][0]*1.25)
-        if not g: g = max(max(xdata[1]),self.Y_fit[self.condition_conv_calc][0]*1.25)
+        print(conv_point)
+        if conv_point is None : return False
+        if not b: b = max(max(xdata[0]),conv_point[0]*1.25)
+        if not g: g = max(max(xdata[1]),conv_point[1]*1.25)
             
         #print('b: {}\ng: {}'.format(b,g))
         
@@ -237,9 +224,7 @@ class The_Predictor_2D():
         
         self.Z_fit = f(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[1],popt[2],popt[3])
         
-        self.Zx_fit = fx(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[2],popt[3])
-        self.Zy_fit = fy(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[1],popt[2])
-        self.Zxy_fit = fxy(np.meshgrid(self.X_fit,self.Y_fit),popt[0],popt[2])
+        self.Zx_fit,self.Zy_fit,self.Zxy_fit = derivatives_2D(*np.meshgrid(self.X_fit,self.Y_fit),popt=popt,alpha=alpha,beta=beta)
         
         self.X_fit,self.Y_fit = np.meshgrid(self.X_fit,self.Y_fit)
 
@@ -333,23 +318,19 @@ class The_Predictor_2D():
         return explicit_gw_result
     
     
-    def analyse(self,old_hints={},reference = None, plot= False,save_fit=False,save_next = False,colormap='viridis',thr_fx=5e-5,thr_fy=5e-5,thr_fxy=1e-8):
+    def analyse(self,old_hints={},reference = None, plot= False,save_fit=False,save_next = False,colormap='viridis',thr_fx=5e-5,thr_fy=5e-5,thr_fxy=1e-8,power_laws=[1,2]):
         
         self.check_passed = True
-        error = 10
 
-        power_laws = [1,2]
-        for i in power_laws:
-            for j in power_laws:
-                print(i,j)
-                self.fit_space_2D(fit=True,alpha=i,beta=j,plot=False,dim=10, colormap='viridis',reference=reference,thr_fx=thr_fx,thr_fy=thr_fy,thr_fxy=thr_fxy)
-                if self.MAE_fit<error: 
-                    ii,jj = i,j
-                    error = self.MAE_fit
+        #all the power laws fitted at once, only the best one is then expanded on the grid.
+        pairs, popts, MAEs = fit_separable_2D(self.parameters[0,:], self.parameters[1,:], self.r[:], alphas=power_laws, betas=power_laws)
+        best = int(np.argmin(MAEs))
+        ii,jj = pairs[best]
+        self.fit_quality = {(i,j):m for (i,j),m in zip(pairs.tolist(),MAEs)}
 
         print('\nBest power laws: {}, {}\n'.format(ii,jj))            
         
-        self.check_passed = self.fit_space_2D(fit=True,alpha=ii,beta=jj,verbose=False,plot=plot,save=save_fit,colormap=colormap,reference=reference,thr_fx=thr_fx,thr_fy=thr_fy,thr_fxy=thr_fxy)
+        self.check_passed = self.fit_space_2D(fit=True,alpha=ii,beta=jj,verbose=False,plot=plot,save=save_fit,colormap=colormap,reference=reference,thr_fx=thr_fx,thr_fy=thr_fy,thr_fxy=thr_fxy,popt=popts[best])
         
         if not self.check_passed:
             self.point_reached = False
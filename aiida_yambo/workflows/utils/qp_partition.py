@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Cost-balanced partition of QP states ([k,k,b,b] QPkrange entries) in subsets.
+
+Any callable state -> cost can be used; LinearCostModel estimates the cost
+from features of the state (band energy, degeneracy, k-point weight), with
+coefficients fitted on the timings of previous split runs.
+"""
+from __future__ import absolute_import
+import heapq
+import numpy as np
+
+
+def expand_states(qp_ranges, consider_only=[-1]):
+    """[k,k,b,b] states of a list of [k_i,k_f,b_i,b_f] ranges, as in QP_list_merger."""
+    return [[k,k,b,b] for k_i,k_f,b_i,b_f in qp_ranges for k in range(k_i,k_f+1) for b in range(b_i,b_f+1)
+            if (b in consider_only) or (consider_only[0]==-1)]
+
+def lpt_partition(states, cost, n_subsets):
+    """Longest processing time first: states sorted by decreasing cost, each one to
+    the subset with the lowest total cost so far. Ties are broken by the order of
+    the states and by subset index, so the result is deterministic.
+    Subsets keep the order of the states; empty subsets are dropped."""
+    n_subsets = max(1, min(int(n_subsets), len(states)))
+    costs = [float(cost(s)) for s in states]
+    order = sorted(range(len(states)), key=lambda i: (-costs[i], i))
+    loads = [(0.0, j) for j in range(n_subsets)]
+    assigned = [[] for _ in range(n_subsets)]
+    for i in order:
+        load, j = heapq.heappop(loads)
+        assigned[j].append(i)
+        heapq.heappush(loads, (load+costs[i], j))
+    return [[states[i] for i in sorted(a)] for a in assigned if a]
+
+def QP_subset_cost(subset, cost=None):
+    """Predicted cost of a QPkrange (list of [k_i,k_f,b_i,b_f]): sum of cost(state)
+    over its states, the number of states if cost is None."""
+    states = expand_states(subset)
+    if cost is None: return float(len(states))
+    return float(sum(cost(s) for s in states))
+
+def QP_waves(subsets, parallel_runs, cost=None):
+    """Subsets grouped in waves of parallel_runs, submitted one after the other:
+    the most expensive subsets first (ties keep the given order), so that the
+    runs of a wave have similar costs and finish together."""
+    costs = [QP_subset_cost(subset, cost) for subset in subsets]
+    order = sorted(range(len(subsets)), key=lambda i: (-costs[i], i))
+    parallel_runs = max(1, int(parallel_runs))
+    return [[subsets[i] for i in order[j:j+parallel_runs]] for j in range(0, len(order), parallel_runs)]
+
+def makespan(subsets, cost):
+    return max([sum(cost(s) for s in subset) for subset in subsets], default=0)
+
+def band_features(bands, k_weights=None, fermi=0, degeneracy_tol=1e-3):
+    """features(state) = [1, |E-E_F| (eV), degeneracy of the level, 1/k-point weight],
+    bands (n_k, n_bands) in eV as in the BandsData of the nscf."""
+    bands = np.asarray(bands, dtype=float)
+    weights = np.ones(len(bands)) if k_weights is None else np.asarray(k_weights, dtype=float)
+    def features(state):
+        k, b = state[0]-1, state[2]-1
+        e = bands[k, b]
+        return [1.0, abs(e-fermi), float(np.sum(abs(bands[k]-e) < degeneracy_tol)), 1/weights[k]]
+    return features
+
+class LinearCostModel():
+    """cost(state) = theta . features(state).
+
+    fit() takes previous runs as (states, seconds): the time of a run is the sum of the
+    costs of its states, so theta is a (non-negative) least squares solution on the
+    summed features. Without runs every state costs the same.
+    """
+
+    def __init__(self, features=lambda state: [1.0], theta=None):
+        self.features = features
+        self.theta = theta
+
+    def fit(self, runs):
+        runs = [(states, seconds) for states, seconds in runs if len(states) and seconds]
+        if not runs: return self
+        A = np.array([np.sum([self.features(s) for s in states], axis=0) for states, seconds in runs])
+        t = np.array([seconds for states, seconds in runs], dtype=float)
+        theta = np.linalg.lstsq(A, t, rcond=None)[0]
+        if (theta < 0).any(): #keep only the positive terms, refit
+            active = theta > 0
+            theta = np.zeros_like(theta)
+            if active.any(): theta[active] = np.linalg.lstsq(A[:,active], t, rcond=None)[0].clip(0)
+        self.theta = list(theta)
+        return self
+
+    def __call__(self, state):
+        f = self.features(state)
+        if self.theta is None: return float(f[0])
+        return max(float(np.dot(self.theta, f)), 1e-12)
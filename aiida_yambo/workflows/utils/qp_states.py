@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Index of the QP states (columns of QP_table: band, band, k-point[, spin]) of ndb.QP databases.
+
+States are encoded as lexicographic (k-point, band[, spin]) integer keys, so that joins
+between two tables are a sort plus np.searchsorted: O(N log N) instead of one
+np.where over the whole table for each state.
+"""
+from __future__ import absolute_import
+import numpy as np
+
+
+def full_qp_table(Nb, Nk):
+    """QP_table (3, Nk*len(Nb)) of all the bands Nb (list) for the k-points 1..Nk, k-point major."""
+    Nb = np.asarray(Nb, dtype=np.int64)
+    bands = np.tile(Nb, Nk)
+    return np.array([bands, bands, np.repeat(np.arange(1, Nk+1), len(Nb))])
+
+def qp_keys(table, nb, ns=1):
+    """(k-point, band, spin) keys of the states of table; nb is the number of bands (>= max band),
+    ns the number of spin channels (the spin is the 4th row of table, if ns > 1)."""
+    table = np.asarray(table, dtype=np.int64)
+    keys = (table[2]-1)*nb + table[0]-1
+    if ns > 1: keys = keys*ns + table[3]-1
+    return keys
+
+def occurrence(keys):
+    """For each key, how many equal keys come before it (0 for the first one)."""
+    order = np.argsort(keys, kind='stable')
+    start = np.flatnonzero(np.r_[True, np.diff(keys[order]) != 0])
+    first = np.repeat(start, np.diff(np.r_[start, len(keys)]))
+    count = np.empty(len(keys), dtype=np.int64)
+    count[order] = np.arange(len(keys)) - first
+    return count
+
+def match_states(table_from, table_to):
+    """For each state of table_from: index of the same (band, k-point) in table_to, and found mask.
+    If both tables have the spin row the spin is matched too; otherwise repeated (band, k-point)
+    states (one per spin channel) are matched in order: the n-th one in table_from to the n-th in table_to."""
+    table_from = np.asarray(table_from, dtype=np.int64)
+    table_to = np.asarray(table_to, dtype=np.int64)
+    if table_from.shape[1] == 0 or table_to.shape[1] == 0:
+        return np.zeros(table_from.shape[1], dtype=np.int64), np.zeros(table_from.shape[1], dtype=bool)
+    nb = int(max(table_from[0].max(), table_to[0].max()))
+    ns = int(max(table_from[3].max(), table_to[3].max())) if len(table_from) > 3 and len(table_to) > 3 else 1
+    keys_from, keys_to = qp_keys(table_from, nb, ns), qp_keys(table_to, nb, ns)
+    count_from, count_to = occurrence(keys_from), occurrence(keys_to)
+    repeated = int(max(count_from.max(), count_to.max()))+1
+    keys_from, keys_to = keys_from*repeated + count_from, keys_to*repeated + count_to
+
+    order = np.argsort(keys_to, kind='stable')
+    sorted_keys = keys_to[order]
+    position = np.clip(np.searchsorted(sorted_keys, keys_from), 0, len(sorted_keys)-1)
+    found = sorted_keys[position] == keys_from
+    return order[position], found
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Least squares fit of the separable power law of the 2D predictor.
+
+f = (a/x^alpha + b)(c/y^beta + d) is fitted for all the (alpha, beta) pairs at
+once with batched linear algebra, instead of one curve_fit per pair.
+"""
+from __future__ import absolute_import
+import numpy as np
+
+
+def _batched_lstsq(A, z):
+    #least squares for a stack of design matrices A (K,n,m), with columns rescaled for conditioning.
+    scale = np.abs(A).max(axis=1, keepdims=True)
+    scale[scale == 0] = 1
+    return np.einsum('kmn,kn->km', np.linalg.pinv(A/scale), z)/scale[:,0,:]
+
+def fit_separable_2D(x, y, z, alphas=[1,2], betas=[1,2], iterations=50):
+    """Fit f = (a/x^alpha + b)(c/y^beta + d) for all the (alpha, beta) pairs at once.
+
+    For fixed exponents f = ac u v + ad u + bc v + bd, with u = x^-alpha, v = y^-beta:
+    all the pairs are solved together as stacked weighted linear least squares
+    (weights as sigma=1/(x*y) in curve_fit), then the products are brought back to
+    the (a,b,c,d) form with a few batched alternating least squares steps.
+
+    Returns (pairs, popt, MAE): pairs (K,2), popt (K,4) as a,b,c,d, weighted MAE (K).
+    """
+    x, y, z = np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(z, dtype=float)
+    pairs = np.array([(i, j) for i in alphas for j in betas], dtype=float)
+    u = x[None,:]**(-pairs[:,0:1])
+    v = y[None,:]**(-pairs[:,1:2])
+    w = x*y  #1/sigma
+    zw = np.broadcast_to(z*w, u.shape)
+
+    A = np.stack((u*v, u, v, np.ones_like(u)), axis=-1)*w[None,:,None]
+    p = _batched_lstsq(A, zw)
+
+    #best rank-1 [a,b]^T[c,d] of [[ac,ad],[bc,bd]]
+    U, S, Vt = np.linalg.svd(p.reshape(-1,2,2))
+    ab = U[:,:,0]*np.sqrt(S[:,0:1])
+    cd = Vt[:,0,:]*np.sqrt(S[:,0:1])
+
+    for _ in range(iterations):
+        g = ab[:,0:1]*u + ab[:,1:2]
+        cd = _batched_lstsq(np.stack((g*v, g), axis=-1)*w[None,:,None], zw)
+        h = cd[:,0:1]*v + cd[:,1:2]
+        ab = _batched_lstsq(np.stack((u*h, h), axis=-1)*w[None,:,None], zw)
+
+    popt = np.column_stack((ab[:,0], ab[:,1], cd[:,0], cd[:,1]))
+    fit = (popt[:,0:1]*u + popt[:,1:2])*(popt[:,2:3]*v + popt[:,3:4])
+    MAE = np.average(np.abs(fit - z[None,:]), weights=np.broadcast_to(w, fit.shape), axis=1)
+    return pairs, popt, MAE
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Append-only columnar store for the workflow_story of YamboConvergence."""
+from __future__ import absolute_import
+import numbers
+import numpy as np
+from aiida_yambo.utils.lazy import lazy_import
+pd = lazy_import('pandas')
+
+
+def _dtype_for(value):
+    if isinstance(value, (bool, np.bool_)):
+        return np.bool_
+    if isinstance(value, numbers.Integral):
+        return np.int64
+    if isinstance(value, numbers.Real):
+        return np.float64
+    return object
+
+def _fits(dtype, value):
+    if dtype == object:
+        return True
+    if dtype == np.bool_:
+        return isinstance(value, (bool, np.bool_))
+    if isinstance(value, (bool, np.bool_)):
+        return False
+    if dtype == np.int64:
+        return isinstance(value, numbers.Integral)
+    return isinstance(value, numbers.Real)
+
+def _python(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+class WorkflowStory():
+    """Typed numpy columns with amortized (doubling) growth.
+
+    Rows are only appended, existing values can be updated with set_values.
+    The context checkpoints contain only the filled part, as plain lists;
+    to_frame/to_dict give the DataFrame and the dict used for the history output.
+    """
+
+    def __init__(self, columns=[]):
+        self.columns = []
+        self._data = {}
+        self._size = 0
+        self._capacity = 8
+        for c in columns:
+            self._add_column(c)
+
+    def __len__(self):
+        return self._size
+
+    def _add_column(self, name, dtype=None):
+        self.columns.append(name)
+        self._data[name] = None if dtype is None else np.empty(self._capacity, dtype=dtype)
+        if dtype is None and self._size:
+            self._data[name] = np.full(self._capacity, None, dtype=object)
+
+    def _grow(self):
+        self._capacity *= 2
+        for name, array in self._data.items():
+            if array is not None:
+                new = np.empty(self._capacity, dtype=array.dtype) if array.dtype != object else np.full(self._capacity, None, dtype=object)
+                new[:self._size] = array[:self._size]
+                self._data[name] = new
+
+    def _store(self, name, index, value):
+        array = self._data[name]
+        if array is None: #first value: the column type is set here
+            array = np.empty(self._capacity, dtype=_dtype_for(value)) if _dtype_for(value) != object else np.full(self._capacity, None, dtype=object)
+            self._data[name] = array
+        elif not _fits(array.dtype, value):
+            array = array.astype(object)
+            self._data[name] = array
+        if array.dtype == object and isinstance(value, (list, tuple)):
+            array[index] = None
+            array[index] = list(value) #keep lists (e.g. k-meshes) as single objects
+        else:
+            array[index] = value
+
+    def append(self, row):
+        """row: dict {column: value} or list in the order of the columns."""
+        if not isinstance(row, dict):
+            row = dict(zip(self.columns, row))
+        for name in row.keys():
+            if name not in self._data: self._add_column(name)
+        if self._size == self._capacity: self._grow()
+        for name in self.columns:
+            self._store(name, self._size, row.get(name, None))
+        self._size += 1
+
+    def column(self, name):
+        array = self._data[name]
+        if array is None:
+            return np.full(self._size, None, dtype=object)
+        return array[:self._size]
+
+    def set_values(self, name, index, value):
+        """index: position, list of positions, boolean mask or slice."""
+        positions = np.arange(self._size)[index]
+        for i in np.atleast_1d(positions):
+            self._store(name, i, value)
+
+    def mask(self, useful=True, failed=False):
+        return (self.column('useful') == useful) & (self.column('failed') == failed)
+
+    def to_frame(self):
+        return pd.DataFrame({name: self.column(name) for name in self.columns}, columns=self.columns)
+
+    def to_dict(self):
+        """Same layout of DataFrame.to_dict(): {column: {row: value}}, nan as None."""
+        return {name: {i: _python(v) for i, v in enumerate(self.column(name))} for name in self.columns}
+
+    @classmethod
+    def from_dict(cls, story):
+        """From the dict (or DataFrame) used before for the workflow_story."""
+        frame = pd.DataFrame(story)
+        new = cls(list(frame.columns))
+        for row in frame.to_dict('records'):
+            new.append(row)
+        return new
+
+    def __getstate__(self):
+        return {'columns': self.columns,
+                'data': {name: [_python(v) for v in self.column(name)] for name in self.columns}}
+
+    def __setstate__(self, state):
+        self.__init__(state['columns'])
+        data = state['data']
+        for i in range(len(data[self.columns[0]]) if self.columns else 0):
+            self.append({name: data[name][i] for name in self.columns})
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Convergence thresholds of the power-law fits used by the predictors.
+
+For f = a/x^alpha + b (1D) and f = (a/x^alpha + b)(c/y^beta + d) (2D) the
+regions where the derivatives are below thr_fx, thr_fy, thr_fxy are bounded by
+explicit curves: the first converged point of the parameter grids is found
+from the 1D axes of the grid, without evaluating the derivatives on a meshgrid.
+The *_grid functions are the meshgrid scans, kept as reference.
+"""
+from __future__ import absolute_import
+import numpy as np
+
+
+def derivatives_2D(x, y, popt, alpha, beta):
+    """fx, fy, fxy as in The_Predictor_2D.fit_space_2D."""
+    a, b, c, d = popt
+    fx = -alpha*a/(x**(alpha+1))*(c/y + d)
+    fy = (a/x + b)*(-beta*c/y**(beta+1))
+    fxy = -alpha*a/(x**(alpha+1))*(-beta*c/y**(beta+1))
+    return fx, fy, fxy
+
+def _converged_2D(x, y, popt, alpha, beta, thr_fx, thr_fy, thr_fxy):
+    fx, fy, fxy = derivatives_2D(x, y, popt, alpha, beta)
+    return (abs(fx) < thr_fx) & (abs(fy) < thr_fy) & (abs(fxy) < thr_fxy)
+
+def first_converged_1D(popt, alpha, X, thr_fx):
+    """First point of the (increasing) grid X with |alpha*a/x^(alpha+1)| < thr_fx, None if no one."""
+    a = popt[0]
+    X = np.asarray(X, dtype=float)
+    lower = (alpha*abs(a)/thr_fx)**(1/(alpha+1))
+    k = np.searchsorted(X, lower, side='right')
+    if k > 0 and alpha*abs(a)/X[k-1]**(alpha+1) < thr_fx: k -= 1 #rounding at the boundary
+    if k >= len(X): return None
+    return X[k]
+
+def first_converged_1D_grid(popt, alpha, X, thr_fx):
+    X = np.asarray(X, dtype=float)
+    condition = np.where(abs(-alpha*popt[0]/(X**(alpha+1))) < thr_fx)
+    if len(X[condition]) == 0: return None
+    return X[condition][0]
+
+def first_converged_2D(popt, alpha, beta, X, Y, thr_fx=5e-5, thr_fy=5e-5, thr_fxy=1e-8):
+    """First point (x, y) of the grid X x Y, in the meshgrid order (rows along Y),
+    satisfying all the thresholds; None if no one. Memory is O(len(X)+len(Y)).
+
+    For each y: |fx| and |fxy| decrease with x (lower bounds on x), |fy| < thr_fy
+    is |a/x + b| < R(y), an interval in 1/x; so the converged x are an interval.
+    """
+    a, b, c, d = popt
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        x_fx = (alpha*abs(a)*abs(c/Y + d)/thr_fx)**(1/(alpha+1))
+        x_fxy = (alpha*beta*abs(a*c)/(thr_fxy*Y**(beta+1)))**(1/(alpha+1))
+        R = thr_fy*Y**(beta+1)/(beta*abs(c))
+        if a != 0:
+            t_hi = np.maximum((-R-b)/a, (R-b)/a)
+            x_fy = np.where(t_hi > 0, 1/t_hi, np.inf)
+        else:
+            x_fy = np.where(abs(b) < R, 0, np.inf)
+    lower = np.nan_to_num(np.maximum(np.maximum(x_fx, x_fxy), x_fy), nan=np.inf)
+
+    k = np.searchsorted(X, lower, side='left')
+    for shift in [-1, 0, 1]: #the boundary itself is excluded, and rounding
+        j = np.clip(k+shift, 0, len(X)-1)
+        ok = (k+shift >= 0) & (k+shift < len(X)) & _converged_2D(X[j], Y, popt, alpha, beta, thr_fx, thr_fy, thr_fxy)
+        if shift == -1:
+            first, found = j.copy(), ok
+        else:
+            first = np.where(found, first, j)
+            found = found | ok
+    rows = np.where(found)[0]
+    if len(rows) == 0: return None
+    return X[first[rows[0]]], Y[rows[0]]
+
+def first_converged_2D_grid(popt, alpha, beta, X, Y, thr_fx=5e-5, thr_fy=5e-5, thr_fxy=1e-8):
+    XX, YY = np.meshgrid(X, Y)
+    condition = np.where(_converged_2D(XX, YY, popt, alpha, beta, thr_fx, thr_fy, thr_fxy))
+    if len(XX[condition]) == 0: return None
+    return XX[condition][0], YY[condition][0]
@@ -284,11 +284,17 @@ class YamboConvergence(ProtocolMixin, WorkChain):
         self.ctx.hint = {}
         self.ctx.workflow_settings = self.inputs.workflow_settings.get_dict()
         self.ctx.how_bands = self.ctx.workflow_settings.pop('bands_nscf_update', 0)
+        self.ctx.pipeline_depth = self.ctx.workflow_settings.pop('pipeline_depth', 0) #speculative calculations kept in flight
+        #what the probes keep in the repository: opt-in, by default everything is retrieved (the final point is one of them)
+        self.ctx.retrieval_policy = self.ctx.workflow_settings.pop('retrieval_policy', None)
+        if self.ctx.retrieval_policy and 'RETRIEVAL_POLICY' not in self.ctx.calc_inputs.yres.yambo.settings.get_dict().keys():
+            self.ctx.calc_inputs.yres.yambo.settings = update_dict(self.ctx.calc_inputs.yres.yambo.settings, 'RETRIEVAL_POLICY', self.ctx.retrieval_policy)
         self.ctx.workflow_manager = convergence_workflow_manager(self.inputs.parameters_space,
                                                                 self.ctx.workflow_settings,
                                                                 self.ctx.calc_inputs.yres.yambo.parameters.get_dict(), 
                                                                 self.ctx.calc_inputs.nscf.kpoints,
                                                                 )
+        self.ctx.workflow_manager['in_flight'] = {}
 
         if hasattr(self.ctx.calc_inputs,'additional_parsing'):
             l = self.ctx.workflow_settings['what']+self.ctx.calc_inputs.additional_parsing.get_list()
@@ -427,6 +433,11 @@ class YamboConvergence(ProtocolMixin, WorkChain):
                                     
             self.ctx.workflow_manager['values'].append(value)
             self.report('New parameters are: {}'.format(value))
+            if not already_done and 'dbs_parent' in self.ctx.workflow_manager:
+                self.report(self.ctx.workflow_manager['dbs_parent']['message'])
+
+            if not already_done and self.ctx.pipeline_depth:
+                already_done = self.take_in_flight(self.ctx.calc_inputs)
             
             if not already_done:
                 self.ctx.calc_inputs.metadata.call_link_label = 'iteration_'+str(self.ctx.workflow_manager['global_step']+i)
@@ -442,8 +453,56 @@ class YamboConvergence(ProtocolMixin, WorkChain):
             self.ctx.workflow_manager['wfl_pk'] = [future.pk] + self.ctx.workflow_manager['wfl_pk']  
             self.ctx.workflow_manager['group'].add_nodes(future) #when added the whole YC, remove that
 
+        if self.ctx.pipeline_depth:
+            self.speculate()
+
         return ToContext(calc)
 
+    def take_in_flight(self, inputs):
+        """pk of a speculative YamboWorkflow equivalent to inputs, if any (also if still running)."""
+        pk = take_in_flight(self.ctx.workflow_manager['in_flight'], inputs)
+        if pk: self.report('Using the speculative calculation {}'.format(pk))
+        return pk
+
+    def speculate(self):
+        """Submit the next points of the space, so that pipeline_depth calculations run
+        also while the current batch is analysed. They are used in next_step if the space
+        is not changed by the analysis; the ones that are not among the next points anymore
+        are killed."""
+        in_flight = self.ctx.workflow_manager['in_flight']
+        for fingerprint, pk in list(in_flight.items()):
+            if load_node(pk).is_terminated: in_flight.pop(fingerprint) #search_in_group will find it, if ok
+
+        upcoming = speculative_inputs(self.ctx.calc_manager, self.ctx.calc_inputs, self.ctx.params_space,
+                                      self.ctx.workflow_manager, self.ctx.pipeline_depth, skip_in_flight=False)
+        self.kill_speculative(stale_in_flight(in_flight, [fingerprint for fingerprint, inputs, value in upcoming]),
+                              'not among the next points')
+
+        for fingerprint, inputs, value in upcoming:
+            if fingerprint in in_flight: continue
+            inputs.metadata.call_link_label = 'speculative_'+str(len(self.ctx.workflow_manager['wfl_pk'])+len(in_flight))
+            future = self.submit(YamboWorkflow, **inputs)
+            in_flight[fingerprint] = future.pk
+            self.ctx.workflow_manager['group'].add_nodes(future)
+            self.report('Speculative calculation {} submitted, parameters: {}'.format(future.pk, value))
+
+    def kill_speculative(self, speculative, reason):
+        """Kill the speculative YamboWorkflows ({fingerprint: pk}) still running."""
+        for pk in speculative.values():
+            if load_node(pk).is_terminated: continue
+            try:
+                self.runner.controller.kill_process(pk, 'killed by YamboConvergence<{}>: {}'.format(self.node.pk, reason))
+                self.report('Speculative calculation {} killed: {}'.format(pk, reason))
+            except Exception as error:
+                self.report('Speculative calculation {} could not be killed: {}'.format(pk, error))
+
+    def on_terminated(self):
+        """No speculative calculation survives the workflow (converged, failed or killed)."""
+        try:
+            self.kill_speculative(stale_in_flight(self.ctx.workflow_manager['in_flight'], []), 'the convergence is terminated')
+        except (AttributeError, KeyError):
+            pass
+        super().on_terminated()
 
     def data_analysis(self):
         
@@ -473,7 +532,7 @@ class YamboConvergence(ProtocolMixin, WorkChain):
             
             #self.report(self.ctx.final_result)
 
-            df_story = pd.DataFrame.from_dict(self.ctx.workflow_manager['workflow_story'])
+            df_story = self.ctx.workflow_manager['workflow_story'].to_frame()
             self.report('Success on {} reached in {} calculations, the result is {}' \
                         .format(self.ctx.calc_manager['var'], (self.ctx.calc_manager['steps']-self.ctx.calc_manager['skipped'])*self.ctx.calc_manager['iter'],\
                             df_story[df_story['useful'] == True].loc[:,self.ctx.workflow_manager['what']].values[-1:]))
@@ -550,7 +609,7 @@ class YamboConvergence(ProtocolMixin, WorkChain):
     def report_wf(self):
 
         self.report('Final step. It is {} that the workflow was successful'.format(str(self.ctx.workflow_manager['fully_success'])))
-        story = store_Dict(self.ctx.workflow_manager['workflow_story'])
+        story = store_Dict(self.ctx.workflow_manager['workflow_story'].to_dict())
         self.out('history', story)
         if hasattr(self.ctx,'hint'): 
             if hasattr(self.ctx.hint,'infos'):
@@ -740,6 +799,9 @@ class YamboConvergence(ProtocolMixin, WorkChain):
             self.ctx.calculation_type='pre_yambo'
             self.ctx.pre_inputs.yres.yambo.parameters = self.inputs.precalc_inputs
             self.ctx.pre_inputs.additional_parsing = self.ctx.calc_inputs.additional_parsing 
+            if self.ctx.retrieval_policy and 'RETRIEVAL_POLICY' not in self.ctx.pre_inputs.yres.yambo.settings.get_dict().keys():
+                #its databases are used remotely by the probes (COPY_DBS)
+                self.ctx.pre_inputs.yres.yambo.settings = update_dict(self.ctx.pre_inputs.yres.yambo.settings, 'RETRIEVAL_POLICY', 'restart')
         else:
             self.ctx.calculation_type='p2y'
             self.ctx.pre_inputs.yres.yambo.parameters = update_dict(self.ctx.pre_inputs.yres.yambo.parameters, 
@@ -301,7 +301,8 @@ class YamboRestart(ProtocolMixin, BaseRestartWorkChain):
         we increase the simulation time and copy the database already created.
         """
         
-        self.ctx.inputs.metadata.options = fix_time(self.ctx.inputs.metadata.options, self.ctx.iteration, self.inputs.max_walltime)
+        self.ctx.inputs.metadata.options = fix_time(self.ctx.inputs.metadata.options, self.ctx.iteration, self.inputs.max_walltime,
+                                                        calculation.outputs.output_parameters.get_dict())
         self.ctx.inputs.parent_folder = calculation.outputs.remote_folder
         self.ctx.inputs.settings = update_dict(self.ctx.inputs.settings,'ITERATION', self.ctx.iteration)
         
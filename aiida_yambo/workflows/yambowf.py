@@ -2,12 +2,12 @@
 from __future__ import absolute_import
 #from curses import meta
 import os
-import time
 
 from aiida import orm
 from aiida.orm import RemoteData,BandsData
 from aiida.orm import Dict,Int,List,Bool
-from ase import units
+from aiida_yambo.utils.lazy import lazy_import
+units = lazy_import('ase.units')
 
 from aiida.engine import WorkChain, while_, if_
 from aiida.engine import ToContext
@@ -22,6 +22,10 @@ from aiida_yambo.utils.defaults.create_defaults import *
 
 from aiida_yambo.workflows.utils.helpers_yambowf import *
 from aiida_yambo.workflows.utils.extend_QPDB import *
+from aiida_yambo.workflows.utils.merge_QPDB import *
+from aiida_yambo.workflows.utils.qp_partition import *
+from aiida_yambo.workflows.utils.harvest import harvest_QP_runs
+from aiida_yambo.utils.ndb_cache import qp_dataset
 
 from aiida.plugins import DataFactory
 
@@ -46,10 +50,10 @@ def clean(node):
                     pass
 
     if cleaned_calcs:
-        return "cleaned remote folders of calculations: {}".format(join(map(str, cleaned_calcs)))
+        return "cleaned remote folders of calculations: {}".format(', '.join(map(str, cleaned_calcs)))
 
 def sanity_check_QP(v,c,input_db,output_db,create=True):
-    d = xarray.open_dataset(input_db,engine='netcdf4')
+    d = qp_dataset(input_db) #a copy, it is modified below
     wrong = np.where(abs(d.QP_E[:,0]-d.QP_Eo[:])*units.Ha>5)
     #v,c = 29,31
     v_cond = np.where((d.QP_table[0] <= v) & (abs(d.QP_E[:,0]-d.QP_Eo[:])*units.Ha<5))
@@ -91,23 +95,17 @@ def merge_QP(filenames_List,output_name,ywfl_pk,qp_settings): #just to have some
         else:
             valence = int(nelectrons/2) + int(nelectrons%2)
             conduction = valence + 1
-        string_run = 'yambopy mergeqp'
         
         # Create temporary directory
         filename='ndb.QP'
         with tempfile.TemporaryDirectory() as dirpath:
-            # Open the output file from the AiiDA storage and copy content to the temporary file
+            # The split databases are read from the AiiDA storage and merged in memory
+            sources = []
             for i in filenames_List.get_list():
-                # Create the file with the desired name
-                temp_file = pathlib.Path(dirpath) / str(i)
                 with load_node(i).outputs.QP_db.base.repository.open(filename, 'rb') as handle:
-                    temp_file.write_bytes(handle.read())
+                    sources.append(handle.read())
 
-                string_run+=' '+str(temp_file)
-            string_run+=' -o '+dirpath+'/'+output_name.value
-            print(string_run)
-            os.system(string_run)
-            time.sleep(10)
+            merge_ndb_QP(sources, dirpath+'/'+output_name.value)
             qp_fixed = sanity_check_QP(valence,conduction,dirpath+'/'+output_name.value,dirpath+'/'+output_name.value.replace('merged','fixed'))
             QP_db = SingleFileData(qp_fixed[0])
 
@@ -133,8 +131,7 @@ def extend_QP(filenames_List,output_name,ywfl_pk,qp_settings,QP): #just to have
         else:
             valence = int(nelectrons/2) + int(nelectrons%2)
             conduction = valence + 1
-        output_name = QP._repository._repo_folder.abspath + '/path/ndb.QP_fixed'
-        qp_fixed,fit_v,fit_c = sanity_check_QP(valence,conduction,output_name,output_name,create=False)
+        qp_fixed,fit_v,fit_c = sanity_check_QP(valence,conduction,QP,None,create=False)
         if qp_rules.pop('extend_db', False):
             """
             In the qp settings dict, I should add:
@@ -148,11 +145,11 @@ def extend_QP(filenames_List,output_name,ywfl_pk,qp_settings,QP): #just to have
                 }
             """
             qp_rules['Nb'] = qp_rules.pop('Nb',conduction + valence)
-            db_FD_scissored = FD_and_scissored_db(out_db_path=qp_fixed,pw=pw,Nb=qp_rules['Nb'],Nk=nk,v_max=min(qp_rules['consider_only']),c_min=max(qp_rules['consider_only']),fit_v=fit_v[0],
+            db_FD_scissored = FD_and_scissored_db(out_db_path=QP,pw=pw,Nb=qp_rules['Nb'],Nk=nk,v_max=min(qp_rules['consider_only']),c_min=max(qp_rules['consider_only']),fit_v=fit_v[0],
                    fit_c=fit_c[0],conduction=conduction,T=qp_rules.pop('T_smearing',1e-2))
-            db_FD_scissored.to_netcdf(output_name.replace('fixed','extended'))
-            
-            QP_db_extended = SingleFileData(output_name.replace('fixed','extended'))
+            with tempfile.TemporaryDirectory() as dirpath:
+                db_FD_scissored.to_netcdf(dirpath+'/ndb.QP_extended')
+                QP_db_extended = SingleFileData(dirpath+'/ndb.QP_extended')
             return QP_db_extended
 
 
@@ -223,8 +220,12 @@ def QP_mapper(ywfl,tol=1,full_bands=False,spectrum_tol=1):
     
     return QP, [b_min_scissored,b_max_scissored]
 
-def QP_subset_groups(nnk_i,nnk_f,bb_i,bb_f,qp_per_subset):
+def QP_subset_groups(nnk_i,nnk_f,bb_i,bb_f,qp_per_subset,cost=None):
     
+    if cost is not None: #same number of subsets, balanced in cost
+        states = expand_states([[nnk_i,nnk_f,bb_i,bb_f]])
+        return lpt_partition(states,cost,int(np.ceil(len(states)/qp_per_subset)))
+
     groups, L = [],[]
     
     for k in range(nnk_i,nnk_f+1):
@@ -239,10 +240,14 @@ def QP_subset_groups(nnk_i,nnk_f,bb_i,bb_f,qp_per_subset):
             groups.append(L)
     return groups
 
-def QP_list_merger(l=[],qp_per_subset=10,consider_only=[-1]):
+def QP_list_merger(l=[],qp_per_subset=10,consider_only=[-1],cost=None):
     
     subgroup = []
     groups = []
+    if cost is not None: #same number of subsets, balanced in cost
+        states = expand_states(l,consider_only)
+        return lpt_partition(states,cost,int(np.ceil(len(states)/qp_per_subset)))
+
     for qp_set in l:
         for k in list(range(qp_set[0],qp_set[1]+1)):
             for b in list(range(qp_set[2],qp_set[3]+1)):
@@ -258,6 +263,32 @@ def QP_list_merger(l=[],qp_per_subset=10,consider_only=[-1]):
             
     return groups
 
+def QP_kpoint_weights(pw):
+    #relative weights of the k-points of the nscf, None if not available.
+    try:
+        kpoints, weights = pw.outputs.output_band.get_kpoints(also_weights=True)
+        if weights is None: return None
+        weights = np.asarray(weights,dtype=float)
+        return list(weights/weights.max())
+    except:
+        return None
+
+def QP_cost_model(nscf,timings_from=[]):
+    #cost of a [k,k,b,b] state: fitted on the timings of previous YamboWorkflows
+    #on the same system if any, otherwise k-point weight; None if nothing is known.
+    k_weights = QP_kpoint_weights(nscf)
+    weight_cost = None if k_weights is None else lambda state: k_weights[state[0]-1] if state[0] <= len(k_weights) else 1
+    if len(timings_from) == 0:
+        return weight_cost
+    try:
+        bands = nscf.outputs.output_band.get_bands()
+        fermi = nscf.outputs.output_parameters.get_dict()['fermi_energy']
+    except:
+        return weight_cost #no bands or Fermi energy in the nscf outputs: no features to fit.
+    runs = [(states,seconds) for states,seconds in harvest_QP_runs(timings_from) \
+            if all(s[0] <= bands.shape[0] and s[2] <= bands.shape[1] for s in states)]
+    return LinearCostModel(band_features(bands,k_weights,fermi)).fit(runs)
+
 
 class YamboWorkflow(ProtocolMixin, WorkChain):
 
@@ -550,6 +581,8 @@ class YamboWorkflow(ProtocolMixin, WorkChain):
         This function sets the parent, and its type
         there is no submission done here, only setting up the neccessary inputs the workchain needs in the next
         steps to decide what are the subsequent steps"""
+        set_fingerprint(self.node) #index used by search_in_group
+
         try:
 
             parent = take_calc_from_remote(self.inputs.parent_folder,level=-1)
@@ -624,6 +657,7 @@ class YamboWorkflow(ProtocolMixin, WorkChain):
         
         self.ctx.splitted_QP = []
         self.ctx.qp_splitter = 0
+        self.ctx.QP_in_flight = []
         self.report(" workflow initilization step completed.")
 
     def can_continue(self):
@@ -695,12 +729,11 @@ class YamboWorkflow(ProtocolMixin, WorkChain):
         
         elif self.ctx.calc_to_do == 'QP splitter':
             
-            QP = {}
-            
-            for k,v in QP.items():
-                if not QP[k].is_finished_ok:
-                    self.report('some calculation failed')
+            for uuid in self.ctx.QP_in_flight:
+                if not load_node(uuid).is_finished_ok:
+                    self.report('QP calculation <{}> failed, exiting the workflow'.format(load_node(uuid).pk))
                     return self.exit_codes.ERROR_WORKCHAIN_FAILED
+            self.ctx.QP_in_flight = []
 
             if self.ctx.qp_splitter == 0:
                 calc = self.ctx.calc
@@ -729,6 +762,8 @@ class YamboWorkflow(ProtocolMixin, WorkChain):
                 self.ctx.yambo_inputs.clean_workdir = Bool(True)
                 mapping = gap_mapping_from_nscf(find_pw_parent(take_calc_from_remote(self.ctx.yambo_inputs['parent_folder'],level=-1)).pk)
                 self.ctx.mapping = mapping
+                cost = QP_cost_model(find_pw_parent(take_calc_from_remote(self.ctx.yambo_inputs['parent_folder'],level=-1), calc_type=['nscf']),
+                                     self.ctx.QP_subsets.pop('timings_from',[]))
 
                 split = self.ctx.QP_subsets.pop('split_bands',True)
                 consider_only = self.ctx.QP_subsets.pop('consider_only',[-1]) #[1,64], a range.
@@ -755,33 +790,37 @@ class YamboWorkflow(ProtocolMixin, WorkChain):
 
                     self.ctx.QP_subsets['subsets'] = QP_list_merger([[k_i,k_f,b_i,b_f]],
                                                                       self.ctx.QP_subsets['qp_per_subset'],
-                                                                      consider_only=consider_only)
+                                                                      consider_only=consider_only,
+                                                                      cost=cost)
 
                 if not 'subsets' in self.ctx.QP_subsets.keys():
                     if 'explicit' in self.ctx.QP_subsets.keys():
                         self.ctx.QP_subsets['subsets'] = QP_list_merger(self.ctx.QP_subsets['explicit'],
                                                                         self.ctx.QP_subsets['qp_per_subset'],
-                                                                        consider_only=consider_only)
-
-                self.report('subsets: {}'.format(self.ctx.QP_subsets['subsets']))
-
-            for i in range(1,1+self.ctx.QP_subsets['parallel_runs']):
-                if len(self.ctx.QP_subsets['subsets']) > 0:
-                    self.ctx.yambo_inputs.yambo.parameters = update_dict(self.ctx.yambo_inputs.yambo.parameters,['QPkrange'],[[self.ctx.QP_subsets['subsets'].pop(),'']],sublevel='variables')
+                                                                        consider_only=consider_only,
+                                                                        cost=cost)
 
-                    self.ctx.yambo_inputs.metadata.call_link_label = 'yambo_QP_splitted_{}'.format(i+self.ctx.qp_splitter)
-                    future = self.submit(YamboRestart, **self.ctx.yambo_inputs)
-                    self.report('launchiing YamboRestart <{}> for QP, iteration#{}'.format(future.pk,i+self.ctx.qp_splitter))
-                    self.ctx.splitted_QP.append(future.uuid)
-                    QP[str(i+1)] = future
-                else:
-                    self.ctx.calc_to_do = 'workflow is finished'
-            
-            self.ctx.qp_splitter += self.ctx.QP_subsets['parallel_runs']
+                #waves of parallel_runs subsets, from the most expensive ones.
+                self.ctx.QP_subsets['waves'] = QP_waves(self.ctx.QP_subsets['subsets'],self.ctx.QP_subsets['parallel_runs'],cost)
+                self.report('subsets: {}'.format(self.ctx.QP_subsets['waves']))
 
-            if len(self.ctx.QP_subsets['subsets']) == 0: self.ctx.calc_to_do = 'workflow is finished'
+            if len(self.ctx.QP_subsets['waves']) == 0:
+                self.ctx.calc_to_do = 'workflow is finished'
+                return
 
-            return ToContext(QP) #wait for all splitted calculations....
+            QP = {}
+            for subset in self.ctx.QP_subsets['waves'].pop(0):
+                self.ctx.qp_splitter += 1
+                self.ctx.yambo_inputs.yambo.parameters = update_dict(self.ctx.yambo_inputs.yambo.parameters,['QPkrange'],[[subset,'']],sublevel='variables')
+
+                self.ctx.yambo_inputs.metadata.call_link_label = 'yambo_QP_splitted_{}'.format(self.ctx.qp_splitter)
+                future = self.submit(YamboRestart, **self.ctx.yambo_inputs)
+                self.report('launchiing YamboRestart <{}> for QP, iteration#{}'.format(future.pk,self.ctx.qp_splitter))
+                self.ctx.splitted_QP.append(future.uuid)
+                self.ctx.QP_in_flight.append(future.uuid)
+                QP['QP_{}'.format(self.ctx.qp_splitter)] = future
+
+            return ToContext(**QP) #wait for all the splitted calculations of the wave....
 
         return ToContext(calc = future)
     
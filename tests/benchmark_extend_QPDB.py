@@ -0,0 +1,58 @@
+"""Synthetic benchmark of the QP state joins used to extend ndb.QP databases.
+
+A full (band, k-point) table of 10^3 -- 10^6 states (as built by build_ndbQP)
+is updated with the explicit GW states of a random subset. Run it as a script:
+
+    python tests/benchmark_extend_QPDB.py
+
+The searchsorted join should scale as N log N; the per-state np.where/isin
+loop used before is timed as a reference up to 10^4 states.
+"""
+import time
+
+import numpy
+
+from aiida_yambo.workflows.utils.qp_states import full_qp_table, match_states
+
+def synthetic_tables(n_states, n_bands=100, gw_fraction=0.1):
+    n_kpoints = max(1, n_states//n_bands)
+    dft = full_qp_table(list(range(1, n_bands+1)), n_kpoints)
+    rng = numpy.random.default_rng(0)
+    gw = dft[:, rng.choice(dft.shape[1], max(1, int(gw_fraction*dft.shape[1])), replace=False)].astype(float)
+    return dft, rng.random((dft.shape[1], 2)), gw, rng.random((gw.shape[1], 2))
+
+def loop_update(dft, E_dft, gw, E_gw):
+    #the per-state update used before
+    for i in range(len(gw[0, :])):
+        b, k = int(gw[0, i]), int(gw[2, i])
+        _b24 = numpy.where(numpy.isin(dft[0], [b]) & numpy.isin(dft[2], [k]))
+        b24 = numpy.where(numpy.isin(gw[0], [b]) & numpy.isin(gw[2], [k]))
+        E_dft[_b24] = E_gw[b24]
+    return E_dft
+
+def join_update(dft, E_dft, gw, E_gw):
+    index, found = match_states(gw, dft)
+    E_dft[index[found]] = E_gw[found]
+    return E_dft
+
+def timeit(function, *args, repeat=3):
+    best = numpy.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter()-start)
+    return best
+
+def main():
+    print('{:>10} {:>14} {:>14} {:>14}'.format('states', 'table [s]', 'join [s]', 'loop [s]'))
+    for n in [10**3, 10**4, 10**5, 10**6]:
+        dft, E_dft, gw, E_gw = synthetic_tables(n)
+        t_table = timeit(full_qp_table, list(range(1, 101)), n//100)
+        t_join = timeit(join_update, dft, E_dft.copy(), gw, E_gw)
+        t_loop = timeit(loop_update, dft, E_dft.copy(), gw, E_gw, repeat=1) if n <= 10**4 else numpy.nan
+        if n <= 10**4:
+            assert numpy.allclose(join_update(dft, E_dft.copy(), gw, E_gw), loop_update(dft, E_dft.copy(), gw, E_gw))
+        print('{:>10} {:>14.2e} {:>14.2e} {:>14.2e}'.format(n, t_table, t_join, t_loop))
+
+if __name__ == '__main__':
+    main()
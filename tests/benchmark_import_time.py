@@ -0,0 +1,50 @@
+"""Import-time budget of the modules loaded by `verdi` and the daemon workers.
+
+Each entry point is imported in a fresh interpreter with `python -X importtime`;
+the cumulative time of the module is checked against a budget and the heavy
+libraries (loaded lazily, see aiida_yambo/utils/lazy.py) must not be imported.
+Run it as a script (it needs aiida installed):
+
+    python tests/benchmark_import_time.py
+"""
+import subprocess
+import sys
+
+#module -> budget in seconds for its own cumulative import time (aiida excluded)
+BUDGETS = {
+    'aiida_yambo.calculations.yambo': 0.3,
+    'aiida_yambo.parsers.parsers': 0.5,
+}
+HEAVY = ['matplotlib', 'scipy', 'pandas', 'xarray', 'yambopy']
+#imported first, so that their cost (and what they import) is not charged to the plugin
+PRELOAD = 'aiida.orm, aiida.engine, aiida.parsers'
+
+def import_times(module, preload=PRELOAD):
+    """{imported module: cumulative microseconds}, importing module in a new interpreter."""
+    code = 'import {}; import {}'.format(preload, module)
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                         capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in out.splitlines():
+        if not line.startswith('import time:') or '|' not in line: continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError: #header
+            pass
+    return times
+
+def heavy_imports(times):
+    return {m.split('.')[0] for m in times if m.split('.')[0] in HEAVY}
+
+def check(module, budget, preload=PRELOAD):
+    times = import_times(module, preload)
+    seconds = times[module]*1e-6
+    heavy = sorted(heavy_imports(times) - heavy_imports(import_times('os', preload)))
+    print('{:35s} {:7.3f} s (budget {} s) heavy imports: {}'.format(module, seconds, budget, heavy or 'none'))
+    assert not heavy, '{} imports {}'.format(module, heavy)
+    assert seconds < budget, '{} takes {:.3f} s to import'.format(module, seconds)
+
+if __name__ == '__main__':
+    for module, budget in BUDGETS.items():
+        check(module, budget)
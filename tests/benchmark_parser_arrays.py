@@ -0,0 +1,66 @@
+"""Synthetic benchmark of the parser array construction.
+
+Random o-*.qp-like data (dict of k-point blocks) and ndb.QP-like data with
+10^3 -- 10^6 QP states. Run it as a script:
+
+    python tests/benchmark_parser_arrays.py
+
+The vectorized path should scale linearly with the number of QP states; the
+per-element loops of the old parser are timed as a reference up to 10^5 states.
+"""
+import time
+
+import numpy
+
+from aiida_yambo.parsers.arrays import qp_table_arrays, ndb_arrays, sigma_c, concatenate_blocks
+
+def synthetic_qp(n_states, n_bands=100):
+    n_kpoints = max(1, n_states//n_bands)
+    rng = numpy.random.default_rng(0)
+    data = {}
+    for k in range(1, n_kpoints+1):
+        data[str(k)] = {'Band': numpy.arange(1, n_bands+1),
+                        'Eo': rng.random(n_bands), 'E-Eo': rng.random(n_bands),
+                        'Sc|Eo': rng.random(n_bands), 'Z': rng.random(n_bands)}
+    return data
+
+def synthetic_ndb(n_states):
+    rng = numpy.random.default_rng(0)
+    ndbqp = {'Eo': rng.random(n_states), 'E-Eo': rng.random(n_states), 'Z': rng.random(n_states)+0.5,
+             'qp_table': rng.integers(1, 100, (n_states, 3))}
+    ndbhf = {'Sx': rng.random(n_states), 'Vxc': rng.random(n_states)}
+    return ndbqp, ndbhf
+
+def loop_qp_table(data):
+    #the per-element construction used before
+    QP_TABLE, Eo, E_minus_Eo, So, Z = [], [], [], [], []
+    for ky in data.keys():
+        for ind in range(len(data[ky]['Band'])):
+            Eo.append(data[ky]['Eo'][ind])
+            E_minus_Eo.append(data[ky]['E-Eo'][ind])
+            So.append(data[ky]['Sc|Eo'][ind])
+            Z.append(data[ky]['Z'][ind])
+            QP_TABLE.append([int(ky), data[ky]['Band'][ind], 0])
+    return [numpy.array(x) for x in (Eo, E_minus_Eo, So, Z, QP_TABLE)]
+
+def timeit(function, *args, repeat=3):
+    best = numpy.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter()-start)
+    return best
+
+def main():
+    print('{:>10} {:>14} {:>14} {:>14} {:>14}'.format('states', 'qp_table [s]', 'loop [s]', 'ndb [s]', 'optics [s]'))
+    for n in [10**3, 10**4, 10**5, 10**6]:
+        qp = synthetic_qp(n)
+        ndbqp, ndbhf = synthetic_ndb(n)
+        t_vec = timeit(qp_table_arrays, qp)
+        t_loop = timeit(loop_qp_table, qp, repeat=1) if n <= 10**5 else numpy.nan
+        t_ndb = timeit(lambda: (ndb_arrays(ndbqp, ndbhf), sigma_c(ndbqp, ndbhf)))
+        t_opt = timeit(concatenate_blocks, qp)
+        print('{:>10} {:>14.2e} {:>14.2e} {:>14.2e} {:>14.2e}'.format(n, t_vec, t_loop, t_ndb, t_opt))
+
+if __name__ == '__main__':
+    main()
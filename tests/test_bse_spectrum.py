@@ -0,0 +1,46 @@
+import numpy as np
+
+from aiida_yambo.parsers.bse_spectrum import adaptive_grid, lorentzian_sum, fit_cofactor, bse_spectrum
+
+def excitons(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    energies = np.sort(rng.uniform(2, 9, n)) + 0j
+    residuals = rng.exponential(1, n)*(rng.random(n) < 0.05) + 1e-6
+    return energies, residuals
+
+def test_grid_is_a_refined_subset_of_the_fixed_grid():
+    energies, residuals = excitons()
+    w = adaptive_grid(energies.real, residuals)
+    dense = np.arange(0, 20, 0.01)
+    assert len(w) < len(dense)
+    assert np.allclose(w, dense[np.rint(w/0.01).astype(int)])
+    bright = energies.real[residuals.argmax()]
+    assert np.allclose(np.diff(w[abs(w-bright) < 0.3]), 0.01)
+
+def test_window():
+    energies, residuals = excitons()
+    w = adaptive_grid(energies.real, residuals)
+    assert np.isclose(w[0], 0) and np.isclose(w[-1], 19.95) #the 0-20 eV of the fixed grid
+    w = adaptive_grid(energies.real, residuals, margin=20) #only around the excitons
+    assert w[0] >= energies.real.min()-3-0.01 and w[-1] <= energies.real.max()+3+0.01 #within a fine step
+    w = adaptive_grid(energies.real, residuals, emin=1, emax=5)
+    assert np.isclose(w[0], 1) and w[-1] < 5
+
+def test_spectrum_against_fixed_grid():
+    energies, residuals = excitons()
+    w, eps = bse_spectrum(energies, residuals, 0.5, chunk=100)
+    dense = np.arange(0, 20, 0.01)
+    reference = 1+0.5*lorentzian_sum(dense, energies, residuals, chunk=10**4)
+    assert np.allclose(eps, reference[np.rint(w/0.01).astype(int)])
+    inside = (dense >= w[0]) & (dense <= w[-1])
+    error = abs(np.interp(dense[inside], w, eps.imag)-reference.imag[inside]).max()
+    assert error < 1e-2*abs(reference.imag).max()
+
+def test_fit_cofactor():
+    energies, residuals = excitons(200)
+    w = np.arange(4, 4.05, 0.01)
+    eps = (1+2.5*lorentzian_sum(w, energies, residuals)).astype(np.complex64)
+    c, error = fit_cofactor(w, eps, energies, residuals)
+    assert abs(c-2.5) < 1e-5 and error < 1e-5
+    c, error = fit_cofactor(w, np.conj(eps), energies, residuals)
+    assert error > 1e-3
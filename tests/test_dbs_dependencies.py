@@ -0,0 +1,55 @@
+from aiida_yambo.utils.dbs_dependencies import changed_variables, invalidated_dbs, reusable_dbs, copy_dbs_script
+
+GW = {'arguments': ['dipoles', 'ppa', 'HF_and_locXC', 'gw0'],
+      'variables': {'Chimod': 'hartree', 'DysSolver': 'n', 'GTermKind': 'BG',
+                    'BndsRnXp': [[1, 200], ''], 'GbndRnge': [[1, 200], ''], 'NGsBlkXp': [4, 'Ry'],
+                    'FFTGvecs': [30, 'Ry'], 'QPkrange': [[[1, 1, 8, 9]], ''], 'X_and_IO_CPU': ['', '']}}
+
+def updated(parameters, **variables):
+    new = {'arguments': list(parameters['arguments']), 'variables': dict(parameters['variables'])}
+    new['variables'].update(variables)
+    return new
+
+def test_self_energy_bands_keep_screening():
+    new = updated(GW, GbndRnge=[[1, 400], ''], QPkrange=[[[1, 4, 8, 9]], ''])
+    assert changed_variables(GW, new) == ['GbndRnge', 'QPkrange']
+    assert invalidated_dbs(GW, new) == ['ndb.HF_and_locXC']
+    assert reusable_dbs(GW, new) == ['ndb.dipoles', 'ndb.pp']
+
+def test_screening_variables():
+    assert reusable_dbs(GW, updated(GW, NGsBlkXp=[6, 'Ry'])) == ['ndb.HF_and_locXC', 'ndb.dipoles']
+    assert reusable_dbs(GW, updated(GW, BndsRnXp=[[1, 400], ''])) == ['ndb.HF_and_locXC']
+
+def test_units_are_compared():
+    same = updated(GW, NGsBlkXp=[4000, 'mRy'], FFTGvecs=[15, 'Ha'])
+    assert changed_variables(GW, same) == []
+    assert reusable_dbs(GW, same) == ['ndb.HF_and_locXC', 'ndb.dipoles', 'ndb.pp']
+    other = updated(GW, NGsBlkXp=[4, 'mHa'])
+    assert changed_variables(GW, other) == ['NGsBlkXp']
+    assert reusable_dbs(GW, other) == ['ndb.HF_and_locXC', 'ndb.dipoles']
+    assert changed_variables(GW, updated(GW, NGsBlkXp=[4, 'RL'])) == ['NGsBlkXp']
+
+def test_parallelism_is_ignored():
+    new = updated(GW, X_and_IO_CPU=['1 1 1 2 4', ''], SE_ROLEs=['q qp b', ''])
+    assert changed_variables(GW, new) == []
+    assert reusable_dbs(GW, new) == ['ndb.HF_and_locXC', 'ndb.dipoles', 'ndb.pp']
+
+def test_conservative_cases():
+    everything = ['ndb.HF_and_locXC', 'ndb.dipoles', 'ndb.em1d', 'ndb.em1s', 'ndb.pp']
+    assert invalidated_dbs(GW, updated(GW, FFTGvecs=[40, 'Ry'])) == everything
+    assert invalidated_dbs(GW, updated(GW, SomeNewVariable=[1, ''])) == everything
+    rim = updated(GW)
+    rim['arguments'].append('rim_cut')
+    assert reusable_dbs(GW, rim) == []
+
+def test_only_the_needed_dbs():
+    bse = {'arguments': ['em1s', 'bse', 'bss', 'optics', 'dipoles'], 'variables': dict(GW['variables'])}
+    assert reusable_dbs(GW, bse) == ['ndb.dipoles']
+    hf = {'arguments': ['HF_and_locXC'], 'variables': dict(GW['variables'])}
+    assert reusable_dbs(hf, GW) == ['ndb.HF_and_locXC']
+
+def test_copy_dbs_script():
+    script = copy_dbs_script('/scratch/run 1/aiida.out/', ['ndb.pp', 'ndb.dipoles'])
+    assert "'/scratch/run 1/aiida.out'/ndb.pp '/scratch/run 1/aiida.out'/ndb.pp_fragment_*" in script
+    assert 'ndb.HF_and_locXC' not in script and 'ndb.QP' not in script
+    assert script.splitlines()[1] == 'mkdir -p aiida.out'
@@ -0,0 +1,41 @@
+import numpy as np
+
+from aiida_yambo.utils.k_path_utils import mesh_from_density, density_interval, density_from_kmesh
+
+def aiida_mesh(norms, pbc, distance, force_parity=False):
+    #as KpointsData.set_kpoints_mesh_from_density
+    mesh = [max(int(np.ceil(round(b/distance, 5))), 1) if p else 1 for p, b in zip(pbc, norms)]
+    if force_parity:
+        mesh = [k + (k % 2) if p else 1 for p, k in zip(pbc, mesh)]
+    return mesh
+
+def scan(mesh, norms, pbc):
+    #the search over densities i*0.25 used before
+    for i in range(4, 400):
+        if aiida_mesh(norms, pbc, 1/(i*0.25)) == mesh or aiida_mesh(norms, pbc, 1/(i*0.25), True) == mesh:
+            return i*0.25
+
+def test_mesh_from_density():
+    norms, pbc = [1.3, 0.7, 2.1], [True, True, False]
+    for density in [1, 2.25, 7.5, 13]:
+        for parity in (False, True):
+            assert mesh_from_density(norms, pbc, density, parity).tolist() == aiida_mesh(norms, pbc, 1/density, parity)
+
+def test_inversion_matches_scan():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        norms = rng.uniform(0.3, 3, 3)
+        pbc = [True, True, bool(rng.integers(2))]
+        for density in rng.uniform(1, 20, 4):
+            mesh = aiida_mesh(norms, pbc, 1/density, bool(rng.integers(2)))
+            assert density_from_kmesh(mesh, norms, pbc) == scan(mesh, norms, pbc)
+    assert density_from_kmesh([3, 3, 3], [1, 1, 1], [True]*3) == 2.25
+    assert density_interval([3, 3, 3], [1, 1, 1], [True]*3, force_parity=True) is None
+    assert density_from_kmesh([1000, 1, 1], [1, 1, 1], [True]*3) is None
+
+def test_distance_from_mesh_of_a_cell():
+    from aiida_yambo.workflows.utils.harvest import distance_from_mesh
+    cell = [[4.0, 0, 0], [0, 5.0, 0], [0, 0, 20.0]]
+    norms, pbc = [2*np.pi/4, 2*np.pi/5, 2*np.pi/20], [True, True, False]
+    mesh = mesh_from_density(norms, pbc, 3.5)
+    assert distance_from_mesh(mesh, cell, pbc) == density_from_kmesh(mesh, norms, pbc)
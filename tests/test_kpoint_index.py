@@ -0,0 +1,30 @@
+from itertools import permutations
+
+import numpy as np
+
+from aiida_yambo.utils.k_path_utils import KPointIndex, kpoint_index
+
+def brute_force(grid, point, tol=1e-4):
+    found = []
+    for ind, g in enumerate(grid):
+        for k in permutations(g):
+            test = abs(abs(np.array(k))-abs(np.array(point)))
+            if test.dot(test) < tol:
+                found.append(ind)
+                break
+    return found
+
+def test_same_matches_as_permutation_loops():
+    rng = np.random.default_rng(0)
+    grid = np.round(rng.uniform(-0.5, 0.5, (400, 3))*8)/8
+    index = KPointIndex(grid)
+    points = [grid[i][[2, 0, 1]]*[-1, 1, -1] for i in range(0, 400, 7)] + [[0.3, 0.1, 0.007], [0, 0, 0]]
+    for point in points:
+        assert index.find(point) == brute_force(grid, point)
+
+def test_periodic():
+    grid = np.array([[0.0, 0.0, 0.0], [0.25, 0.0, 0.0], [0.5, 0.5, 0.0]])
+    assert KPointIndex(grid).find([0.75, 0, 0]) == []
+    assert KPointIndex(grid, periodic=True).find([0.75, 0, 0]) == [1]
+    assert KPointIndex(grid, periodic=True).find([0, -0.5, 1.5]) == [2]
+    assert kpoint_index(grid) is kpoint_index(grid.copy())
@@ -0,0 +1,50 @@
+import io
+
+from aiida_yambo.parsers.log_engine import parse_log_stream, parse_report_stream, yambo_output_type
+
+LOG = """ <01s> P1: [01] CPU structure, Files & I/O Directories
+ <01s> P1: [02] Y/G-space Grids
+ <02s> P1: [MEMORY] Alloc WF ( 1.2 Gb) TOTAL:  1.5 Gb (traced)
+ <02s> P1: [TIMING] io_WF : 0.1s CPU
+ <05s> P1: [05] Dipoles
+ <05s> P1: [ERROR]Impossible to define an appropriate parallel structure
+ <1m-10s> P1: [06] Game Over & Game summary
+"""
+
+def empty_params():
+    return {'warnings': [], 'game_over': False, 'p2y_completed': False, 'last_time':0,
+            'memstats':[], 'para_error':False, 'memory_error':False,'timing':[],
+            'has_gpu': False, 'Fermi(eV)':0, 'errors':[], 'corrupted_fragment':False}
+
+def test_log_single_pass():
+    output_params = parse_log_stream('l-aiida_HF_and_locXC_gw0', io.StringIO(LOG), empty_params(), timing=True)
+    assert output_params['game_over']
+    assert output_params['para_error']
+    assert output_params['last_time'] == 70
+    assert len(output_params['memstats']) == 1
+    assert output_params['timing'][4] == 'verbose_output:'
+    assert len(output_params['timing']) == 6
+
+def test_step_does_not_hide_game_over():
+    log = [' <01s> P1: [01] CPU structure\n', ' <1m-10s> P1: [11] Game Over\n']
+    output_params = parse_log_stream('l-aiida', log, empty_params())
+    assert output_params['game_over']
+    assert output_params['timing'][-1].strip().endswith('[11] Game Over')
+
+def test_log_memory_on_last_line():
+    log = [' <01s> P1: [01] CPU structure\n', ' <30s> P1: Reading kb_pp_pwscf\n']
+    output_params = parse_log_stream('l-aiida', log, empty_params())
+    assert not output_params['game_over']
+    assert output_params['memory_error']
+    assert output_params['errors'] == ['memory_general']
+
+def test_report():
+    report = [' [X] Fermi Level        [ev]:  5.126\n', ' CUDA support: yes\n', ' .-ACKNOWLEDGMENT\n', ' Game Over\n']
+    output_params = parse_report_stream('r-aiida', report, empty_params())
+    assert output_params['Fermi(eV)'] == 5.126
+    assert output_params['has_gpu'] and output_params['game_over']
+
+def test_output_type():
+    assert yambo_output_type('LOG/l-aiida_CPU_1') == 'log'
+    assert yambo_output_type('r_setup') == 'report'
+    assert yambo_output_type('o-aiida.qp') is None
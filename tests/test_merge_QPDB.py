@@ -0,0 +1,28 @@
+import numpy as np
+import netCDF4
+
+from aiida_yambo.workflows.utils.merge_QPDB import merge_ndb_QP
+
+def make_db(path, states, nk=4):
+    n, table = len(states), np.array(states).T
+    with netCDF4.Dataset(path, 'w') as d:
+        for size in {n, 2, 3, nk, 6}:
+            d.createDimension('D_%010d' % size, size)
+        d.createVariable('QP_table', 'f4', ('D_%010d' % 3, 'D_%010d' % n))[:] = table
+        d.createVariable('QP_E', 'f8', ('D_%010d' % n, 'D_%010d' % 2))[:] = np.c_[table[0]+table[2]/10, np.zeros(n)]
+        d.createVariable('QP_Eo', 'f8', ('D_%010d' % n,))[:] = table[0]
+        d.createVariable('QP_kpts', 'f8', ('D_%010d' % 3, 'D_%010d' % nk))[:] = np.arange(3*nk).reshape(3, nk)
+        d.createVariable('PARS', 'f4', ('D_%010d' % 6,))[:] = [2, nk, n, 0, 0, 0]
+    return path
+
+def test_merge_split_dbs(tmp_path):
+    a = make_db(str(tmp_path / 'a'), [(b, b, k) for k in [1, 2] for b in [3, 4]])
+    b = make_db(str(tmp_path / 'b'), [(b, b, k) for k in [2, 3] for b in [4, 5]])
+    with open(b, 'rb') as handle:
+        out = merge_ndb_QP([a, handle.read()], str(tmp_path / 'ndb.QP_merged'))
+    with netCDF4.Dataset(out) as d:
+        table = d['QP_table'][:].astype(int)
+        assert table.shape == (3, 7)  #(4,4,2) is in both
+        assert np.allclose(d['QP_E'][:, 0], table[0]+table[2]/10)
+        assert list(d['PARS'][:3]) == [2, 3, 7]
+        assert d['QP_kpts'][:].shape == (3, 3)
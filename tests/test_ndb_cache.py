@@ -0,0 +1,81 @@
+import io
+
+import netCDF4
+import numpy as np
+import pytest
+
+from aiida_yambo.utils.ndb_cache import LRUCache, ndb_arrays, qp_dataset, qp_variables, node_key
+
+class Repository():
+    def __init__(self, files):
+        self.files, self.opened = files, 0
+    def open(self, name, mode='rb'):
+        self.opened += 1
+        return io.BytesIO(self.files[name])
+
+class ArrayNode():
+    def __init__(self, uuid, arrays, is_stored=True):
+        self.uuid, self.arrays, self.reads, self.is_stored = uuid, arrays, 0, is_stored
+    def get_arraynames(self):
+        return list(self.arrays)
+    def get_array(self, name):
+        self.reads += 1
+        return self.arrays[name]
+
+class FileNode():
+    def __init__(self, uuid, filename, data):
+        self.uuid, self.filename, self.is_stored = uuid, filename, True
+        self.base = type('Base', (), {'repository': Repository({filename: data})})()
+
+def write_ndb(path, values):
+    with netCDF4.Dataset(path, 'w') as nc:
+        nc.createDimension('D_0000000003', 3)
+        nc.createVariable('QP_Eo', 'f8', ('D_0000000003',))[:] = values
+
+def test_lru_is_bounded_in_bytes():
+    cache = LRUCache(max_bytes=2*8*100)
+    for key in ['a', 'b', 'a', 'c']:
+        cache.get(key, lambda: np.zeros(100))
+    assert list(cache.entries) == ['a', 'c'] and cache.bytes == 1600
+    assert (cache.hits, cache.misses) == (1, 3)
+    big = cache.get('big', lambda: np.zeros(1000))
+    assert len(big) == 1000 and 'big' not in cache.entries
+
+def test_arrays_read_once_per_node():
+    cache = LRUCache()
+    node = ArrayNode('uuid-1', {'qp_table': np.arange(6).reshape(2, 3), 'Eo': np.ones(3)})
+    for _ in range(5):
+        arrays = ndb_arrays(node, cache=cache)
+    assert node.reads == 2 and np.all(arrays['Eo'] == 1)
+    unstored = ArrayNode('uuid-2', {'Eo': np.zeros(3)}, is_stored=False) #can still change: never cached
+    for _ in range(2):
+        assert np.all(ndb_arrays(unstored, cache=cache)['Eo'] == 0)
+    assert unstored.reads == 2 and node_key(unstored) is None and len(cache.entries) == 1
+
+def test_qp_variables_decoded_once_per_node(tmp_path):
+    path = str(tmp_path/'ndb.QP')
+    write_ndb(path, [0.1, 0.2, 0.3])
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    cache = LRUCache()
+    node = FileNode('uuid-3', 'ndb.QP', data)
+    for _ in range(3):
+        qp = qp_variables(node, cache=cache)
+    assert np.allclose(qp['QP_Eo'], [0.1, 0.2, 0.3])
+    assert node.base.repository.opened == 1 and (cache.hits, cache.misses) == (2, 1)
+    assert node_key(node) == ('uuid-3', 'ndb.QP')
+    #paths and bytes are keyed by content
+    assert qp_variables(path, cache=cache) is qp_variables(data, cache=cache)
+    write_ndb(path, [1., 2., 3.])
+    assert np.allclose(qp_variables(path, cache=cache)['QP_Eo'], [1, 2, 3])
+
+def test_qp_dataset_from_bytes(tmp_path):
+    pytest.importorskip('xarray')
+    path = str(tmp_path/'ndb.QP')
+    write_ndb(path, [0.1, 0.2, 0.3])
+    cache = LRUCache()
+    first = qp_dataset(path, cache=cache)
+    first.QP_Eo[0] = 10
+    with open(path, 'rb') as handle:
+        second = qp_dataset(handle.read(), cache=cache)
+    assert float(second.QP_Eo[0]) == 0.1 and cache.misses == 1 and cache.hits == 1
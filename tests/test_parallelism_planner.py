@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+from aiida_yambo.utils.parallelism_planner import ParallelismPlanner, load_samples, memstats_peak, sample_from_run
+from aiida_yambo.utils.units import gvectors
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'parallelism_samples.json')
+
+def test_sample_from_run():
+    memstats = [' <01s> P1: [MEMORY] Alloc WF%c(  63.25 [Mb]) TOTAL:  126.9 [Mb] (traced)',
+                ' <05s> P1: [MEMORY]     Alloc X_mat( 1.1 [Gb]) TOTAL:  1.350 [Gb] (traced)']
+    assert memstats_peak(memstats) == 1.35
+    sample = sample_from_run({'BndsRnXp': [[1, 200], ''], 'NGsBlkXp': [8, 'Ry'], 'SE_CPU': '1 2 4', 'SE_ROLEs': 'q qp b'},
+                             {'num_machines': 2, 'num_mpiprocs_per_machine': 4}, 120.0, memstats, kpoints=14, volume=100.0)
+    assert (sample['bands'], round(sample['G']), sample['mpi'], sample['SE_CPU']) == (200, 258, 8, '1 2 4')
+
+def test_gvectors_do_not_depend_on_the_unit():
+    assert abs(gvectors([8, 'Ry'], 100.0) - gvectors([4000, 'mHa'], 100.0)) < 1e-9
+    assert gvectors([8, 'Ry'], 800.0) == 8*gvectors([8, 'Ry'], 100.0)
+    assert gvectors([91, 'RL']) == 91 and gvectors([8, 'Ry']) is None
+    variables = {'BndsRnXp': [[1, 200], ''], 'NGsBlkXp': [8, 'Ry']}
+    mha = dict(variables, NGsBlkXp=[4000, 'mHa'])
+    assert sample_from_run(variables, {}, 1.0, volume=100.0)['G'] == sample_from_run(mha, {}, 1.0, volume=100.0)['G']
+
+def test_plan_from_fixture_respects_memory():
+    planner = ParallelismPlanner(load_samples(FIXTURE))
+    G = gvectors([8, 'Ry'], 100.0) #the fixture samples are for a cell of 100 angstrom^3
+    free, t_free, m_free = planner.plan(32, 400, G, 14, 8, qp=4)
+    limited, t_limited, m_limited = planner.plan(32, 400, G, 14, 8, qp=4, memory_limit=1.0)
+    for p in [free, limited]:
+        for runlevel in ['X_and_IO', 'DIP', 'SE']:
+            cpu = [int(c) for c in p[runlevel+'_CPU'].split()]
+            assert len(cpu) == len(p[runlevel+'_ROLEs'].split())
+            assert np.prod(cpu) == 32
+    assert m_limited <= 1.0 < m_free
+    assert t_free <= t_limited
+
+def test_prior_prefers_the_efficient_roles():
+    #without samples the decompositions of the same tasks differ only by the role efficiency
+    planner = ParallelismPlanner([])
+    parallelism, time, memory = planner.plan(16, 400, gvectors([8, 'Ry'], 100.0), 14, 8, qp=4)
+    q, k, g, c, v = [int(n) for n in parallelism['X_and_IO_CPU'].split()]
+    assert (k, g, c*v) == (8, 1, 2)
+    assert [int(n) for n in parallelism['SE_CPU'].split()][:2] == [1, 4]
+    assert memory is None
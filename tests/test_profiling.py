@@ -0,0 +1,78 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from aiida_yambo.parsers.log_engine import parse_log_stream
+from aiida_yambo.parsers.profiling import compact_profile
+from aiida_yambo.workflows.utils.harvest import profiles_frame, profile_seconds
+from aiida_yambo.utils.resource_estimator import memory_factor, memory_factor_from_summary
+
+LOG = """ <01s> P1-r1n1: [01] CPU structure, Files & I/O Directories
+ <03s> P1-r1n1: [MEMORY] Alloc WF%c(  1.500 [Gb]) TOTAL:  2.000 [Gb] (traced)  1.900 [Gb] (memstat)
+[WARNING] Empty workload for CPU 3
+ <09s> P1-r1n1: [05] Dynamic Dielectric Matrix (PPA)
+ <10s> P1-r1n1: [MEMORY]  Free WF%c(  1.500 [Gb]) TOTAL:  0.500 [Gb] (traced)
+ <12s> P1-r1n1: [MEMORY] Alloc X_par%blc_d(  200.0 [Mb]) TOTAL:  0.700 [Gb] (traced)
+ <30s> P1-r1n1: [TIMING]            io_X :      0.5000s CPU (   12 calls,   0.041 msec avg)
+ <1m-05s> P1-r1n1: [06] Game Over & Game summary
+"""
+
+def empty_params():
+    return {'warnings': [], 'game_over': False, 'last_time':0, 'memstats':[], 'progress':[],
+            'memory_error':False, 'timing':[], 'has_gpu': False, 'errors':[]}
+
+def test_profile_arrays_and_summary():
+    output_params = parse_log_stream('l-aiida', io.StringIO(LOG), empty_params(), timing=True)
+    memstats = list(output_params['memstats'])
+    arrays = compact_profile(output_params)
+
+    assert {'timing', 'memstats', 'warnings'} <= set(output_params)
+    assert list(arrays['step_name']) == ['[01] CPU structure, Files & I/O Directories',
+                                         '[05] Dynamic Dielectric Matrix (PPA)', '[06] Game Over & Game summary']
+    assert np.allclose(arrays['step_start'], [1, 9, 65])
+    assert np.allclose(arrays['step_wall'], [8, 56, 0])
+    assert list(arrays['section_name']) == ['io_X'] and arrays['section_cpu'][0] == 0.5 and arrays['section_calls'][0] == 12
+    assert list(arrays['memory_object']) == ['WF%c', 'WF%c', 'X_par%blc_d']
+    assert np.allclose(arrays['memory_size'], [1.5, -1.5, 0.2])
+    assert np.allclose(arrays['memory_total'], [2.0, 0.5, 0.7])
+    assert len(arrays['warnings']) == 1
+
+    assert output_params['n_steps'] == 3 and output_params['n_warnings'] == 1
+    assert output_params['last_step'] == '[06] Game Over & Game summary'
+    assert output_params['memory_peak'] == 2.0 and output_params['memory_last_alloc'] == 0.2
+    assert memory_factor_from_summary(output_params['memory_peak'], output_params['memory_last_alloc']) == memory_factor(memstats)
+
+def test_empty_profile():
+    output_params = empty_params()
+    arrays = compact_profile(output_params)
+    assert all(len(a) == 0 for a in arrays.values())
+    assert output_params['memory_peak'] is None and output_params['last_step'] == ''
+
+def test_deprecated_lines_dropped():
+    output_params = parse_log_stream('l-aiida', io.StringIO(LOG), empty_params(), timing=True)
+    compact_profile(output_params, drop_lines=True)
+    assert not {'timing', 'memstats', 'warnings'} & set(output_params)
+    assert output_params['n_steps'] == 3
+
+class FakeProfile:
+    def __init__(self, arrays):
+        self.arrays = arrays
+    def get_array(self, name):
+        return self.arrays[name]
+
+def test_harvest_profiles_frame_and_seconds():
+    output_params = parse_log_stream('l-aiida', io.StringIO(LOG), empty_params(), timing=True)
+    profile = FakeProfile(compact_profile(output_params))
+    steps = profiles_frame([(11, profile), (12, profile)], prefix='step')
+    assert list(steps.columns) == ['calc_pk', 'step_name', 'step_start', 'step_wall']
+    assert list(steps.calc_pk) == [11]*3+[12]*3
+    assert np.allclose(steps.step_wall, [8, 56, 0]*2)
+
+    memory = profiles_frame([(11, profile)], prefix='memory')
+    assert list(memory.memory_object) == ['WF%c', 'WF%c', 'X_par%blc_d']
+    assert len(profiles_frame([], prefix='section')) == 0
+
+    # 13 was parsed before the profiling output: its last_time is used
+    calcs = pd.DataFrame({'calc': [11, 12, 13], 'last_time': [None, None, 40.]})
+    assert list(profile_seconds(calcs, steps)) == [65, 65, 40]
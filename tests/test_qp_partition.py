@@ -0,0 +1,47 @@
+import numpy as np
+
+from aiida_yambo.workflows.utils.qp_partition import expand_states, lpt_partition, makespan, \
+                                                     band_features, LinearCostModel, QP_subset_cost, QP_waves
+
+def test_lpt_is_deterministic_and_balanced():
+    states = expand_states([[1, 4, 1, 10]])
+    cost = lambda s: 1 + s[2]**2/10 + 1/s[0]
+    subsets = lpt_partition(states, cost, 4)
+    assert subsets == lpt_partition(states, cost, 4)
+    assert sorted(map(tuple, sum(subsets, []))) == sorted(map(tuple, states))
+    total = sum(cost(s) for s in states)
+    assert makespan(subsets, cost) <= total/4 + max(cost(s) for s in states)
+    #equal-count contiguous chunks are worse for this cost
+    chunks = [states[i:i+10] for i in range(0, 40, 10)]
+    assert makespan(subsets, cost) < makespan(chunks, cost)
+
+def test_cost_model_from_timings():
+    bands = np.linspace(-10, 10, 3*8).reshape(3, 8)
+    features = band_features(bands, k_weights=[1, 0.5, 0.25], fermi=0)
+    true = np.array([2.0, 0.5, 0.0, 1.0])
+    runs = []
+    for ranges in [[[1, 1, 1, 8]], [[2, 2, 3, 5]], [[3, 3, 1, 4]], [[1, 3, 6, 8]], [[2, 3, 1, 2]]]:
+        states = expand_states(ranges)
+        runs.append((states, sum(np.dot(true, features(s)) for s in states)))
+    model = LinearCostModel(features).fit(runs)
+    assert np.allclose(model([2, 2, 4, 4]), np.dot(true, features([2, 2, 4, 4])))
+    assert LinearCostModel()([1, 1, 1, 1]) == 1.0
+
+def test_QP_subset_cost():
+    subset = [[1, 2, 3, 4], [5, 5, 1, 1]]
+    assert QP_subset_cost(subset) == 5
+    k_weights = [1, 0.5, 0.25, 0.25, 0.125]
+    assert QP_subset_cost(subset, lambda s: k_weights[s[0]-1]) == 2*1 + 2*0.5 + 0.125
+    assert QP_subset_cost([]) == 0
+
+def test_QP_waves_order():
+    subsets = [[[1, 1, 1, 1]], [[1, 2, 1, 4]], [[3, 3, 1, 2]], [[4, 4, 1, 2]], [[1, 1, 1, 3]]]
+    waves = QP_waves(subsets, 2)
+    #most expensive first, ties in the given order, every subset submitted once
+    assert waves == [[subsets[1], subsets[4]], [subsets[2], subsets[3]], [subsets[0]]]
+    costs = [[QP_subset_cost(s) for s in wave] for wave in waves]
+    assert sum(costs, []) == sorted(sum(costs, []), reverse=True)
+    #the cost model changes the order
+    cost = lambda s: 10 if s[0] == 4 else 1
+    assert QP_waves(subsets, 2, cost)[0] == [subsets[3], subsets[1]]
+    assert QP_waves([], 4) == []
@@ -0,0 +1,41 @@
+import numpy as np
+
+from aiida_yambo.workflows.utils.qp_states import full_qp_table, match_states
+
+def loop_update(dft, E_dft, gw, E_gw):
+    #the per-state update of extend_QPDB before the joins
+    for i in range(len(gw[0, :])):
+        b, k = int(gw[0, i]), int(gw[2, i])
+        _b24 = np.where(np.isin(dft[0], [b]) & np.isin(dft[2], [k]))
+        b24 = np.where(np.isin(gw[0], [b]) & np.isin(gw[2], [k]))
+        E_dft[_b24] = E_gw[b24]
+    return E_dft
+
+def join_update(dft, E_dft, gw, E_gw):
+    index, found = match_states(gw, dft)
+    E_dft[index[found]] = E_gw[found]
+    return E_dft
+
+def test_join_as_the_loop():
+    rng = np.random.default_rng(0)
+    dft = full_qp_table(list(range(1, 21)), 7)
+    gw = dft[:, rng.choice(dft.shape[1], 30, replace=False)]
+    E_dft, E_gw = rng.random((dft.shape[1], 2)), rng.random((gw.shape[1], 2))
+    assert np.allclose(join_update(dft, E_dft.copy(), gw, E_gw), loop_update(dft, E_dft.copy(), gw, E_gw))
+    index, found = match_states(gw[:, :1], np.zeros((3, 0)))
+    assert not found.any()
+
+def test_spin_polarized_join_as_the_loop():
+    #each (band, k-point) twice, one per spin channel, as in spin-polarized ndb.QP
+    rng = np.random.default_rng(1)
+    table = full_qp_table(list(range(1, 11)), 4)
+    dft = np.vstack([np.repeat(table, 2, axis=1), np.tile([1, 2], table.shape[1])])
+    states = np.sort(rng.choice(table.shape[1], 12, replace=False))
+    gw = dft[:, np.ravel([[2*s, 2*s+1] for s in states])]
+    E_dft, E_gw = rng.random((dft.shape[1], 2)), rng.random((gw.shape[1], 2))
+    expected = loop_update(dft, E_dft.copy(), gw, E_gw)
+    assert np.allclose(join_update(dft, E_dft.copy(), gw, E_gw), expected)
+    assert np.allclose(join_update(dft[:3], E_dft.copy(), gw[:3], E_gw), expected)
+    #with the spin row, the order of the spin channels does not matter
+    flipped = gw[:, np.ravel([[2*i+1, 2*i] for i in range(len(states))])]
+    assert np.allclose(join_update(dft, E_dft.copy(), flipped, E_gw[np.ravel([[2*i+1, 2*i] for i in range(len(states))])]), expected)
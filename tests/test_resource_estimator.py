@@ -0,0 +1,41 @@
+import io
+
+from aiida_yambo.parsers.log_engine import parse_log_stream
+from aiida_yambo.utils.resource_estimator import memory_factor, memory_resources, required_walltime
+
+MEMORY_LOG = """ <01s> P1-r1n1: [01] CPU structure, Files & I/O Directories
+ <03s> P1-r1n1: [MEMORY] Alloc WF%c(  1.500 [Gb]) TOTAL:  2.000 [Gb] (traced)  1.900 [Gb] (memstat)
+ <09s> P1-r1n1: [05] Dynamic Dielectric Matrix (PPA)
+ <12s> P1-r1n1: [MEMORY] Alloc X_par%blc_d(  1.000 [Gb]) TOTAL:  3.000 [Gb] (traced)  2.800 [Gb] (memstat)
+"""
+
+TIME_LOG = """ <01s> P1: [01] CPU structure, Files & I/O Directories
+ <05m-10s> P1: [05] Dynamic Dielectric Matrix (PPA)
+ <25m-10s> P1: X@q[1] |################        | [040%] 20m-00s(E) 50m-00s(X)
+"""
+
+def empty_params():
+    return {'warnings': [], 'game_over': False, 'last_time':0, 'memstats':[], 'progress':[],
+            'memory_error':False, 'timing':[], 'has_gpu': False, 'errors':[]}
+
+def test_memory_from_log():
+    output_params = parse_log_stream('l-aiida', io.StringIO(MEMORY_LOG), empty_params())
+    assert output_params['memory_error']
+    factor = memory_factor(output_params['memstats'], safety=1.0)
+    assert abs(factor - 4/3) < 1e-9
+    assert memory_factor([]) is None
+
+def test_memory_resources():
+    resources = {'num_machines': 1, 'num_mpiprocs_per_machine': 8, 'num_cores_per_mpiproc': 2}
+    new, reached = memory_resources(resources, 3.0, max_nodes=2)
+    assert new['num_machines'] == 2 and new['num_mpiprocs_per_machine'] == 4
+    assert new['num_cores_per_mpiproc'] == 4 and reached >= 3.0
+    new, reached = memory_resources(resources, 3.0, max_nodes=1, has_gpu=True)
+    assert new == resources and reached == 1
+
+def test_walltime_from_log():
+    output_params = parse_log_stream('l-aiida', io.StringIO(TIME_LOG), empty_params())
+    assert output_params['progress'][:3] == [40, 1200, 3000]
+    assert 'Dielectric' in output_params['progress'][3]
+    assert required_walltime(output_params, safety=1.0) == 1510 + 1800
+    assert required_walltime(empty_params()) is None
@@ -0,0 +1,49 @@
+import io
+import os
+
+from aiida_yambo.utils.retrieval_policy import RETRIEVAL_POLICIES, retrieval_lists
+from aiida_yambo.parsers.repository import RetrievedReader
+
+def test_default_retrieves_everything():
+    retrieve, temporary = retrieval_lists('default', ['aiida.out/ndb.QP'])
+    assert retrieve == ['r*', '*stderr*', 'l*', 'LOG/l*_CPU_1', 'o*', 'aiida.out/ndb.QP', 'SAVE/ns.db1']
+    assert temporary == []
+
+def test_convergence_parses_dbs_and_logs_only():
+    retrieve, temporary = retrieval_lists('convergence', ['aiida.out/ndb.QP'])
+    assert retrieve == ['r*', '*stderr*', 'o*']
+    assert temporary == ['l*', 'LOG/l*_CPU_1', 'aiida.out/ndb.QP', 'SAVE/ns.db1']
+
+def test_initialise_keeps_ns_db1():
+    for policy in RETRIEVAL_POLICIES:
+        retrieve, temporary = retrieval_lists(policy, initialise=True)
+        assert 'SAVE/ns.db1' in retrieve and 'SAVE/ns.db1' not in temporary
+
+def test_custom_policy():
+    policy = {'retrieve': ['r*', 'dbs'], 'temporary': ['r*', 'l*'], 'remote': ['aiida.out/ndb.HF_and_locXC']}
+    retrieve, temporary = retrieval_lists(policy, ['aiida.out/ndb.QP', 'aiida.out/ndb.HF_and_locXC'])
+    assert retrieve == ['r*', 'aiida.out/ndb.QP']
+    assert temporary == ['l*']
+
+class Repository():
+    def __init__(self, files):
+        self.files = files
+    def list_object_names(self):
+        return list(self.files)
+    def open(self, filename, mode='r'):
+        content = self.files[filename]
+        return io.BytesIO(content) if 'b' in mode else io.StringIO(content.decode())
+
+class Retrieved():
+    def __init__(self, files):
+        self.base = type('Base', (), {'repository': Repository(files)})()
+
+def test_reader_sees_temporary_files(tmp_path):
+    (tmp_path/'ndb.QP').write_bytes(b'qp')
+    (tmp_path/'r-aiida').write_bytes(b'temporary copy')
+    with RetrievedReader(Retrieved({'r-aiida': b'report'}), str(tmp_path)) as reader:
+        assert reader.names == ['r-aiida', 'ndb.QP']
+        with reader.open('r-aiida') as handle:
+            assert handle.read() == 'report'
+        with open(reader.path('ndb.QP'), 'rb') as handle:
+            assert handle.read() == b'qp'
@@ -0,0 +1,29 @@
+import io
+import os
+import subprocess
+
+from aiida_yambo.utils.save_store import save_store_key, save_store_script
+
+def make_save(folder):
+    os.makedirs(os.path.join(folder, 'SAVE'))
+    for name, content in [('ns.db1', b'lattice'), ('ns.wf', b'wavefunctions'), ('ndb.gops', b'gops')]:
+        with open(os.path.join(folder, 'SAVE', name), 'wb') as f:
+            f.write(content)
+
+def run(script, cwd):
+    subprocess.run(['bash', '-e', '-c', script], cwd=cwd, check=True)
+
+def test_save_from_store(tmp_path):
+    make_save(str(tmp_path/'parent'))
+    key = save_store_key(io.BytesIO(b'lattice'))
+    script = save_store_script(str(tmp_path/'store'), key, str(tmp_path/'parent'/'SAVE')+'/')
+    for calc in ['calc1', 'calc2']:
+        os.makedirs(str(tmp_path/calc))
+        run(script, str(tmp_path/calc))
+        save = tmp_path/calc/'SAVE'
+        assert sorted(os.listdir(str(save))) == ['ndb.gops', 'ns.db1', 'ns.wf']
+        assert os.stat(str(save/'ns.wf')).st_nlink > 1 #hard link to the store
+        assert os.stat(str(save/'ndb.gops')).st_nlink == 1 #own copy
+        (save/'ndb.gops').write_bytes(b'changed')
+    assert (tmp_path/'store'/key/'SAVE'/'ndb.gops').read_bytes() == b'gops'
+    assert sorted(os.listdir(str(tmp_path/'store'))) == [key]
@@ -0,0 +1,27 @@
+import numpy as np
+from scipy.optimize import curve_fit
+
+from aiida_yambo.workflows.utils.separable_fit import fit_separable_2D
+
+def curve_fit_MAE(x, y, z, alpha, beta):
+    #the per-pair fit of The_Predictor_2D.fit_space_2D before fit_separable_2D
+    f = lambda X, a, b, c, d: (a/X[0]**alpha + b)*(c/X[1]**beta + d)
+    popt, pcov = curve_fit(f, xdata=np.array([x, y]), ydata=z, sigma=1/(x*y),
+                           bounds=([-np.inf]*4, [np.inf]*4))
+    fit = f(np.array([x, y]), *popt)
+    return fit, np.average(abs(fit-z), weights=x*y)
+
+def test_closed_form_as_curve_fit():
+    rng = np.random.default_rng(0)
+    x, y = [g.ravel().astype(float) for g in np.meshgrid(np.arange(50, 401, 50), np.arange(2, 11, 2))]
+    z = (-40/x + 5.2)*(0.8/y**2 + 1.1) + 1e-3*rng.standard_normal(len(x))
+
+    pairs, popt, MAE = fit_separable_2D(x, y, z, alphas=[1, 2], betas=[1, 2])
+    reference = [curve_fit_MAE(x, y, z, alpha, beta) for alpha, beta in pairs]
+    #the exact pair: same fitted surface and error; all the pairs: error not worse than curve_fit
+    exact = pairs.tolist().index([1, 2])
+    a, b, c, d = popt[exact]
+    assert np.allclose((a/x + b)*(c/y**2 + d), reference[exact][0], atol=1e-4)
+    assert abs(MAE[exact] - reference[exact][1]) < 1e-5
+    assert all(m <= r[1]*(1+1e-3) + 1e-8 for m, r in zip(MAE, reference))
+    assert np.argmin(MAE) == np.argmin([r[1] for r in reference]) == exact
@@ -0,0 +1,39 @@
+import copy
+
+import aiida_yambo.workflows.utils.helpers_aiida_yambo as helpers
+from aiida_yambo.workflows.utils.helpers_aiida_yambo import speculative_inputs, stale_in_flight, take_in_flight
+
+def fake_updater(calc_dict, inputs, parameters, workflow_dict, step):
+    #as updater: consumes the first value of the space of the variable
+    inputs = dict(inputs, value=parameters[calc_dict['var']].pop(0))
+    return inputs, inputs['value'], inputs['value'] in workflow_dict.get('done', []), False
+
+def fingerprint(inputs):
+    return 'point-{}'.format(inputs['value'])
+
+def setup(monkeypatch):
+    monkeypatch.setattr(helpers, 'updater', fake_updater)
+    monkeypatch.setattr(helpers, 'fingerprint_from_inputs', fingerprint, raising=False)
+    return {'var': 'GbndRnge', 'steps': 1}, {'value': None}, {'GbndRnge': [100, 200, 300, 400]}
+
+def test_speculative_inputs_do_not_consume_the_space(monkeypatch):
+    calc_dict, inputs, space = setup(monkeypatch)
+    workflow_dict = {'in_flight': {'point-100': 11}, 'done': [200], 'dbs_parent': {'uuid': 'x'}}
+    before = copy.deepcopy(space)
+    speculative = speculative_inputs(calc_dict, inputs, space, workflow_dict, 3)
+    assert [f for f, i, v in speculative] == ['point-300']
+    everything = speculative_inputs(calc_dict, inputs, space, workflow_dict, 3, skip_in_flight=False)
+    assert [f for f, i, v in everything] == ['point-100', 'point-300']
+    assert space == before and inputs == {'value': None}
+    assert workflow_dict['dbs_parent'] == {'uuid': 'x'}
+    assert speculative_inputs(calc_dict, inputs, {'GbndRnge': []}, workflow_dict, 3) == []
+
+def test_take_and_stale_in_flight(monkeypatch):
+    setup(monkeypatch)
+    in_flight = {'point-100': 11, 'point-200': 12, 'point-300': 13}
+    assert take_in_flight(in_flight, {'value': 100}) == 11
+    assert take_in_flight(in_flight, {'value': 500}) is False
+    assert take_in_flight(in_flight, {}) is False #no fingerprint
+    assert stale_in_flight(in_flight, ['point-300', 'point-400']) == {'point-200': 12}
+    assert in_flight == {'point-300': 13}
+    assert stale_in_flight(in_flight, []) == {'point-300': 13} and in_flight == {}
@@ -0,0 +1,37 @@
+import pickle
+
+from aiida_yambo.workflows.utils.story import WorkflowStory
+
+COLUMNS = ['global_step','kpoint_mesh','BndsRnXp','gap_','uuid','parameters_studied','useful','failed']
+
+def build(n):
+    story = WorkflowStory(COLUMNS)
+    for i in range(n):
+        story.append({'global_step':i+1, 'kpoint_mesh':[4,4,1], 'BndsRnXp':100+10*i, 'gap_':1.5+0.01*i,
+                      'uuid':'uuid_{}'.format(i), 'parameters_studied':'BndsRnXp', 'useful':True, 'failed':False})
+    return story
+
+def test_append_and_types():
+    story = build(100)
+    assert len(story) == 100
+    assert story.column('gap_').dtype.kind == 'f'
+    assert story.column('kpoint_mesh')[42] == [4,4,1]
+    story.append({'global_step':101, 'gap_':False, 'uuid':'failed', 'useful':False, 'failed':True})
+    assert story.column('gap_')[-1] is False
+    assert story.column('BndsRnXp')[-1] is None
+
+def test_set_values_and_mask():
+    story = build(10)
+    story.set_values('useful', slice(None), False)
+    story.set_values('useful', 3, True)
+    story.set_values('failed', story.column('uuid') == 'uuid_3', True)
+    assert not story.mask(useful=True, failed=False).any()
+    frame = story.to_frame()
+    assert list(frame.columns) == COLUMNS
+    assert frame.loc[3, 'failed']
+
+def test_checkpoint_and_history_roundtrip():
+    story = build(5)
+    restored = pickle.loads(pickle.dumps(story))
+    assert restored.to_dict() == story.to_dict()
+    assert WorkflowStory.from_dict(story.to_dict()).to_frame().equals(story.to_frame())
@@ -0,0 +1,20 @@
+import numpy as np
+
+from aiida_yambo.workflows.utils.thresholds import first_converged_1D, first_converged_1D_grid, \
+                                                   first_converged_2D, first_converged_2D_grid
+
+X = np.arange(100, 4000, 50.)
+Y = np.arange(4, 200, 2.)
+
+def test_2D_same_point_as_meshgrid():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        popt = rng.normal(size=4)*np.array([300, 2, 30, 1.5])
+        alpha, beta = rng.choice([1, 2]), rng.choice([1, 2])
+        thr = [10**rng.uniform(-6, -3), 10**rng.uniform(-6, -3), 10**rng.uniform(-10, -6)]
+        assert first_converged_2D(popt, alpha, beta, X, Y, *thr) == first_converged_2D_grid(popt, alpha, beta, X, Y, *thr)
+
+def test_1D_same_point_as_grid():
+    for a in [-30, 0, 5, 3000]:
+        for thr in [1e-3, 1e-5, 1e-8]:
+            assert first_converged_1D([a, 1], 1, X, thr) == first_converged_1D_grid([a, 1], 1, X, thr)